@@ -3,17 +3,21 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from app.core.config import settings
-from app.core.auth import oauth2_scheme
-from app.db.queries import execute_auth_query, execute_query
+from app.core.auth import oauth2_scheme, obtener_version_permisos
+from app.db.async_queries import aexecute_prepared_query
+from app.db.queries import SENTENCIA_USUARIO_AUTH
 # --- Importar los schemas necesarios ---
 from app.schemas.auth import TokenPayload
 from app.schemas.usuario import UsuarioReadWithRoles # <<< Importar schema de usuario
 from app.schemas.rol import RolRead # <<< Importar schema de rol
 # --- Fin importación schemas ---
 from app.services.usuario_service import UsuarioService
+from app.services.permiso_service import PermisoService
+from app.core.auth_cache import usuario_activo_cache
+from app.utils.indice_permisos import ACCIONES
 
 import logging
 logger = logging.getLogger(__name__)
@@ -55,6 +59,37 @@ async def get_current_user_data(token: str = Depends(oauth2_scheme)) -> Dict[str
         logger.warning(f"Error de validación JWT: {e}")
         raise credentials_exception
 
+async def _usuario_desde_claims(payload: Dict[str, Any]) -> Optional[UsuarioReadWithRoles]:
+    """
+    Construye el usuario desde un token autocontenido (ver build_self_contained_claims)
+    si su versión de permisos sigue vigente en la BD; None para resolverlo por el
+    camino completo. Un usuario eliminado o inactivo se rechaza aquí mismo.
+    """
+    usuario_id = payload.get("uid")
+    if usuario_id is None or not payload.get("pv"):
+        return None
+    version = await obtener_version_permisos(usuario_id)
+    if version is None:
+        logger.warning(f"Usuario '{payload.get('sub')}' del token autocontenido no encontrado en BD (o eliminado).")
+        raise credentials_exception
+    if not version["es_activo"]:
+        logger.warning(f"Usuario '{payload.get('sub')}' autenticado pero inactivo.")
+        raise inactive_user_exception
+    if payload["pv"] != version["pv"]:
+        logger.debug(f"Token autocontenido de '{payload.get('sub')}' con versión de permisos desactualizada; se usa la BD.")
+        return None
+    try:
+        return UsuarioReadWithRoles(
+            usuario_id=usuario_id,
+            nombre_usuario=payload["sub"],
+            es_activo=True,
+            roles=[RolRead(es_activo=True, **rol) for rol in payload.get("roles", [])],
+            **payload["usr"]
+        )
+    except Exception as e:
+        logger.warning(f"Claims del token de '{payload.get('sub')}' no válidos, se usa la BD: {e}")
+        return None
+
 # --- get_current_active_user CORREGIDO ---
 async def get_current_active_user(
     payload: Dict[str, Any] = Depends(get_current_user_data)
@@ -63,18 +98,27 @@ async def get_current_active_user(
     Dependencia principal: Obtiene los datos completos del usuario activo desde la BD
     basado en el nombre de usuario del token, añade sus roles (como objetos RolRead)
     y devuelve una instancia del schema UsuarioReadWithRoles.
+    El resultado se guarda por token en usuario_activo_cache (compartido: no mutarlo).
     """
     username = payload.get("sub")
 
+    cache_key = usuario_activo_cache.clave_token(payload)
+    cached_user = usuario_activo_cache.obtener(cache_key)
+    if cached_user is not None:
+        return cached_user
+    # Tomada antes de leer la BD: si alguien invalida mientras tanto, no se guarda
+    cache_generation = usuario_activo_cache.generacion()
+
+    # Token autocontenido con versión vigente: basta con leer esa versión
+    claims_user = await _usuario_desde_claims(payload)
+    if claims_user is not None:
+        usuario_activo_cache.guardar(cache_key, claims_user, cache_generation, token_exp=payload.get("exp"))
+        return claims_user
+
     try:
-        # Obtener datos básicos del usuario como diccionario
-        user_query = """
-        SELECT usuario_id, nombre_usuario, correo, nombre, apellido, es_activo,
-               fecha_creacion, fecha_ultimo_acceso, correo_confirmado
-        FROM usuario
-        WHERE nombre_usuario = ? AND es_eliminado = 0
-        """
-        user_dict = execute_auth_query(user_query, (username,)) # Asume que devuelve dict o None
+        # Obtener datos básicos del usuario como diccionario (sentencia preparada por conexión)
+        user_rows = await aexecute_prepared_query(SENTENCIA_USUARIO_AUTH, (username,))
+        user_dict = user_rows[0] if user_rows else None
 
         if not user_dict:
             logger.warning(f"Usuario '{username}' del token válido no encontrado en BD (o eliminado).")
@@ -122,6 +166,7 @@ async def get_current_active_user(
             # Crear la instancia usando el diccionario de datos y la LISTA DE OBJETOS RolRead
             usuario_pydantic = UsuarioReadWithRoles(**user_dict, roles=roles_list)
             logger.debug(f"Usuario activo '{username}' (ID: {usuario_pydantic.usuario_id}) construido como objeto Pydantic.")
+            usuario_activo_cache.guardar(cache_key, usuario_pydantic, cache_generation, token_exp=payload.get("exp"))
             return usuario_pydantic # <<< Devolver el objeto Pydantic
 
         except Exception as pydantic_error:
@@ -176,4 +221,30 @@ class RoleChecker:
             raise forbidden_exception
 
         logger.debug(f"Acceso permitido para usuario '{current_user.nombre_usuario}' basado en roles.")
-        # No es necesario devolver nada explícitamente si solo se usa para autorización.
\ No newline at end of file
+        # No es necesario devolver nada explícitamente si solo se usa para autorización.
+
+
+class PermissionChecker:
+    """
+    Dependencia que verifica un permiso fino ('ver', 'editar' o 'eliminar') del
+    usuario sobre un menú, según rol_menu_permiso. Usa el índice en memoria de
+    permisos, que se contrasta con la versión compartida de permisos antes de
+    decidir (ver app/core/permisos_cache.py), así que no consulta la matriz en
+    cada request pero tampoco decide con la de otro momento.
+
+    Ejemplo: dependencies=[Depends(PermissionChecker(menu_id=12, accion="editar"))]
+    """
+    def __init__(self, menu_id: int, accion: str = "ver"):
+        if accion not in ACCIONES:
+            raise ValueError(f"Acción no válida: '{accion}'. Permitidas: {', '.join(ACCIONES)}.")
+        self.menu_id = menu_id
+        self.accion = accion
+
+    async def __call__(self,
+        current_user: UsuarioReadWithRoles = Depends(get_current_active_user)
+    ):
+        rol_ids = [role.rol_id for role in current_user.roles]
+        if not await PermisoService.usuario_puede(rol_ids, self.menu_id, self.accion):
+            logger.warning(f"Acceso denegado para usuario '{current_user.nombre_usuario}': sin permiso '{self.accion}' sobre el menú {self.menu_id}.")
+            raise forbidden_exception
+        logger.debug(f"Acceso permitido para usuario '{current_user.nombre_usuario}': permiso '{self.accion}' sobre el menú {self.menu_id}.")
@@ -1,13 +1,14 @@
 # app/api/v1/endpoints/administracion.py
 from fastapi import APIRouter, Depends, Query, HTTPException, status
+from datetime import date
 from typing import Annotated, Optional
-from app.schemas.administracion import CuentaCobrarPagarResponse, CuentaCobrarPagarBase
+from app.schemas.administracion import CuentaCobrarPagarResponse, CuentaCobrarPagarBase, ResumenCuentasCobrarPagarResponse
 from app.services import administracion_service
 from app.api.deps import get_current_active_user
 from app.schemas.usuario import UsuarioReadWithRoles
 from app.core.exceptions import ServiceError
 
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 import urllib.parse
 from pathlib import Path
 import os
@@ -78,22 +79,53 @@ async def servir_pdf(
     "/cuentas-cobrar-pagar",
     response_model=CuentaCobrarPagarResponse,
     summary="Reporte de Cuentas por Cobrar y Pagar",
-    description="Obtiene un reporte detallado de las cuentas por cobrar y pagar consolidadas de PF y FKS."
+    description="Obtiene un reporte detallado de las cuentas por cobrar y pagar consolidadas de PF y FKS. Con filtros, 'ordenar_por', 'limite' o 'cursor' devuelve sólo la página pedida junto con el total y el cursor de la siguiente."
 )
 async def obtener_cuentas_cobrar_pagar(
     current_user: Annotated[UsuarioReadWithRoles, Depends(get_current_active_user)],
     debug_limit: Optional[int] = Query(
         None,
-        description="Opcional: Limita el número de registros para debugging en Swagger. No usar en producción.",
+        description="Opcional: Limita el número de registros para debugging en Swagger. No usar en producción. Se ignora en consultas filtradas o paginadas.",
         ge=1
-    )
+    ),
+    tipo_cuenta: Optional[str] = Query(None, description="Filtra por tipo de cuenta (valor exacto)."),
+    empresa: Optional[str] = Query(None, description="Filtra por empresa (valor exacto)."),
+    moneda: Optional[str] = Query(None, description="Filtra por moneda (valor exacto)."),
+    codigo_cliente_proveedor: Optional[str] = Query(None, description="Filtra por código de cliente/proveedor."),
+    vencimiento_desde: Optional[date] = Query(None, description="Fecha de vencimiento mínima, inclusive (YYYY-MM-DD)."),
+    vencimiento_hasta: Optional[date] = Query(None, description="Fecha de vencimiento máxima, inclusive (YYYY-MM-DD)."),
+    solo_pendientes: bool = Query(False, description="Sólo cuentas con pendiente_cobrar > 0."),
+    ordenar_por: Optional[str] = Query(None, description="Campos separados por coma; '-' delante para descendente (p. ej. -pendiente_cobrar,fecha_vencimiento)."),
+    limite: Optional[int] = Query(None, description="Tamaño de página.", ge=1, le=10000),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en 'siguiente_cursor' por la página anterior.")
 ):
     log_message_suffix = f"{f' con debug_limit: {debug_limit}' if debug_limit is not None else ''}"
     logger.info(f"Endpoint Administración: GET /cuentas-cobrar-pagar de usuario: {current_user.nombre_usuario}{log_message_suffix}")
 
     try:
-        # Obtener datos completos del servicio
-        cuentas_completas = await administracion_service.get_cuentas_cobrar_pagar()
+        consulta_filtrada = any(valor is not None for valor in (
+            tipo_cuenta, empresa, moneda, codigo_cliente_proveedor,
+            vencimiento_desde, vencimiento_hasta, ordenar_por, limite, cursor
+        )) or solo_pendientes
+        if consulta_filtrada:
+            response = await administracion_service.consultar_cuentas_cobrar_pagar(
+                tipo_cuenta=tipo_cuenta,
+                empresa=empresa,
+                moneda=moneda,
+                codigo_cliente_proveedor=codigo_cliente_proveedor,
+                vencimiento_desde=vencimiento_desde,
+                vencimiento_hasta=vencimiento_hasta,
+                solo_pendientes=solo_pendientes,
+                ordenar_por=ordenar_por,
+                limite=limite,
+                cursor=cursor
+            )
+            logger.info(f"Endpoint Administración: Consulta de cuentas (filtrada/paginada) generada exitosamente.")
+            return Response(content=response.model_dump_json(), media_type="application/json")
+
+        # Obtener datos completos del snapshot en memoria
+        snapshot = await administracion_service.obtener_snapshot_cuentas()
+        cuentas_completas = snapshot.datos
 
         # Aplicar debug_limit si se proporcionó
         if debug_limit is not None and cuentas_completas:
@@ -106,27 +138,27 @@ async def obtener_cuentas_cobrar_pagar(
                     status=True,
                     message="Cuentas por cobrar y pagar obtenidas correctamente (versión limitada para debug)",
                     data=cuentas_limitadas,
+                    as_of=snapshot.as_of,
                     debug_note=f"Resultados limitados a los primeros {debug_limit} registros para debugging. Total de registros disponibles: {len(cuentas_completas)}"
                 )
 
                 logger.info(f"Endpoint Administración: Reporte de cuentas (limitado) generado exitosamente.")
-                return response
+                return Response(content=response.model_dump_json(), media_type="application/json")
             else:
                 # El límite es mayor o igual al número de items
                 debug_note = f"debug_limit ({debug_limit}) especificado, pero no se truncaron datos (total items: {len(cuentas_completas)})."
         else:
             debug_note = None
 
-        # Devolver respuesta completa
-        response = CuentaCobrarPagarResponse(
-            status=True,
+        # Devolver respuesta completa (el JSON de las cuentas ya está serializado en el snapshot)
+        contenido = administracion_service.serializar_respuesta_cuentas(
+            snapshot,
             message="Cuentas por cobrar y pagar obtenidas correctamente",
-            data=cuentas_completas,
             debug_note=debug_note
         )
 
         logger.info(f"Endpoint Administración: Reporte de cuentas (completo) generado exitosamente.")
-        return response
+        return Response(content=contenido, media_type="application/json")
 
     except ServiceError as se:
         logger.error(f"Endpoint Administración: ServiceError al obtener cuentas: {se.detail}", exc_info=True)
@@ -142,4 +174,34 @@ async def obtener_cuentas_cobrar_pagar(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Ocurrió un error interno del servidor al procesar la solicitud de cuentas por cobrar y pagar."
-        )
\ No newline at end of file
+        )
+
+@router.get(
+    "/cuentas-cobrar-pagar/resumen",
+    response_model=ResumenCuentasCobrarPagarResponse,
+    summary="Resumen de Cuentas por Cobrar y Pagar",
+    description="Antigüedad de saldos pendientes (por vencer, 0-30, 31-60, 61-90 y más de 90 días vencidos) y totales por moneda, empresa y responsable, separados por tipo de cuenta."
+)
+async def obtener_resumen_cuentas_cobrar_pagar(
+    current_user: Annotated[UsuarioReadWithRoles, Depends(get_current_active_user)]
+):
+    logger.info(f"Endpoint Administración: GET /cuentas-cobrar-pagar/resumen de usuario: {current_user.nombre_usuario}")
+
+    try:
+        resumen = await administracion_service.get_resumen_cuentas_cobrar_pagar()
+        logger.info(f"Endpoint Administración: Resumen de cuentas generado exitosamente.")
+        # exclude_unset: cada grupo sólo lleva sus dimensiones
+        return Response(content=resumen.model_dump_json(exclude_unset=True), media_type="application/json")
+
+    except ServiceError as se:
+        logger.error(f"Endpoint Administración: ServiceError al obtener resumen de cuentas: {se.detail}", exc_info=True)
+        raise HTTPException(
+            status_code=se.status_code,
+            detail=se.detail
+        )
+    except Exception as e:
+        logger.exception(f"Endpoint Administración: Error inesperado al obtener resumen de cuentas: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Ocurrió un error interno del servidor al procesar el resumen de cuentas por cobrar y pagar."
+        )
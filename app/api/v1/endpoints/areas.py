@@ -1,6 +1,6 @@
 # app/api/v1/endpoints/areas.py
 
-from fastapi import APIRouter, Depends, HTTPException, status, Body, Query # Añadir Query
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query, Request, Response # Añadir Query
 from typing import List, Dict, Any, Optional # Añadir Optional
 
 # Importa los schemas necesarios, incluyendo el de paginación
@@ -10,6 +10,7 @@ from app.core.exceptions import ServiceError
 from app.api.deps import RoleChecker # Asumiendo que RoleChecker está en deps
 import logging
 from app.schemas.area import AreaSimpleList
+from app.utils.etag import calcular_etag, respuesta_no_modificada, aplicar_etag, RECURSO_AREAS
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -52,7 +53,9 @@ async def obtener_areas_paginadas_endpoint(
     # Añade los parámetros de Query para paginación y búsqueda
     search: Optional[str] = Query(None, description="Término de búsqueda para filtrar por nombre o descripción"),
     skip: int = Query(0, ge=0, description="Número de registros a saltar (paginación)"),
-    limit: int = Query(10, ge=1, le=100, description="Número máximo de registros a devolver por página")
+    limit: int = Query(10, ge=1, le=100, description="Número máximo de registros a devolver por página"),
+    cursor: Optional[str] = Query(None, description="'siguiente_cursor' de la respuesta anterior: pagina por cursor (keyset) en lugar de por skip"),
+    incluir_total: bool = Query(True, description="Si es false no se calcula el total (más rápido en tablas grandes)")
 ):
     """
     Recupera una lista paginada de áreas.
@@ -60,11 +63,15 @@ async def obtener_areas_paginadas_endpoint(
     - **search**: Filtra áreas cuyo nombre o descripción contengan el término.
     - **skip**: Offset para la paginación.
     - **limit**: Tamaño de la página.
+    - **cursor**: Cursor devuelto en 'siguiente_cursor' (ignora skip).
+    - **incluir_total**: Calcular o no total_areas/total_paginas.
     """
     logger.info(f"Solicitud GET /areas recibida (paginada): skip={skip}, limit={limit}, search='{search}'")
     try:
         # Llama al método de paginación del servicio
-        paginated_response = await AreaService.obtener_areas_paginadas(skip=skip, limit=limit, search=search)
+        paginated_response = await AreaService.obtener_areas_paginadas(
+            skip=skip, limit=limit, search=search, cursor=cursor, incluir_total=incluir_total
+        )
         return paginated_response
     except ServiceError as se:
         logger.error(f"Error de servicio al obtener áreas paginadas: {se.detail}")
@@ -81,12 +88,17 @@ async def obtener_areas_paginadas_endpoint(
     # Podrías quitar la dependencia de Admin si cualquier usuario logueado puede ver las áreas
     dependencies=[ADMIN_ROLE_CHECK]
 )
-async def obtener_lista_simple_areas_endpoint():
+async def obtener_lista_simple_areas_endpoint(request: Request, response: Response):
     """Obtiene una lista simplificada (ID, Nombre) de todas las áreas activas."""
     logger.info("Solicitud GET /areas/list recibida.")
+    etag = await calcular_etag((RECURSO_AREAS,), "list")
+    no_modificada = respuesta_no_modificada(request, etag)
+    if no_modificada is not None:
+        return no_modificada
     try:
         # Necesitarás añadir un método al AreaService para esto
         areas_list = await AreaService.obtener_lista_simple_areas_activas()
+        aplicar_etag(response, etag)
         return areas_list
     except ServiceError as se:
         logger.error(f"Error de servicio al obtener lista simple de áreas: {se.detail}")
@@ -6,7 +6,8 @@ from fastapi.security import OAuth2PasswordRequestForm
 # Asegúrate que UserDataWithRoles espere 'roles: List[str]'
 # Ya no necesitas LoginData aquí para la entrada
 from app.schemas.auth import Token, UserDataWithRoles # Quitar LoginData si no se usa en otro lado
-from app.core.auth import authenticate_user, create_access_token
+from app.core.auth import authenticate_user, create_access_token, build_self_contained_claims, obtener_version_permisos
+from app.core.config import settings
 from app.core.logging_config import get_logger
 # --- IMPORTAR EL SERVICIO DE USUARIO ---
 from app.services.usuario_service import UsuarioService
@@ -59,7 +60,14 @@ async def login(
 
         # 3. Obtener los NOMBRES de roles del usuario usando el servicio
         try:
-            user_role_names = await usuario_service.get_user_role_names(user_id=user_id)
+            if settings.AUTH_SELF_CONTAINED_TOKENS:
+                # La versión se toma ANTES de leer los roles: un cambio posterior la invalida
+                version = await obtener_version_permisos(user_id)
+                permissions_version = version["pv"] if version else None
+                user_roles = await usuario_service.obtener_roles_de_usuario(user_id)
+                user_role_names = [rol['nombre'] for rol in user_roles]
+            else:
+                user_role_names = await usuario_service.get_user_role_names(user_id=user_id)
             logger.info(f"Nombres de roles obtenidos para usuario ID {user_id}: {user_role_names}")
         except Exception as service_error:
             logger.exception(f"Error al obtener nombres de roles para usuario ID {user_id} desde UsuarioService: {service_error}")
@@ -72,12 +80,11 @@ async def login(
         user_full_data = {**user_base_data, "roles": user_role_names}
 
         # 5. Crear el token JWT (usando form_data.username como 'sub')
-        access_token = create_access_token(
-            # --- USAR form_data.username ---
-            data={"sub": form_data.username}
-            # Si necesitas roles en el payload del token:
-            # data={"sub": form_data.username, "roles": user_role_names}
-        )
+        token_data = {"sub": form_data.username}
+        if settings.AUTH_SELF_CONTAINED_TOKENS and permissions_version is not None:
+            # Token autocontenido: usuario, roles y versión de permisos (autoriza sin BD)
+            token_data.update(build_self_contained_claims(user_base_data, user_roles, permissions_version))
+        access_token = create_access_token(data=token_data)
 
         # 6. Devolver la respuesta completa
         return {
@@ -1,12 +1,14 @@
 # app/api/v1/endpoints/costura.py
 from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 from datetime import date
-from typing import Annotated, Optional # <--- AÑADIR Optional
+from typing import Annotated, Dict, Literal, Optional, Union # <--- AÑADIR Optional
 
 # Asegúrate que ReporteEficienciaCosturaResponseSchema se importe desde el lugar correcto
-from app.schemas.costura import ReporteEficienciaCosturaResponseSchema, EficienciaCosturaItemSchema # <--- Añadir EficienciaCosturaItemSchema si es necesario para recalcular
+from app.schemas.costura import ReporteEficienciaCosturaResponseSchema, EficienciaCosturaItemSchema, ReporteEficienciaAgrupadoResponseSchema # <--- Añadir EficienciaCosturaItemSchema si es necesario para recalcular
 from app.services import costura_service
-from app.api.deps import get_current_active_user
+from app.api.deps import get_current_active_user, RoleChecker
 from app.schemas.usuario import UsuarioReadWithRoles
 from app.core.exceptions import ServiceError
 
@@ -15,11 +17,13 @@ import logging
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+ADMIN_ROLE_CHECK = Depends(RoleChecker(["Administrador"]))
+
 @router.get(
     "/reporte/eficiencia",
-    response_model=ReporteEficienciaCosturaResponseSchema,
+    response_model=Union[ReporteEficienciaCosturaResponseSchema, ReporteEficienciaAgrupadoResponseSchema],
     summary="Reporte de Eficiencia del Área de Costura",
-    description="Obtiene un reporte detallado de la eficiencia en el área de costura para un rango de fechas."
+    description="Obtiene un reporte detallado de la eficiencia en el área de costura para un rango de fechas. Con 'group_by' devuelve los totales ya agregados por grupo en lugar de las filas."
 )
 async def get_reporte_eficiencia_costura(
     current_user: Annotated[UsuarioReadWithRoles, Depends(get_current_active_user)],
@@ -30,6 +34,16 @@ async def get_reporte_eficiencia_costura(
         None,
         description="Opcional: Limita el número de registros en 'datos_reporte' para debugging en Swagger. No usar en producción. Los totales generales NO se recalcularán.",
         ge=1 # Opcional: asegurar que el límite sea al menos 1 si se proporciona
+    ),
+    formato: Literal["json", "ndjson", "json-stream"] = Query(
+        "json",
+        alias="format",
+        description="'json' (por defecto) arma la respuesta completa. 'ndjson' envía un item por línea y un registro final con los totales. 'json-stream' envía el mismo JSON en streaming, con los totales al final. "
+                    "Los formatos en streaming ocupan una conexión a la BD mientras dura la descarga, así que se admiten pocos a la vez (503 si no hay lugar)."
+    ),
+    group_by: Optional[str] = Query(
+        None,
+        description="Opcional: dimensiones separadas por coma (linea, bloque, codigo_trabajador, codigo_operacion, fecha_proceso). Devuelve minutos producidos, minutos disponibles únicos, prendas y eficiencia por grupo. Ignora 'format' y 'debug_limit'."
     )
 ):
     log_message_suffix = f"{f' con debug_limit: {debug_limit}' if debug_limit is not None else ''}"
@@ -42,6 +56,46 @@ async def get_reporte_eficiencia_costura(
             detail="La fecha de inicio no puede ser posterior a la fecha de fin."
         )
 
+    if group_by is not None:
+        # Quitar espacios y duplicados conservando el orden
+        dimensiones = list(dict.fromkeys(d.strip() for d in group_by.split(",") if d.strip()))
+        try:
+            reporte_agrupado = await costura_service.generar_reporte_eficiencia_agrupado(
+                fecha_inicio=fecha_inicio,
+                fecha_fin=fecha_fin,
+                group_by=dimensiones
+            )
+        except ServiceError as se:
+            logger.error(f"Endpoint Costura: ServiceError al generar reporte agrupado: {se.detail}", exc_info=True)
+            raise HTTPException(status_code=se.status_code, detail=se.detail)
+        logger.info(f"Endpoint Costura: Reporte de eficiencia agrupado por {dimensiones} generado exitosamente.")
+        # exclude_unset: cada grupo sólo lleva las dimensiones pedidas
+        return Response(content=reporte_agrupado.model_dump_json(exclude_unset=True), media_type="application/json")
+
+    if formato in costura_service.FORMATOS_STREAMING:
+        # El stream lee el SP a medida que el cliente descarga, así que retiene una
+        # conexión del pool durante toda la descarga (memoria plana a cambio de
+        # conexión ocupada). Por eso los streams simultáneos están limitados
+        # (COSTURA_STREAM_MAX_CONCURRENT): pasado el límite se responde 503 en
+        # lugar de agotar el pool para el resto de los endpoints.
+        try:
+            cupo = await costura_service.reservar_cupo_streaming()
+        except ServiceError as se:
+            raise HTTPException(status_code=se.status_code, detail=se.detail, headers={"Retry-After": "5"})
+        logger.info(f"Endpoint Costura: Respondiendo en streaming con formato '{formato}'.")
+        return StreamingResponse(
+            costura_service.stream_reporte_eficiencia(
+                fecha_inicio=fecha_inicio,
+                fecha_fin=fecha_fin,
+                formato=formato,
+                limite_items=debug_limit,
+                cupo=cupo
+            ),
+            media_type="application/x-ndjson" if formato == "ndjson" else "application/json",
+            # Por si el stream no llega a iniciarse (cliente desconectado antes)
+            background=BackgroundTask(cupo.liberar)
+        )
+
     try:
         # 1. Obtener el reporte completo del servicio
         reporte_completo: ReporteEficienciaCosturaResponseSchema = await costura_service.generar_reporte_eficiencia(
@@ -82,18 +136,21 @@ async def get_reporte_eficiencia_costura(
                     debug_note=f"Resultados limitados a los primeros {debug_limit} registros para debugging. Los totales generales corresponden al conjunto completo de {len(reporte_completo.datos_reporte)} registros."
                 )
                 logger.info(f"Endpoint Costura: Reporte de eficiencia (limitado) generado exitosamente.")
-                return reporte_para_devolver
+                return Response(content=reporte_para_devolver.model_dump_json(), media_type="application/json")
             else:
                 # El límite es mayor o igual al número de items, o no hay items para limitar.
                 # Se añade una nota si debug_limit fue especificado pero no resultó en truncamiento.
+                # El reporte puede estar compartido con otras solicitudes (single-flight): copiar, no mutar
                 if reporte_completo.datos_reporte:
-                     reporte_completo.debug_note = f"debug_limit ({debug_limit}) especificado, pero no se truncaron datos (total items: {len(reporte_completo.datos_reporte)})."
+                     debug_note = f"debug_limit ({debug_limit}) especificado, pero no se truncaron datos (total items: {len(reporte_completo.datos_reporte)})."
                 else:
-                     reporte_completo.debug_note = f"debug_limit ({debug_limit}) especificado, pero no hay datos en el reporte."
+                     debug_note = f"debug_limit ({debug_limit}) especificado, pero no hay datos en el reporte."
+                reporte_completo = reporte_completo.model_copy(update={"debug_note": debug_note})
 
 
         logger.info(f"Endpoint Costura: Reporte de eficiencia (completo) generado exitosamente.")
-        return reporte_completo # Devuelve el reporte completo si no se aplicó el límite
+        # Serializar una sola vez: el objeto ya fue validado al construirse en el servicio
+        return Response(content=reporte_completo.model_dump_json(), media_type="application/json")
 
     except ServiceError as se:
         logger.error(f"Endpoint Costura: ServiceError al generar reporte: {se.detail}", exc_info=True)
@@ -109,4 +166,23 @@ async def get_reporte_eficiencia_costura(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Ocurrió un error interno del servidor al procesar la solicitud del reporte de costura."
-        )
\ No newline at end of file
+        )
+
+@router.delete(
+    "/cache",
+    response_model=Dict[str, int],
+    summary="Invalidar la caché diaria del reporte de eficiencia (Admin)",
+    description="Borra las particiones en disco de los días cerrados en el rango (todas si no se indica), para que el próximo reporte los vuelva a consultar al SP. Usar tras corregir datos de días pasados. Requiere rol 'Administrador'.",
+    dependencies=[ADMIN_ROLE_CHECK]
+)
+async def invalidar_cache_eficiencia_costura(
+    desde: Optional[date] = Query(None, description="Primer día a invalidar (YYYY-MM-DD)"),
+    hasta: Optional[date] = Query(None, description="Último día a invalidar (YYYY-MM-DD)")
+):
+    if desde is not None and hasta is not None and desde > hasta:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La fecha 'desde' no puede ser posterior a 'hasta'."
+        )
+    borradas = await costura_service.invalidar_cache_eficiencia(desde, hasta)
+    return {"particiones_borradas": borradas}
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException
-from app.db.queries import execute_query, execute_procedure_params
+from app.db.async_queries import aexecute_query, aexecute_procedure_params
 from app.core.logging_config import get_logger
 
 # Crear el router y el logger
@@ -13,7 +13,7 @@ async def get_empleados():
     """
     query = "SELECT * FROM pdgaop00 where nordpr='230152'"
     try:
-        empleados = execute_query(query)
+        empleados = await aexecute_query(query)
         return {"data": empleados}
     except Exception as e:
         logger.error(f"Error al obtener empleados: {str(e)}")
@@ -34,7 +34,7 @@ async def invocar_procedimiento(nordpr: str):
     params = {"wnordpr": nordpr}
 
     try:
-        resultado = execute_procedure_params(procedure_name, params)
+        resultado = await aexecute_procedure_params(procedure_name, params)
         if not resultado:
             raise HTTPException(status_code=404, detail="No se encontraron resultados")
         return {"data": resultado}
@@ -60,7 +60,7 @@ async def buscar_empleado(codigo: str):
     params = (codigo,)
 
     try:
-        resultados = execute_query(query, params)
+        resultados = await aexecute_query(query, params)
         if not resultados:
             raise HTTPException(status_code=404, detail="No se encontraron empleados")
         return {"data": resultados}
@@ -86,7 +86,7 @@ async def buscar_empleado_por_nordpr_ccarub(nordpr: str, ccarub: str):
     params = (nordpr, ccarub)
 
     try:
-        resultados = execute_query(query, params)
+        resultados = await aexecute_query(query, params)
         if not resultados:
             raise HTTPException(status_code=404, detail="No se encontraron empleados")
         return {"data": resultados}
@@ -1,14 +1,17 @@
 # app/api/v1/endpoints/menus.py
 
 # --- Importaciones Existentes ---
-from fastapi import APIRouter, HTTPException, Depends, status, Body
-from app.db.queries import execute_procedure
+from fastapi import APIRouter, HTTPException, Depends, status, Body, Request, Response
 from app.utils.menu_helper import build_menu_tree
 from app.core.logging_config import get_logger
 from app.api.deps import get_current_active_user, RoleChecker
 from app.schemas.usuario import UsuarioReadWithRoles
 from typing import List, Dict, Any
 from app.services.menu_service import MenuService
+from app.utils.etag import (
+    calcular_etag, respuesta_no_modificada, aplicar_etag,
+    RECURSO_MENUS, RECURSO_AREAS, RECURSO_PERMISOS
+)
 from app.schemas.menu import (
     MenuResponse, MenuCreate, MenuUpdate, MenuReadSingle, MenuItem
 )
@@ -33,15 +36,24 @@ ADMIN_ROLE_CHECK = Depends(RoleChecker(["Administrador"]))
     description="Obtiene la estructura de menú permitida para el usuario actualmente autenticado, basada en sus roles y permisos."
 )
 async def get_menu(
+    request: Request,
     # --- Cambiar la anotación de tipo ---
     current_user: UsuarioReadWithRoles = Depends(get_current_active_user) # <<< USAR ESTE TIPO
     # --- Fin Cambio Anotación ---
 ):
     logger.info(f"Solicitud GET /menus/getmenu recibida para usuario ID: {current_user.usuario_id}")
     # El resto de la lógica no cambia, ya que current_user sigue teniendo usuario_id
+    rol_ids = [rol.rol_id for rol in current_user.roles]
+    etag = await calcular_etag((RECURSO_MENUS, RECURSO_AREAS, RECURSO_PERMISOS), sorted(set(rol_ids)))
+    no_modificada = respuesta_no_modificada(request, etag)
+    if no_modificada is not None:
+        return no_modificada
     try:
-        menu_response = await MenuService.get_menu_for_user(current_user.usuario_id)
-        return menu_response
+        # JSON ya serializado y cacheado por conjunto de roles (ver MenuService.get_menu_json_for_user)
+        contenido = await MenuService.get_menu_json_for_user(rol_ids)
+        respuesta = Response(content=contenido, media_type="application/json")
+        aplicar_etag(respuesta, etag)
+        return respuesta
     except ServiceError as se:
         logger.error(f"Error de servicio en GET /getmenu para usuario {current_user.usuario_id}: {se.detail}")
         raise HTTPException(status_code=se.status_code, detail=se.detail)
@@ -60,11 +72,16 @@ async def get_menu(
     description="Obtiene todos los elementos del menú (activos e inactivos) estructurados jerárquicamente. Requiere rol 'Administrador'.",
     dependencies=[ADMIN_ROLE_CHECK]
 )
-async def get_all_menus_admin_structured_endpoint():
+async def get_all_menus_admin_structured_endpoint(request: Request, response: Response):
     logger.info("Solicitud recibida en GET /menus/all-structured (Admin)")
+    etag = await calcular_etag((RECURSO_MENUS, RECURSO_AREAS), "all-structured")
+    no_modificada = respuesta_no_modificada(request, etag)
+    if no_modificada is not None:
+        return no_modificada
     try:
-        response = await MenuService.obtener_todos_menus_estructurados_admin()
-        return response
+        menus = await MenuService.obtener_todos_menus_estructurados_admin()
+        aplicar_etag(response, etag)
+        return menus
     except ServiceError as se: # Captura ServiceError directamente
          logger.error(f"Error de servicio en GET /menus/all-structured: {se.detail}")
          raise HTTPException(status_code=se.status_code, detail=se.detail)
@@ -193,13 +210,18 @@ async def reactivate_menu_endpoint(menu_id: int):
     description="Obtiene la estructura jerárquica completa (activos e inactivos) de los menús pertenecientes a un área específica. Requiere rol 'Administrador'.",
     dependencies=[ADMIN_ROLE_CHECK]
 )
-async def get_menu_tree_by_area_endpoint(area_id: int):
+async def get_menu_tree_by_area_endpoint(area_id: int, request: Request, response: Response):
     """Obtiene el árbol de menú filtrado por el ID del área proporcionado."""
     logger.info(f"Solicitud GET /menus/area/{area_id}/tree recibida.")
+    etag = await calcular_etag((RECURSO_MENUS, RECURSO_AREAS), "area", area_id)
+    no_modificada = respuesta_no_modificada(request, etag)
+    if no_modificada is not None:
+        return no_modificada
     try:
         # Llama al nuevo método del servicio
         menu_response = await MenuService.obtener_arbol_menu_por_area(area_id)
         # El servicio ya devuelve MenuResponse(menu=[]) si no hay menús
+        aplicar_etag(response, etag)
         return menu_response
     except ServiceError as se:
         logger.error(f"Error de servicio al obtener árbol de menú para área {area_id}: {se.detail}")
@@ -1,6 +1,6 @@
 # app/api/v1/endpoints/roles.py
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Body, Path
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Body, Path, Request, Response
 from typing import List, Optional, Dict, Any
 
 # Importar Schemas (Añadir PaginatedRolResponse)
@@ -8,6 +8,7 @@ from app.schemas.rol import RolCreate, RolUpdate, RolRead, PaginatedRolResponse,
 
 # Importar Servicio
 from app.services.rol_service import RolService
+from app.utils.etag import calcular_etag, respuesta_no_modificada, aplicar_etag, RECURSO_ROLES
 
 # Importar Excepciones personalizadas
 from app.core.exceptions import ServiceError, ValidationError
@@ -67,7 +68,9 @@ async def create_rol(
 async def read_roles_paginated(
     page: int = Query(1, ge=1, description="Número de página a recuperar"),
     limit: int = Query(10, ge=1, le=100, description="Número de roles por página"),
-    search: Optional[str] = Query(None, description="Término de búsqueda para filtrar por nombre o descripción (insensible a mayúsculas/minúsculas)")
+    search: Optional[str] = Query(None, description="Término de búsqueda para filtrar por nombre o descripción (insensible a mayúsculas/minúsculas)"),
+    cursor: Optional[str] = Query(None, description="'siguiente_cursor' de la respuesta anterior: pagina por cursor (keyset) en lugar de por page"),
+    incluir_total: bool = Query(True, description="Si es false no se calcula el total (más rápido en tablas grandes)")
     # current_user: Dict[str, Any] = Depends(require_admin) # Ya está en dependencies
 ):
     """
@@ -76,12 +79,16 @@ async def read_roles_paginated(
     - **page**: Número de la página solicitada (empezando en 1).
     - **limit**: Cantidad de roles a devolver por página.
     - **search**: Texto para buscar en los campos nombre y descripción.
+    - **cursor**: Cursor devuelto en 'siguiente_cursor' (ignora page).
+    - **incluir_total**: Calcular o no total_roles/total_paginas.
     """
     try:
         paginated_response = await RolService.obtener_roles_paginados(
             page=page,
             limit=limit,
-            search=search
+            search=search,
+            cursor=cursor,
+            incluir_total=incluir_total
         )
         return paginated_response
     except ValidationError as e:
@@ -100,18 +107,26 @@ async def read_roles_paginated(
     dependencies=[Depends(require_admin)] # Proteger el endpoint
 )
 async def read_all_active_roles(
+    request: Request,
+    response: Response,
     # No necesitamos db aquí si el servicio lo maneja
     # current_user: Dict[str, Any] = Depends(require_admin) # Ya está en dependencies
 ):
     """
     Endpoint para obtener todos los roles activos.
     Requiere que el usuario tenga el rol 'Administrador'.
+    Responde 304 si el cliente envía el ETag vigente (If-None-Match).
     """
     logger.info("Accediendo a endpoint /roles/all-active")
+    etag = await calcular_etag((RECURSO_ROLES,), "all-active")
+    no_modificada = respuesta_no_modificada(request, etag)
+    if no_modificada is not None:
+        return no_modificada
     try:
         # Llamar al método estático del servicio
         active_roles = await RolService.get_all_active_roles()
         logger.info(f"Se obtuvieron {len(active_roles)} roles activos del servicio.")
+        aplicar_etag(response, etag)
         # FastAPI se encarga de validar contra List[RolRead]
         return active_roles
     except ServiceError as e:
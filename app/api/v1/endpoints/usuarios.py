@@ -1,6 +1,10 @@
 # app/api/v1/endpoints/usuarios.py (ACTUALIZADO)
 
-from fastapi import APIRouter, HTTPException, Depends, status, Query
+import csv
+import io
+import json
+
+from fastapi import APIRouter, HTTPException, Depends, status, Query, Request
 from typing import List, Optional, Dict, Any
 
 # Importar Schemas
@@ -9,16 +13,18 @@ from app.schemas.usuario import (
     UsuarioUpdate,
     UsuarioRead,
     UsuarioReadWithRoles,
-    PaginatedUsuarioResponse # <--- AÑADIR IMPORTACIÓN
+    PaginatedUsuarioResponse, # <--- AÑADIR IMPORTACIÓN
+    UsuarioImportResponse
 )
 from app.schemas.rol import RolRead
-from app.schemas.usuario_rol import UsuarioRolRead
+from app.schemas.usuario_rol import UsuarioRolRead, UsuarioRolMasivoRequest, UsuarioRolMasivoResponse
 
 # Importar Servicios
 from app.services.usuario_service import UsuarioService
 
 # Importar Excepciones personalizadas
 from app.core.exceptions import ServiceError, ValidationError
+from app.core.config import settings
 
 # --- Importar Dependencias de Autorización ---
 # Asumiendo que get_current_active_user devuelve un objeto/dict con info del usuario
@@ -47,7 +53,9 @@ require_admin = RoleChecker(["Administrador"])
 async def list_usuarios(
     page: int = Query(1, ge=1, description="Número de página a mostrar"),
     limit: int = Query(10, ge=1, le=100, description="Número de usuarios por página"),
-    search: Optional[str] = Query(None, min_length=1, max_length=50, description="Término de búsqueda opcional (nombre, apellido, correo, nombre_usuario)")
+    search: Optional[str] = Query(None, min_length=1, max_length=50, description="Término de búsqueda opcional (nombre, apellido, correo, nombre_usuario)"),
+    cursor: Optional[str] = Query(None, description="'siguiente_cursor' de la respuesta anterior: pagina por cursor (keyset) en lugar de por page"),
+    incluir_total: bool = Query(True, description="Si es false no se calcula el total (más rápido en tablas grandes)")
     # current_user: Dict[str, Any] = Depends(get_current_active_user) # Ya está en dependencies
 ):
     """
@@ -55,6 +63,8 @@ async def list_usuarios(
     - **page**: Página actual.
     - **limit**: Resultados por página.
     - **search**: Busca coincidencias en campos clave del usuario.
+    - **cursor**: Cursor devuelto en 'siguiente_cursor' (ignora page).
+    - **incluir_total**: Calcular o no total_usuarios/total_paginas.
     """
     try:
         logger.debug(f"Endpoint list_usuarios llamado con page={page}, limit={limit}, search='{search}'")
@@ -62,7 +72,9 @@ async def list_usuarios(
         paginated_data = await UsuarioService.get_usuarios_paginated(
             page=page,
             limit=limit,
-            search=search
+            search=search,
+            cursor=cursor,
+            incluir_total=incluir_total
         )
         # El servicio ya devuelve un diccionario con la estructura correcta,
         # FastAPI lo validará contra PaginatedUsuarioResponse
@@ -108,6 +120,155 @@ async def crear_usuario(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error interno del servidor al crear el usuario.")
 
 
+# --- IMPORTACIÓN MASIVA DE USUARIOS ---
+def _filas_desde_csv(contenido: bytes) -> List[Dict[str, Any]]:
+    """Filas de un CSV con cabecera (separador ',' o ';'); las celdas vacías se omiten."""
+    texto = contenido.decode("utf-8-sig")
+    try:
+        dialecto = csv.Sniffer().sniff(texto[:4096], delimiters=",;")
+    except csv.Error:
+        dialecto = csv.excel
+    return [
+        {campo.strip(): valor.strip() for campo, valor in fila.items() if campo and valor is not None and valor.strip()}
+        for fila in csv.DictReader(io.StringIO(texto), dialect=dialecto)
+    ]
+
+def _filas_desde_json(contenido: bytes) -> List[Any]:
+    """Lista de usuarios o un objeto {"usuarios": [...]}."""
+    datos = json.loads(contenido)
+    if isinstance(datos, dict):
+        datos = datos.get("usuarios")
+    if not isinstance(datos, list):
+        raise ValueError("se esperaba una lista de usuarios o un objeto {\"usuarios\": [...]}")
+    return datos
+
+def _importacion_demasiado_grande() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"El contenido de la importación supera el máximo de {settings.USUARIOS_IMPORT_MAX_BYTES} bytes."
+    )
+
+async def _leer_cuerpo_limitado(request: Request) -> bytes:
+    """Cuerpo de la solicitud, cortando la lectura en cuanto supera USUARIOS_IMPORT_MAX_BYTES."""
+    partes, leidos = [], 0
+    async for parte in request.stream():
+        leidos += len(parte)
+        if leidos > settings.USUARIOS_IMPORT_MAX_BYTES:
+            raise _importacion_demasiado_grande()
+        partes.append(parte)
+    return b"".join(partes)
+
+async def _leer_filas_importacion(request: Request) -> List[Any]:
+    # Se rechaza por Content-Length antes de leer nada; sin él (chunked), el
+    # límite se aplica mientras se lee, antes de parsear las filas.
+    try:
+        longitud = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        longitud = 0
+    if longitud > settings.USUARIOS_IMPORT_MAX_BYTES:
+        raise _importacion_demasiado_grande()
+
+    tipo = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    try:
+        if tipo == "multipart/form-data":
+            formulario = await request.form()
+            archivo = formulario.get("archivo")
+            if archivo is None or not hasattr(archivo, "read"):
+                raise ValueError("falta el archivo en el campo 'archivo'")
+            contenido = await archivo.read(settings.USUARIOS_IMPORT_MAX_BYTES + 1)
+            if len(contenido) > settings.USUARIOS_IMPORT_MAX_BYTES:
+                raise _importacion_demasiado_grande()
+            if (archivo.filename or "").lower().endswith(".json"):
+                return _filas_desde_json(contenido)
+            return _filas_desde_csv(contenido)
+        contenido = await _leer_cuerpo_limitado(request)
+        if tipo in ("text/csv", "application/csv"):
+            return _filas_desde_csv(contenido)
+        if tipo in ("application/json", ""):
+            return _filas_desde_json(contenido)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Contenido de importación no válido: {e}")
+    raise HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail="Formato no soportado: use application/json, text/csv o multipart/form-data con el campo 'archivo'."
+    )
+
+@router.post(
+    "/import",
+    response_model=UsuarioImportResponse,
+    summary="Importar usuarios en bloque",
+    description="Crea muchos usuarios en una sola solicitud a partir de JSON o CSV (columnas: nombre_usuario, correo, contrasena, nombre, apellido, es_activo). "
+                "Informa el resultado de cada fila. El contenido no puede superar USUARIOS_IMPORT_MAX_BYTES (413). **Requiere rol 'admin'.**",
+    dependencies=[Depends(require_admin)]
+)
+async def importar_usuarios(request: Request):
+    """
+    Acepta:
+    - **application/json**: lista de usuarios o `{"usuarios": [...]}`.
+    - **text/csv**: CSV con cabecera, separado por ',' o ';'.
+    - **multipart/form-data**: archivo CSV o .json en el campo `archivo`.
+
+    Las filas con error (validación, duplicados en el lote o ya existentes) se
+    informan sin impedir que se creen las demás.
+    """
+    filas = await _leer_filas_importacion(request)
+    try:
+        return await UsuarioService.importar_usuarios(filas)
+    except ValidationError as e:
+        logger.warning(f"Error de validación en la importación de usuarios: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except ServiceError as e:
+        logger.error(f"Error de servicio en la importación de usuarios: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        logger.exception(f"Error inesperado en endpoint importar_usuarios: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error interno del servidor al importar usuarios.")
+
+
+@router.post(
+    "/roles/asignar",
+    response_model=UsuarioRolMasivoResponse,
+    summary="Asignar roles a muchos usuarios",
+    description="Asigna todos los roles indicados a todos los usuarios indicados en una sola transacción (crea o reactiva las asignaciones que falten). "
+                "Si algún usuario o rol no existe, no se aplica nada. **Requiere rol 'admin'.**",
+    dependencies=[Depends(require_admin)]
+)
+async def asignar_roles_masivo(solicitud: UsuarioRolMasivoRequest):
+    try:
+        return await UsuarioService.asignar_roles_masivo(solicitud.usuario_ids, solicitud.rol_ids)
+    except ValidationError as e:
+        logger.warning(f"Error de validación en la asignación masiva de roles: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except ServiceError as e:
+        logger.error(f"Error de servicio en la asignación masiva de roles: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        logger.exception(f"Error inesperado en endpoint asignar_roles_masivo: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error interno del servidor al asignar los roles.")
+
+
+@router.post(
+    "/roles/revocar",
+    response_model=UsuarioRolMasivoResponse,
+    summary="Revocar roles a muchos usuarios",
+    description="Desactiva las asignaciones de todos los roles indicados para todos los usuarios indicados en una sola transacción. "
+                "Si algún usuario o rol no existe, no se aplica nada. **Requiere rol 'admin'.**",
+    dependencies=[Depends(require_admin)]
+)
+async def revocar_roles_masivo(solicitud: UsuarioRolMasivoRequest):
+    try:
+        return await UsuarioService.revocar_roles_masivo(solicitud.usuario_ids, solicitud.rol_ids)
+    except ValidationError as e:
+        logger.warning(f"Error de validación en la revocación masiva de roles: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except ServiceError as e:
+        logger.error(f"Error de servicio en la revocación masiva de roles: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        logger.exception(f"Error inesperado en endpoint revocar_roles_masivo: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error interno del servidor al revocar los roles.")
+
+
 # --- Endpoint para Obtener un Usuario por ID (con Roles) ---
 @router.get(
     "/{usuario_id}",
@@ -1,11 +1,13 @@
+import uuid
 from datetime import datetime, timedelta
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from app.core.config import settings
-from app.core.security import verify_password
-from app.db.queries import execute_auth_query
+from app.core.security import averify_password
+from app.db.async_queries import aexecute_auth_query, aexecute_prepared_query
+from app.db.queries import SENTENCIA_VERSION_PERMISOS
 from app.schemas.auth import TokenPayload
 import logging
 
@@ -18,8 +20,12 @@ def create_access_token(data: dict) -> str:
     Crea un token JWT con los datos proporcionados
     """
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    now = datetime.utcnow()
+    expire = now + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    # iat/jti identifican el token (clave de la caché del usuario autenticado)
+    to_encode.setdefault("iat", now)
+    to_encode.setdefault("jti", uuid.uuid4().hex)
     encoded_jwt = jwt.encode(
         to_encode,
         settings.SECRET_KEY,
@@ -27,6 +33,57 @@ def create_access_token(data: dict) -> str:
     )
     return encoded_jwt
 
+def _a_iso(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+async def obtener_version_permisos(usuario_id: int) -> Optional[Dict]:
+    """
+    Versión de permisos vigente del usuario ({"pv": str, "es_activo": bool}), o
+    None si no existe o está eliminado.
+
+    Es usuario.version_permisos, que los servicios incrementan en la misma
+    transacción que cualquier cambio del perfil, estado o roles del usuario (o
+    de un rol que tenga): cualquier worker ve al instante un cambio hecho en
+    otro y, al ser monotónica, una versión vieja nunca vuelve a coincidir.
+    """
+    filas = await aexecute_prepared_query(SENTENCIA_VERSION_PERMISOS, (usuario_id,))
+    if not filas:
+        return None
+    fila = filas[0]
+    return {
+        "pv": str(fila["version_permisos"]),
+        "es_activo": bool(fila["es_activo"]),
+    }
+
+def build_self_contained_claims(user: Dict, roles: List[Dict], permissions_version: str) -> Dict:
+    """
+    Claims del token autocontenido: datos del usuario, sus roles (ids y nombres)
+    y la versión de permisos vigente al emitirlo (ver obtener_version_permisos).
+    Con ellos get_current_active_user sólo lee esa versión (una consulta
+    preparada) en lugar de usuario y roles mientras coincida.
+    """
+    return {
+        "uid": user["usuario_id"],
+        "usr": {
+            "correo": user.get("correo"),
+            "nombre": user.get("nombre"),
+            "apellido": user.get("apellido"),
+            "correo_confirmado": user.get("correo_confirmado"),
+            "fecha_creacion": _a_iso(user.get("fecha_creacion")),
+            "fecha_ultimo_acceso": _a_iso(user.get("fecha_ultimo_acceso")),
+        },
+        "roles": [
+            {
+                "rol_id": rol["rol_id"],
+                "nombre": rol["nombre"],
+                "descripcion": rol.get("descripcion"),
+                "fecha_creacion": _a_iso(rol.get("fecha_creacion")),
+            }
+            for rol in roles
+        ],
+        "pv": permissions_version,
+    }
+
 async def authenticate_user(username: str, password: str) -> Dict:
     """
     Autentica un usuario y retorna sus datos si las credenciales son correctas
@@ -34,11 +91,12 @@ async def authenticate_user(username: str, password: str) -> Dict:
     try:
         query = """
         SELECT usuario_id, nombre_usuario, correo, contrasena,
-               nombre, apellido, es_activo
+               nombre, apellido, es_activo,
+               fecha_creacion, fecha_ultimo_acceso, correo_confirmado
         FROM usuario
         WHERE nombre_usuario = ? AND es_eliminado = 0
         """
-        user = execute_auth_query(query, (username,))
+        user = await aexecute_auth_query(query, (username,))
 
         if not user:
             raise HTTPException(
@@ -46,7 +104,8 @@ async def authenticate_user(username: str, password: str) -> Dict:
                 detail="Credenciales incorrectas"
             )
 
-        if not verify_password(password, user['contrasena']):
+        # bcrypt corre en el pool de procesos: no bloquea el event loop
+        if not await averify_password(password, user['contrasena']):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Credenciales incorrectas"
@@ -64,7 +123,7 @@ async def authenticate_user(username: str, password: str) -> Dict:
         SET fecha_ultimo_acceso = GETDATE()
         WHERE usuario_id = ?
         """
-        execute_auth_query(update_query, (user['usuario_id'],))
+        await aexecute_auth_query(update_query, (user['usuario_id'],))
 
         # Eliminar la contraseña del resultado
         del user['contrasena']
@@ -106,7 +165,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Dict:
     FROM usuario
     WHERE nombre_usuario = ? AND es_eliminado = 0
     """
-    user = execute_auth_query(query, (token_data.username,))
+    user = await aexecute_auth_query(query, (token_data.username,))
 
     if not user:
         raise credentials_exception
@@ -0,0 +1,157 @@
+# app/core/auth_cache.py
+"""
+Caché en proceso del usuario autenticado (UsuarioReadWithRoles) que resuelve
+get_current_active_user, para no consultar usuario y roles en cada request.
+
+- Clave: nombre de usuario + 'iat'/'jti' del token (un token nuevo no reutiliza
+  la entrada de otro).
+- Cada entrada vence a los AUTH_USER_CACHE_TTL_SECONDS o al expirar el token,
+  lo que ocurra antes; se descartan las menos usadas por encima de
+  AUTH_USER_CACHE_MAX_SIZE.
+- Los servicios de usuario y rol invalidan las entradas al modificar usuarios
+  o sus roles (ver invalidar_usuario / invalidar_todo).
+
+La versión de permisos de los tokens autocontenidos no vive aquí sino en la
+BD (ver app.core.auth.obtener_version_permisos), para que todos los workers la
+compartan.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.schemas.usuario import UsuarioReadWithRoles
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UsuarioActivoCache:
+    """LRU con TTL de UsuarioReadWithRoles por token."""
+
+    def __init__(self, ttl_segundos: float, max_entradas: int):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[Hashable, Tuple[float, UsuarioReadWithRoles]]" = OrderedDict()
+        self._claves_por_usuario: Dict[int, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+        # Cambia en cada invalidación: evita guardar un usuario leído antes de invalidar
+        self._generacion = 0
+        self._hits_total = 0
+        self._misses_total = 0
+        self._invalidaciones_total = 0
+
+    @property
+    def habilitada(self) -> bool:
+        return self.ttl_segundos > 0 and self.max_entradas > 0
+
+    @staticmethod
+    def clave_token(payload: Dict[str, Any]) -> Hashable:
+        return (payload.get("sub"), payload.get("iat"), payload.get("jti"))
+
+    def generacion(self) -> int:
+        return self._generacion
+
+    def obtener(self, clave: Hashable) -> Optional[UsuarioReadWithRoles]:
+        if not self.habilitada:
+            return None
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self._misses_total += 1
+                return None
+            vence_en, usuario = entrada
+            if vence_en <= time.monotonic():
+                self._quitar(clave)
+                self._misses_total += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._hits_total += 1
+            return usuario
+
+    def guardar(
+        self,
+        clave: Hashable,
+        usuario: UsuarioReadWithRoles,
+        generacion: int,
+        token_exp: Optional[float] = None
+    ) -> None:
+        """
+        Guarda el usuario salvo que haya habido una invalidación desde
+        'generacion' (el dato leído de la BD podría estar desactualizado).
+        """
+        if not self.habilitada:
+            return
+        ahora = time.monotonic()
+        vence_en = ahora + self.ttl_segundos
+        if token_exp is not None:
+            # No sobrevivir al token: 'exp' es epoch, se traslada a reloj monotónico
+            vence_en = min(vence_en, ahora + (token_exp - time.time()))
+        with self._lock:
+            if generacion != self._generacion:
+                return
+            self._quitar(clave)
+            self._entradas[clave] = (vence_en, usuario)
+            self._claves_por_usuario.setdefault(usuario.usuario_id, set()).add(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._quitar(next(iter(self._entradas)))
+
+    def _quitar(self, clave: Hashable) -> None:
+        entrada = self._entradas.pop(clave, None)
+        if entrada is None:
+            return
+        usuario_id = entrada[1].usuario_id
+        claves = self._claves_por_usuario.get(usuario_id)
+        if claves is not None:
+            claves.discard(clave)
+            if not claves:
+                del self._claves_por_usuario[usuario_id]
+
+    def invalidar_usuario(self, usuario_id: int) -> None:
+        """Descarta las entradas de un usuario (todos sus tokens)."""
+        with self._lock:
+            self._generacion += 1
+            self._invalidaciones_total += 1
+            for clave in list(self._claves_por_usuario.get(usuario_id, ())):
+                self._quitar(clave)
+        logger.debug(f"Caché de usuario autenticado: invalidado usuario ID {usuario_id}.")
+
+    def invalidar_usuarios(self, usuario_ids: Iterable[int]) -> None:
+        """invalidar_usuario para muchos usuarios a la vez (asignaciones masivas de roles)."""
+        usuario_ids = set(usuario_ids)
+        if not usuario_ids:
+            return
+        with self._lock:
+            self._generacion += 1
+            self._invalidaciones_total += 1
+            for usuario_id in usuario_ids:
+                for clave in list(self._claves_por_usuario.get(usuario_id, ())):
+                    self._quitar(clave)
+        logger.debug(f"Caché de usuario autenticado: invalidados {len(usuario_ids)} usuarios.")
+
+    def invalidar_todo(self) -> None:
+        """Descarta todas las entradas (p. ej. al modificar un rol compartido por muchos usuarios)."""
+        with self._lock:
+            self._generacion += 1
+            self._invalidaciones_total += 1
+            self._entradas.clear()
+            self._claves_por_usuario.clear()
+        logger.debug("Caché de usuario autenticado: invalidadas todas las entradas.")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "hits_total": self._hits_total,
+                "misses_total": self._misses_total,
+                "invalidaciones_total": self._invalidaciones_total,
+            }
+
+
+usuario_activo_cache = UsuarioActivoCache(
+    ttl_segundos=settings.AUTH_USER_CACHE_TTL_SECONDS,
+    max_entradas=settings.AUTH_USER_CACHE_MAX_SIZE
+)
@@ -0,0 +1,175 @@
+# app/core/busqueda_usuarios.py
+"""
+Índice de búsqueda de usuarios (ver app/utils/indice_usuarios.py), cargado al
+arrancar y mantenido con un SnapshotCache.
+
+- El índice guarda la versión compartida de 'usuarios' (dbo.version_recurso,
+  ver app/db/versiones.py) leída ANTES que sus filas. Cada alta, modificación o
+  baja la incrementa en su misma transacción.
+- UsuarioService llama a registrar_usuario() / quitar_usuario() tras cada
+  escritura con la versión resultante: el propio proceso ve el cambio de
+  inmediato y, si esa versión sigue justo a la del índice (nadie más escribió
+  entremedio), el índice la adopta sin recargar.
+- Antes de usar el índice se compara su versión con versiones_vigentes()
+  (lectura por PK reutilizada unos segundos, app/core/versiones_cache.py). Si
+  otro worker escribió, esa búsqueda va a la BD y el índice se recarga en
+  segundo plano.
+- Además se recarga por completo cada USUARIOS_SEARCH_INDEX_TTL_SECONDS.
+- Las escrituras que llegan mientras se está recargando se aplican también al
+  índice nuevo antes de publicarlo, para que la recarga no las pise.
+"""
+import asyncio
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.core.config import settings
+from app.core.versiones_cache import leer_versiones, versiones_vigentes
+from app.db.async_queries import aexecute_query
+from app.db.queries import SELECT_USUARIOS_BUSQUEDA
+from app.utils.etag import RECURSO_USUARIOS
+from app.utils.indice_usuarios import IndiceBusquedaUsuarios
+from app.utils.snapshot_cache import SnapshotCache
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Escrituras ocurridas durante la recarga en curso (None si no hay recarga)
+_escrituras_durante_carga: Optional[List[Callable[[IndiceBusquedaUsuarios], None]]] = None
+# Recarga lanzada por una escritura de otro worker (None si no hay ninguna en curso)
+_recarga_por_version: Optional[asyncio.Task] = None
+_busquedas_en_bd_por_version = 0
+
+
+async def _cargar_indice_usuarios() -> IndiceBusquedaUsuarios:
+    global _escrituras_durante_carga
+    _escrituras_durante_carga = []
+    try:
+        # La versión se lee ANTES que los datos: un cambio que ocurra entre ambas
+        # lecturas deja la versión vieja en el índice y provoca otra recarga.
+        version = (await leer_versiones()).get(RECURSO_USUARIOS, 0)
+        filas = await aexecute_query(SELECT_USUARIOS_BUSQUEDA)
+        # Construirlo cuesta del orden de segundos con decenas de miles de usuarios: fuera del event loop
+        indice = await asyncio.get_running_loop().run_in_executor(None, IndiceBusquedaUsuarios, filas or [], version)
+        for aplicar in _escrituras_durante_carga:
+            aplicar(indice)
+    finally:
+        _escrituras_durante_carga = None
+    logger.info(f"Índice de búsqueda de usuarios construido: {indice.stats()}")
+    return indice
+
+
+_snapshot_usuarios = SnapshotCache(
+    "busqueda_usuarios",
+    _cargar_indice_usuarios,
+    ttl_segundos=settings.USUARIOS_SEARCH_INDEX_TTL_SECONDS,
+    stale_segundos=settings.USUARIOS_SEARCH_INDEX_STALE_SECONDS
+)
+
+
+def _habilitado() -> bool:
+    return settings.USUARIOS_SEARCH_INDEX_TTL_SECONDS > 0
+
+
+def _recargar_por_version() -> None:
+    global _recarga_por_version
+    if _recarga_por_version is not None and not _recarga_por_version.done():
+        return
+    # posterior=True: una recarga que ya estaba en curso pudo leer antes del cambio
+    _recarga_por_version = asyncio.ensure_future(_snapshot_usuarios.recargar(posterior=True))
+    _recarga_por_version.add_done_callback(_registrar_error_recarga)
+
+
+def _registrar_error_recarga(tarea: asyncio.Task) -> None:
+    if not tarea.cancelled() and tarea.exception() is not None:
+        logger.error(f"Error recargando el índice de búsqueda de usuarios tras un cambio en la BD: {tarea.exception()}")
+
+
+async def obtener_indice_busqueda_usuarios() -> Optional[IndiceBusquedaUsuarios]:
+    """
+    Índice vigente, o None si está deshabilitado, no se pudo cargar o otro
+    worker escribió desde que se cargó (el llamador debe entonces buscar en la BD).
+    """
+    global _busquedas_en_bd_por_version
+    if not _habilitado():
+        return None
+    try:
+        snapshot = await _snapshot_usuarios.obtener()
+        version = (await versiones_vigentes()).get(RECURSO_USUARIOS, 0)
+    except Exception as e:
+        logger.warning(f"Índice de búsqueda de usuarios no disponible, se buscará en la BD: {e}")
+        return None
+    # Las versiones sólo crecen: una lectura reutilizada más vieja que el índice no lo invalida
+    if snapshot.datos.marca < version:
+        logger.debug(f"Índice de búsqueda de usuarios desactualizado (versión {snapshot.datos.marca} < {version}), se buscará en la BD.")
+        _busquedas_en_bd_por_version += 1
+        _recargar_por_version()
+        return None
+    return snapshot.datos
+
+
+def _aplicar(aplicar: Callable[[IndiceBusquedaUsuarios], None]) -> None:
+    snapshot = _snapshot_usuarios.actual()
+    if snapshot is not None:
+        aplicar(snapshot.datos)
+    if _escrituras_durante_carga is not None:
+        _escrituras_durante_carga.append(aplicar)
+
+
+def _fila_indice(fila: Dict[str, Any]) -> Dict[str, Any]:
+    return {campo: fila.get(campo) for campo in ("usuario_id", "nombre_usuario", "correo", "nombre", "apellido")}
+
+
+def _avanzar_version(indice: IndiceBusquedaUsuarios, version: Optional[int]) -> None:
+    # Sólo si la escritura es la siguiente a la versión del índice; si no, otro
+    # worker escribió entremedio y la próxima búsqueda provocará la recarga.
+    if version is not None and indice.marca == version - 1:
+        indice.marca = version
+
+
+def registrar_usuarios(filas: Iterable[Dict[str, Any]], version: Optional[int] = None) -> None:
+    """
+    Altas o modificaciones de usuarios (filas con usuario_id, nombre_usuario,
+    correo, nombre y apellido) confirmadas en una transacción que dejó la
+    versión de 'usuarios' en 'version'.
+    """
+    filas = [_fila_indice(fila) for fila in filas]
+
+    def aplicar(indice: IndiceBusquedaUsuarios) -> None:
+        for fila in filas:
+            indice.actualizar(fila)
+        _avanzar_version(indice, version)
+
+    _aplicar(aplicar)
+
+
+def registrar_usuario(fila: Dict[str, Any], version: Optional[int] = None) -> None:
+    """Alta o modificación de un usuario (ver registrar_usuarios)."""
+    registrar_usuarios((fila,), version)
+
+
+def quitar_usuario(usuario_id: int, version: Optional[int] = None) -> None:
+    """Baja (eliminación lógica) de un usuario."""
+    def aplicar(indice: IndiceBusquedaUsuarios) -> None:
+        indice.eliminar(usuario_id)
+        _avanzar_version(indice, version)
+
+    _aplicar(aplicar)
+
+
+def iniciar_refresco_busqueda_usuarios() -> None:
+    """Carga el índice y arranca su recarga periódica (llamar desde el lifespan)."""
+    if _habilitado():
+        _snapshot_usuarios.iniciar_refresco_periodico()
+
+
+async def detener_refresco_busqueda_usuarios() -> None:
+    await _snapshot_usuarios.detener_refresco_periodico()
+
+
+def busqueda_usuarios_stats() -> Dict[str, Any]:
+    stats = _snapshot_usuarios.stats()
+    stats["busquedas_en_bd_por_version"] = _busquedas_en_bd_por_version
+    snapshot = _snapshot_usuarios.actual()
+    if snapshot is not None:
+        stats.update(snapshot.datos.stats())
+    return stats
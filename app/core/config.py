@@ -28,10 +28,63 @@ class Settings(BaseSettings):
     DB_ADMIN_DATABASE: str = os.getenv("DB_ADMIN_DATABASE", "")
     DB_ADMIN_PORT: int = int(os.getenv("DB_ADMIN_PORT", "1433"))  # Puerto por defecto SQL Server
 
+    # Pool de conexiones (aplica a cada DatabaseConnection por separado)
+    DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+    DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+    DB_POOL_MAX_IDLE_SECONDS: float = float(os.getenv("DB_POOL_MAX_IDLE_SECONDS", "300"))  # Cierra conexiones ociosas
+    DB_POOL_MAX_LIFETIME_SECONDS: float = float(os.getenv("DB_POOL_MAX_LIFETIME_SECONDS", "1800"))  # Recicla conexiones viejas
+    DB_POOL_ACQUIRE_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT_SECONDS", "15"))  # Espera máxima en la cola
+    DB_POOL_PING_AFTER_IDLE_SECONDS: float = float(os.getenv("DB_POOL_PING_AFTER_IDLE_SECONDS", "30"))  # Verifica la conexión si estuvo ociosa más de esto
+    # Hilos dedicados a ejecutar consultas desde código async (0 = suma de DB_POOL_MAX_SIZE de todos los pools)
+    DB_EXECUTOR_MAX_WORKERS: int = int(os.getenv("DB_EXECUTOR_MAX_WORKERS", "0"))
+    DB_FETCH_BATCH_SIZE: int = int(os.getenv("DB_FETCH_BATCH_SIZE", "5000"))  # Filas por fetchmany en lecturas en streaming
+    # Cursores preparados por conexión para las consultas frecuentes (ver app/db/sentencias.py)
+    DB_PREPARED_STATEMENTS_ENABLED: bool = os.getenv("DB_PREPARED_STATEMENTS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+    # Caché en disco por día de dbo.sp_costura_eficiencia_web
+    COSTURA_CACHE_ENABLED: bool = os.getenv("COSTURA_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    COSTURA_CACHE_DIR: str = os.getenv("COSTURA_CACHE_DIR", "cache/costura")
+    COSTURA_CACHE_OPEN_DAYS: int = int(os.getenv("COSTURA_CACHE_OPEN_DAYS", "1"))  # Días recientes (incluido hoy) que siempre se consultan al SP
+    COSTURA_CACHE_MAX_AGE_HOURS: float = float(os.getenv("COSTURA_CACHE_MAX_AGE_HOURS", "168"))  # Vida de una partición de día cerrado (0 = sin límite)
+    # Reportes en streaming (ndjson/json-stream) simultáneos: cada uno retiene una conexión del pool
+    # mientras el cliente descarga (0 = DB_POOL_MAX_SIZE // 4, al menos 1)
+    COSTURA_STREAM_MAX_CONCURRENT: int = int(os.getenv("COSTURA_STREAM_MAX_CONCURRENT", "0"))
+    COSTURA_STREAM_WAIT_SECONDS: float = float(os.getenv("COSTURA_STREAM_WAIT_SECONDS", "5"))  # Espera por un lugar antes de responder 503
+
+    # Snapshot en memoria de dbo.sp_administracion_obtener_cuentas_cobrar_pagar
+    CUENTAS_SNAPSHOT_TTL_SECONDS: float = float(os.getenv("CUENTAS_SNAPSHOT_TTL_SECONDS", "300"))  # 0 = sin caché (cada solicitud consulta el SP)
+    CUENTAS_SNAPSHOT_STALE_SECONDS: float = float(os.getenv("CUENTAS_SNAPSHOT_STALE_SECONDS", "900"))  # Margen tras el TTL en que se sirve el snapshot viejo mientras se recarga
+    CUENTAS_SNAPSHOT_BACKGROUND_REFRESH: bool = os.getenv("CUENTAS_SNAPSHOT_BACKGROUND_REFRESH", "true").lower() in ("1", "true", "yes")
+
     # Security
     SECRET_KEY: str = os.getenv("SECRET_KEY", "")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     ALGORITHM: str = os.getenv("ALGORITHM", "")  # Agregamos el algoritmo para JWT
+    # Caché en proceso del usuario autenticado por token (0 = deshabilitada)
+    AUTH_USER_CACHE_TTL_SECONDS: float = float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "60"))
+    AUTH_USER_CACHE_MAX_SIZE: int = int(os.getenv("AUTH_USER_CACHE_MAX_SIZE", "1024"))
+    # Procesos dedicados a bcrypt (hash/verificación de contraseñas); 0 = min(4, núcleos)
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "0"))
+    # Índice en memoria de rol_menu_permiso: recarga periódica para recoger cambios de otros workers (0 = sin caché)
+    PERMISOS_INDEX_TTL_SECONDS: float = float(os.getenv("PERMISOS_INDEX_TTL_SECONDS", "300"))
+    PERMISOS_INDEX_STALE_SECONDS: float = float(os.getenv("PERMISOS_INDEX_STALE_SECONDS", "3600"))
+    # Caché del menú de navegación (GET /menus/getmenu) por conjunto de roles (0 = deshabilitada)
+    MENU_CACHE_TTL_SECONDS: float = float(os.getenv("MENU_CACHE_TTL_SECONDS", "300"))
+    MENU_CACHE_MAX_SIZE: int = int(os.getenv("MENU_CACHE_MAX_SIZE", "256"))
+    # Segundos que se reutiliza la versión compartida de los recursos (dbo.version_recurso) antes de
+    # releerla; acota cuánto tarda un worker en ver una escritura de otro (0 = leerla en cada uso)
+    VERSIONES_RECURSOS_TTL_SECONDS: float = float(os.getenv("VERSIONES_RECURSOS_TTL_SECONDS", "2"))
+    # Segundos que se reutiliza el total (COUNT) de los listados paginados de usuarios, roles y áreas (0 = sin caché)
+    PAGINACION_COUNT_CACHE_TTL_SECONDS: float = float(os.getenv("PAGINACION_COUNT_CACHE_TTL_SECONDS", "30"))
+    # Índice en memoria para el 'search' del listado de usuarios: recarga completa periódica (0 = buscar con LIKE en la BD)
+    USUARIOS_SEARCH_INDEX_TTL_SECONDS: float = float(os.getenv("USUARIOS_SEARCH_INDEX_TTL_SECONDS", "600"))
+    USUARIOS_SEARCH_INDEX_STALE_SECONDS: float = float(os.getenv("USUARIOS_SEARCH_INDEX_STALE_SECONDS", "3600"))
+    # Máximo de filas por solicitud de importación masiva de usuarios (POST /usuarios/import)
+    USUARIOS_IMPORT_MAX_ROWS: int = int(os.getenv("USUARIOS_IMPORT_MAX_ROWS", "1000"))
+    # Tamaño máximo en bytes del cuerpo o archivo de importación; se rechaza (413) antes de parsearlo
+    USUARIOS_IMPORT_MAX_BYTES: int = int(os.getenv("USUARIOS_IMPORT_MAX_BYTES", "2097152"))
+    # Tokens autocontenidos: el login embebe usuario, roles y versión de permisos; cada request sólo verifica esa versión en la BD
+    AUTH_SELF_CONTAINED_TOKENS: bool = os.getenv("AUTH_SELF_CONTAINED_TOKENS", "false").lower() in ("1", "true", "yes")
 
     # CORS - Lista predefinida de orígenes permitidos
     ALLOWED_ORIGINS: List[str] = [
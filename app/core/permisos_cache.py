@@ -0,0 +1,109 @@
+# app/core/permisos_cache.py
+"""
+Índice en memoria de rol_menu_permiso (ver app/utils/indice_permisos.py),
+cargado al arrancar y mantenido con un SnapshotCache.
+
+- Los servicios que escriben permisos llaman a refrescar_indice_permisos()
+  tras confirmar la transacción, así que el propio proceso ve el cambio de
+  inmediato.
+- El índice guarda las versiones compartidas de 'permisos' y 'menus'
+  (dbo.version_recurso, ver app/db/versiones.py) leídas ANTES que sus filas.
+  Antes de usarlo se comparan con versiones_vigentes() (lectura por PK
+  reutilizada VERSIONES_RECURSOS_TTL_SECONDS): si otro worker escribió, la
+  solicitud espera la recarga en lugar de decidir con permisos viejos.
+- Además se recarga cada PERMISOS_INDEX_TTL_SECONDS.
+"""
+from typing import Any, Dict
+
+from app.core.config import settings
+from app.core.versiones_cache import leer_versiones, versiones_vigentes
+from app.db.async_queries import aexecute_query
+from app.db.queries import SELECT_ALL_PERMISOS
+from app.utils.etag import RECURSO_MENUS, RECURSO_PERMISOS
+from app.utils.indice_permisos import IndicePermisos
+from app.utils.snapshot_cache import SnapshotCache
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Recursos cuyas escrituras cambian el contenido del índice
+_RECURSOS = (RECURSO_PERMISOS, RECURSO_MENUS)
+
+_recargas_por_version = 0
+
+
+async def _cargar_indice_permisos() -> IndicePermisos:
+    # Las versiones se leen ANTES que los datos: un cambio que ocurra entre
+    # ambas lecturas deja una versión vieja en el índice y provoca otra recarga.
+    versiones = await leer_versiones()
+    filas = await aexecute_query(SELECT_ALL_PERMISOS)
+    indice = IndicePermisos(filas or [], {recurso: versiones.get(recurso, 0) for recurso in _RECURSOS})
+    logger.info(f"Índice de permisos construido: {indice.stats()}")
+    return indice
+
+
+_snapshot_permisos = SnapshotCache(
+    "permisos_rol_menu",
+    _cargar_indice_permisos,
+    ttl_segundos=settings.PERMISOS_INDEX_TTL_SECONDS,
+    stale_segundos=settings.PERMISOS_INDEX_STALE_SECONDS
+)
+
+
+def _desactualizado(indice: IndicePermisos, vigentes: Dict[str, int]) -> bool:
+    # Las versiones sólo crecen: una lectura reutilizada más vieja que el índice no lo invalida
+    return any(indice.versiones.get(recurso, 0) < vigentes.get(recurso, 0) for recurso in _RECURSOS)
+
+
+async def obtener_indice_permisos() -> IndicePermisos:
+    """Índice vigente (compartido: no mutar las filas que devuelve)."""
+    global _recargas_por_version
+    snapshot = await _snapshot_permisos.obtener()
+    try:
+        vigentes = await versiones_vigentes()
+    except Exception as e:
+        logger.warning(f"No se pudieron leer las versiones compartidas, se usa el índice de permisos en memoria: {e}")
+        return snapshot.datos
+    if _desactualizado(snapshot.datos, vigentes):
+        logger.info(f"Índice de permisos desactualizado ({snapshot.datos.versiones} < {vigentes}), recargando.")
+        _recargas_por_version += 1
+        # Las solicitudes concurrentes comparten la recarga; si la que estaba en
+        # curso leyó antes del cambio, se espera una posterior.
+        snapshot = await _snapshot_permisos.recargar()
+        if _desactualizado(snapshot.datos, vigentes):
+            snapshot = await _snapshot_permisos.recargar(posterior=True)
+    return snapshot.datos
+
+
+async def refrescar_indice_permisos() -> None:
+    """
+    Reconstruye el índice tras una escritura de permisos. Si la recarga falla
+    se descarta el índice para que la siguiente consulta lo vuelva a leer; la
+    escritura ya confirmada no se da por fallida.
+    """
+    try:
+        await _snapshot_permisos.recargar(posterior=True)
+    except Exception as e:
+        logger.error(f"No se pudo reconstruir el índice de permisos tras una escritura: {e}", exc_info=True)
+        _snapshot_permisos.invalidar()
+
+
+def iniciar_refresco_permisos() -> None:
+    """Carga el índice y arranca su refresco periódico (llamar desde el lifespan)."""
+    _snapshot_permisos.iniciar_refresco_periodico()
+
+
+async def detener_refresco_permisos() -> None:
+    await _snapshot_permisos.detener_refresco_periodico()
+
+
+def indice_permisos_stats() -> Dict[str, Any]:
+    stats = _snapshot_permisos.stats()
+    stats["recargas_por_version"] = _recargas_por_version
+    snapshot = _snapshot_permisos.actual()
+    if snapshot is not None:
+        stats.update(snapshot.datos.stats())
+        stats["versiones"] = dict(snapshot.datos.versiones)
+    return stats
@@ -1,9 +1,111 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
 from passlib.context import CryptContext
 
+from app.core.config import settings
+
+import logging
+
+logger = logging.getLogger(__name__)
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+# --- Pool dedicado para bcrypt (CPU intensivo: ~100-300 ms por llamada) ---
+# Corre en procesos aparte para no frenar el event loop y usar varios núcleos.
+
+_password_executor: Optional[Executor] = None
+_password_executor_lock = threading.Lock()
+
+_en_vuelo = 0
+_max_en_vuelo = 0
+_completadas_total = 0
+_espera_total_segundos = 0.0
+_ejecucion_total_segundos = 0.0
+
+def _password_workers() -> int:
+    if settings.PASSWORD_HASH_WORKERS > 0:
+        return settings.PASSWORD_HASH_WORKERS
+    return max(1, min(4, os.cpu_count() or 1))
+
+def _medir(func: Callable[..., Any], *args: Any) -> Tuple[Any, float]:
+    # Corre en el proceso hijo: devuelve también cuánto tardó el cálculo en sí
+    inicio = time.perf_counter()
+    return func(*args), time.perf_counter() - inicio
+
+def get_password_executor() -> Executor:
+    """
+    Pool de procesos de tamaño fijo (PASSWORD_HASH_WORKERS, por defecto hasta 4).
+    Se usa 'spawn' para no heredar hilos ni conexiones abiertas del proceso principal.
+    """
+    global _password_executor
+    if _password_executor is None:
+        with _password_executor_lock:
+            if _password_executor is None:
+                _password_executor = ProcessPoolExecutor(
+                    max_workers=_password_workers(),
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _password_executor
+
+def warm_up_password_executor() -> None:
+    """Arranca los procesos del pool para que el primer login no pague el arranque."""
+    executor = get_password_executor()
+    for futuro in [executor.submit(_medir, len, "") for _ in range(_password_workers())]:
+        futuro.result()
+
+def shutdown_password_executor() -> None:
+    """Detiene el pool de bcrypt (usado al apagar la aplicación)."""
+    global _password_executor
+    with _password_executor_lock:
+        executor, _password_executor = _password_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+async def _run_in_password_executor(func: Callable[..., Any], *args: Any) -> Any:
+    global _en_vuelo, _max_en_vuelo, _completadas_total, _espera_total_segundos, _ejecucion_total_segundos
+    loop = asyncio.get_running_loop()
+    inicio = time.perf_counter()
+    _en_vuelo += 1
+    _max_en_vuelo = max(_max_en_vuelo, _en_vuelo)
+    try:
+        resultado, duracion = await loop.run_in_executor(get_password_executor(), _medir, func, *args)
+    finally:
+        _en_vuelo -= 1
+    _completadas_total += 1
+    _ejecucion_total_segundos += duracion
+    _espera_total_segundos += max(0.0, time.perf_counter() - inicio - duracion)
+    return resultado
+
+async def aget_password_hash(password: str) -> str:
+    """get_password_hash en el pool de bcrypt."""
+    return await _run_in_password_executor(get_password_hash, password)
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    """verify_password en el pool de bcrypt."""
+    return await _run_in_password_executor(verify_password, plain_password, hashed_password)
+
+def password_executor_stats() -> Dict[str, Any]:
+    workers = _password_workers()
+    return {
+        "workers": workers,
+        "en_vuelo": _en_vuelo,
+        "en_cola": max(0, _en_vuelo - workers),
+        "max_en_vuelo": _max_en_vuelo,
+        "completadas_total": _completadas_total,
+        # La espera incluye la cola del pool y el envío entre procesos
+        "espera_promedio_ms": round(_espera_total_segundos / _completadas_total * 1000, 2) if _completadas_total else 0.0,
+        "ejecucion_promedio_ms": round(_ejecucion_total_segundos / _completadas_total * 1000, 2) if _completadas_total else 0.0,
+    }
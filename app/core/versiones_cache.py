@@ -0,0 +1,75 @@
+# app/core/versiones_cache.py
+"""
+Lectura de las versiones compartidas de dbo.version_recurso (ver
+app/db/versiones.py) para las cachés en memoria de cada worker: ETags,
+índice de permisos e índice de búsqueda de usuarios.
+
+- versiones_vigentes() reutiliza la última lectura VERSIONES_RECURSOS_TTL_SECONDS
+  (por defecto 2 s) y las llamadas concurrentes comparten una sola consulta
+  (una fila por recurso, por PK): es lo que se paga por request.
+- leer_versiones() consulta siempre; la usan las recargas de índices para
+  fijar la versión con la que se cargan, leída ANTES que los datos.
+- descartar_versiones() fuerza la relectura tras una escritura local.
+- Si cambian las versiones de menús, áreas o permisos respecto de la lectura
+  anterior (p. ej. por una escritura en otro worker) se invalida la caché de
+  menús por roles.
+"""
+import threading
+import time
+from typing import Any, Dict
+
+from app.core.config import settings
+from app.db.async_queries import aexecute_prepared_query
+from app.db.queries import SENTENCIA_VERSIONES_RECURSOS
+from app.utils.menu_cache import menu_por_roles_cache
+from app.utils.single_flight import get_single_flight
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Recursos de los que depende el menú cacheado por roles
+_RECURSOS_MENU = ("menus", "areas", "permisos")
+
+_lock = threading.Lock()
+_single_flight = get_single_flight("versiones_recursos")
+_versiones: Dict[str, int] = {}
+_vencen = 0.0
+_consultas_total = 0
+
+
+async def leer_versiones() -> Dict[str, int]:
+    """Versión actual de cada recurso, leída de la BD (lanza DatabaseError si falla)."""
+    global _versiones, _vencen, _consultas_total
+    filas = await aexecute_prepared_query(SENTENCIA_VERSIONES_RECURSOS)
+    versiones = {fila["recurso"]: fila["version"] for fila in filas}
+    with _lock:
+        _consultas_total += 1
+        anteriores = _versiones
+        _versiones = versiones
+        _vencen = time.monotonic() + settings.VERSIONES_RECURSOS_TTL_SECONDS
+    if anteriores and any(anteriores.get(r) != versiones.get(r) for r in _RECURSOS_MENU):
+        menu_por_roles_cache.invalidar("cambió la versión de menús/áreas/permisos")
+    return versiones
+
+
+async def versiones_vigentes() -> Dict[str, int]:
+    """Como leer_versiones, pero reutilizando la lectura reciente (no mutar el dict)."""
+    if _versiones and _vencen > time.monotonic():
+        return _versiones
+    return await _single_flight.ejecutar("versiones", leer_versiones)
+
+
+def descartar_versiones() -> None:
+    """La próxima versiones_vigentes() vuelve a consultar (tras una escritura local)."""
+    global _vencen
+    with _lock:
+        _vencen = 0.0
+
+
+def versiones_stats() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "versiones": dict(_versiones),
+            "consultas_total": _consultas_total,
+        }
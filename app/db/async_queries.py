@@ -0,0 +1,145 @@
+# app/db/async_queries.py
+"""
+Versiones awaitables de las funciones de app/db/queries.py.
+
+pyodbc es bloqueante, así que cada llamada se ejecuta en un ThreadPoolExecutor
+dedicado a la base de datos. El executor se dimensiona según los pools de
+conexiones (DB_POOL_MAX_SIZE por cada DatabaseConnection), de modo que la
+concurrencia de consultas escala con la capacidad de la BD y no bloquea el
+event loop ni compite con el executor por defecto de asyncio.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+import pyodbc
+
+from app.core.config import settings
+from app.db.connection import DatabaseConnection
+from app.db.sentencias import SentenciaPreparada
+from app.db.versiones import IncrementoVersiones
+from app.db import queries
+
+T = TypeVar("T")
+
+_FIN = object()  # Centinela de fin para los iteradores en streaming
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _executor_size() -> int:
+    if settings.DB_EXECUTOR_MAX_WORKERS > 0:
+        return settings.DB_EXECUTOR_MAX_WORKERS
+    return max(1, settings.DB_POOL_MAX_SIZE) * len(DatabaseConnection)
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Devuelve (creándolo si hace falta) el executor dedicado a la BD."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=_executor_size(), thread_name_prefix="db")
+    return _executor
+
+def shutdown_db_executor() -> None:
+    """Detiene el executor de BD (usado al apagar la aplicación)."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+async def run_in_db_executor(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Ejecuta una función bloqueante de BD en el executor dedicado."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(func, *args, **kwargs))
+
+async def aexecute_query(query: str, params: tuple = (), connection_type: DatabaseConnection = DatabaseConnection.DEFAULT) -> List[Dict[str, Any]]:
+    return await run_in_db_executor(queries.execute_query, query, params, connection_type)
+
+async def aexecute_prepared_query(
+    sentencia: SentenciaPreparada,
+    params: tuple = (),
+    connection_type: DatabaseConnection = DatabaseConnection.DEFAULT
+) -> List[Dict[str, Any]]:
+    return await run_in_db_executor(queries.execute_prepared_query, sentencia, params, connection_type)
+
+async def aexecute_auth_query(query: str, params: tuple = ()) -> Dict[str, Any]:
+    return await run_in_db_executor(queries.execute_auth_query, query, params)
+
+async def aexecute_insert(
+    query: str,
+    params: tuple = (),
+    connection_type: DatabaseConnection = DatabaseConnection.DEFAULT,
+    versiones: Optional[IncrementoVersiones] = None
+) -> Dict[str, Any]:
+    return await run_in_db_executor(queries.execute_insert, query, params, connection_type, versiones)
+
+async def aexecute_update(
+    query: str,
+    params: tuple = (),
+    connection_type: DatabaseConnection = DatabaseConnection.DEFAULT,
+    versiones: Optional[IncrementoVersiones] = None
+) -> Dict[str, Any]:
+    return await run_in_db_executor(queries.execute_update, query, params, connection_type, versiones)
+
+async def aexecute_procedure(procedure_name: str, connection_type: DatabaseConnection = DatabaseConnection.DEFAULT) -> List[Dict[str, Any]]:
+    return await run_in_db_executor(queries.execute_procedure, procedure_name, connection_type)
+
+async def aexecute_procedure_params(
+    procedure_name: str,
+    params: dict,
+    connection_type: DatabaseConnection = DatabaseConnection.DEFAULT
+) -> List[Dict[str, Any]]:
+    return await run_in_db_executor(queries.execute_procedure_params, procedure_name, params, connection_type)
+
+async def aexecute_transaction(
+    operations_func: Callable[[pyodbc.Cursor], None],
+    connection_type: DatabaseConnection = DatabaseConnection.DEFAULT
+) -> None:
+    """
+    Ejecuta operaciones de BD en una transacción.
+    'operations_func' sigue siendo síncrona: corre completa en el hilo de BD.
+    """
+    return await run_in_db_executor(queries.execute_transaction, operations_func, connection_type)
+
+async def _aiter_en_executor(generador: Iterator[T]) -> AsyncIterator[T]:
+    """
+    Recorre un generador bloqueante de BD pidiendo cada elemento en el executor,
+    de modo que entre lotes el event loop queda libre.
+    """
+    try:
+        while True:
+            elemento = await run_in_db_executor(next, generador, _FIN)
+            if elemento is _FIN:
+                break
+            yield elemento
+    finally:
+        # Cierra el generador (y devuelve la conexión) aunque el consumidor corte antes
+        await run_in_db_executor(generador.close)
+
+async def aiter_procedure_params(
+    procedure_name: str,
+    params: dict,
+    connection_type: DatabaseConnection = DatabaseConnection.DEFAULT,
+    batch_size: Optional[int] = None
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Versión async de iter_procedure_params: sólo hay un lote en memoria a la vez."""
+    async for batch in _aiter_en_executor(
+        queries.iter_procedure_params(procedure_name, params, connection_type, batch_size)
+    ):
+        yield batch
+
+async def aiter_procedure_params_filas(
+    procedure_name: str,
+    params: dict,
+    connection_type: DatabaseConnection = DatabaseConnection.DEFAULT,
+    batch_size: Optional[int] = None
+) -> AsyncIterator[Tuple[List[str], List[Any]]]:
+    """Versión async de iter_procedure_params_filas (lotes de columnas y filas sin convertir)."""
+    async for batch in _aiter_en_executor(
+        queries.iter_procedure_params_filas(procedure_name, params, connection_type, batch_size)
+    ):
+        yield batch
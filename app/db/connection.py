@@ -3,11 +3,18 @@ import pyodbc
 from app.core.config import settings
 from contextlib import contextmanager
 import logging
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
 from app.core.exceptions import DatabaseError
+from app.db.sentencias import RegistroSentencias
 from enum import Enum
 
 logger = logging.getLogger(__name__)
 
+_PRUNE_INTERVAL_SECONDS = 60.0  # Cada cuánto se revisan las conexiones ociosas al devolver una
+
 class DatabaseConnection(Enum):
     DEFAULT = "default"
     ADMIN = "admin"
@@ -37,24 +44,327 @@ def get_connection_string(connection_type: DatabaseConnection = DatabaseConnecti
             "TrustServerCertificate=yes;"
         )
 
-@contextmanager
-def get_db_connection(connection_type: DatabaseConnection = DatabaseConnection.DEFAULT):
+
+class _PooledConnection:
     """
-    Context manager para obtener y cerrar una conexión a BD.
-    Permite especificar el tipo de conexión requerida.
+    Conexión física administrada por el pool junto con sus tiempos de vida y
+    sus sentencias preparadas (ver app/db/sentencias.py).
+    """
+
+    __slots__ = ("connection", "sentencias", "created_at", "last_used_at")
+
+    def __init__(self, connection: pyodbc.Connection):
+        now = time.monotonic()
+        self.connection = connection
+        self.sentencias = RegistroSentencias(connection)
+        self.created_at = now
+        self.last_used_at = now
+
+    def is_expired(self, now: float) -> bool:
+        max_lifetime = settings.DB_POOL_MAX_LIFETIME_SECONDS
+        return max_lifetime > 0 and (now - self.created_at) >= max_lifetime
+
+    def is_idle_too_long(self, now: float) -> bool:
+        max_idle = settings.DB_POOL_MAX_IDLE_SECONDS
+        return max_idle > 0 and (now - self.last_used_at) >= max_idle
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones pyodbc acotado para un DatabaseConnection.
+
+    - Mantiene entre DB_POOL_MIN_SIZE y DB_POOL_MAX_SIZE conexiones físicas.
+    - Descarta conexiones ociosas (DB_POOL_MAX_IDLE_SECONDS) o demasiado
+      antiguas (DB_POOL_MAX_LIFETIME_SECONDS).
+    - Verifica con 'SELECT 1' las conexiones que estuvieron ociosas más de
+      DB_POOL_PING_AFTER_IDLE_SECONDS antes de entregarlas.
+    - Si el pool está lleno, el solicitante espera en cola hasta
+      DB_POOL_ACQUIRE_TIMEOUT_SECONDS y luego recibe un DatabaseError (503).
+    """
+
+    def __init__(self, connection_type: DatabaseConnection):
+        self.connection_type = connection_type
+        self.min_size = max(0, settings.DB_POOL_MIN_SIZE)
+        self.max_size = max(1, settings.DB_POOL_MAX_SIZE, self.min_size)
+        self._idle: Deque[_PooledConnection] = deque()
+        self._size = 0  # Conexiones físicas abiertas (ociosas + prestadas)
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        # Métricas simples
+        self._created_total = 0
+        self._discarded_total = 0
+        self._checkouts_total = 0
+        self._timeouts_total = 0
+        self._last_prune_at = time.monotonic()
+
+    # --- Ciclo de vida de conexiones físicas ---
+
+    def _open(self) -> _PooledConnection:
+        conn = pyodbc.connect(get_connection_string(self.connection_type))
+        logger.debug(f"Conexión a BD ({self.connection_type.value}) establecida por el pool.")
+        return _PooledConnection(conn)
+
+    def _close_physical(self, pooled: _PooledConnection) -> None:
+        pooled.sentencias.cerrar()
+        try:
+            pooled.connection.close()
+        except pyodbc.Error as e:
+            logger.debug(f"Error cerrando conexión ({self.connection_type.value}) descartada: {e}")
+
+    def _is_alive(self, pooled: _PooledConnection) -> bool:
+        try:
+            cursor = pooled.connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            return True
+        except pyodbc.Error as e:
+            logger.warning(f"Conexión ({self.connection_type.value}) del pool no responde, se descarta: {e}")
+            return False
+
+    def _discard(self, pooled: _PooledConnection) -> None:
+        """Cierra una conexión prestada y libera su lugar en el pool."""
+        self._close_physical(pooled)
+        with self._cond:
+            self._size -= 1
+            self._discarded_total += 1
+            self._cond.notify()
+
+    # --- API pública ---
+
+    def acquire(self, timeout: Optional[float] = None) -> _PooledConnection:
+        """Obtiene una conexión del pool, abriendo una nueva si hay capacidad."""
+        timeout = settings.DB_POOL_ACQUIRE_TIMEOUT_SECONDS if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            pooled: Optional[_PooledConnection] = None
+            stale: list = []
+            try:
+                with self._cond:
+                    if self._closed:
+                        raise DatabaseError(status_code=503, detail="El pool de conexiones está cerrado.")
+                    while True:
+                        now = time.monotonic()
+                        # Descartar conexiones ociosas expiradas antes de entregarlas
+                        while self._idle and (self._idle[-1].is_expired(now) or self._idle[-1].is_idle_too_long(now)):
+                            stale.append(self._idle.pop())
+                            self._size -= 1
+                            self._discarded_total += 1
+                        if self._idle:
+                            pooled = self._idle.pop()  # LIFO: reutiliza la conexión más "caliente"
+                            break
+                        if self._size < self.max_size:
+                            self._size += 1  # Reservar el lugar; se abre fuera del lock
+                            break
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self._timeouts_total += 1
+                            raise DatabaseError(
+                                status_code=503,
+                                detail=f"Tiempo de espera agotado obteniendo conexión ({self.connection_type.value}) del pool."
+                            )
+                        self._waiting += 1
+                        try:
+                            self._cond.wait(remaining)
+                        finally:
+                            self._waiting -= 1
+            finally:
+                for old in stale:
+                    self._close_physical(old)
+
+            if pooled is None:
+                try:
+                    pooled = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created_total += 1
+                    self._checkouts_total += 1
+                return pooled
+
+            ping_after = settings.DB_POOL_PING_AFTER_IDLE_SECONDS
+            if ping_after <= 0 or (time.monotonic() - pooled.last_used_at) >= ping_after:
+                if not self._is_alive(pooled):
+                    self._discard(pooled)
+                    continue  # Intentar con otra conexión (o abrir una nueva)
+
+            with self._cond:
+                self._checkouts_total += 1
+            return pooled
+
+    def release(self, pooled: _PooledConnection, discard: bool = False) -> None:
+        """Devuelve una conexión al pool, descartándola si quedó en mal estado."""
+        if not discard:
+            try:
+                # Nunca devolver al pool una transacción abierta
+                pooled.connection.rollback()
+            except pyodbc.Error as e:
+                logger.warning(f"Rollback al devolver conexión ({self.connection_type.value}) falló, se descarta: {e}")
+                discard = True
+
+        now = time.monotonic()
+        if discard or self._closed or pooled.is_expired(now):
+            self._discard(pooled)
+            return
+
+        pooled.last_used_at = now
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+            prune_due = (now - self._last_prune_at) >= _PRUNE_INTERVAL_SECONDS
+            if prune_due:
+                self._last_prune_at = now
+        if prune_due:
+            self.prune()
+
+    def prune(self) -> None:
+        """Cierra conexiones ociosas expiradas respetando el tamaño mínimo."""
+        now = time.monotonic()
+        stale = []
+        with self._cond:
+            keep: Deque[_PooledConnection] = deque()
+            while self._idle:
+                pooled = self._idle.popleft()
+                if pooled.is_expired(now) or (pooled.is_idle_too_long(now) and self._size > self.min_size):
+                    stale.append(pooled)
+                    self._size -= 1
+                    self._discarded_total += 1
+                else:
+                    keep.append(pooled)
+            self._idle = keep
+        for pooled in stale:
+            self._close_physical(pooled)
+
+    def warm_up(self) -> None:
+        """Abre conexiones hasta alcanzar DB_POOL_MIN_SIZE."""
+        opened = []
+        try:
+            while True:
+                with self._cond:
+                    if self._closed or self._size >= self.min_size:
+                        break
+                    self._size += 1
+                try:
+                    opened.append(self._open())
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                    raise
+                with self._cond:
+                    self._created_total += 1
+        finally:
+            for pooled in opened:
+                self.release(pooled)
+
+    def close(self) -> None:
+        """Cierra todas las conexiones ociosas; las prestadas se cierran al devolverse."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._close_physical(pooled)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "max_size": self.max_size,
+                "created_total": self._created_total,
+                "discarded_total": self._discarded_total,
+                "checkouts_total": self._checkouts_total,
+                "timeouts_total": self._timeouts_total,
+            }
+
+
+_pools: Dict[DatabaseConnection, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(connection_type: DatabaseConnection = DatabaseConnection.DEFAULT) -> ConnectionPool:
+    """Devuelve (creándolo si hace falta) el pool del tipo de conexión indicado."""
+    pool = _pools.get(connection_type)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(connection_type)
+            if pool is None:
+                pool = ConnectionPool(connection_type)
+                _pools[connection_type] = pool
+    return pool
+
+def pools_stats() -> Dict[str, Dict[str, int]]:
+    """Estadísticas de los pools creados hasta el momento."""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {tipo.name.lower(): pool.stats() for tipo, pool in pools}
+
+def close_all_pools() -> None:
+    """Cierra todos los pools (usado al apagar la aplicación)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+def _es_error_de_conexion(error: pyodbc.Error) -> bool:
+    """
+    True si el SQLSTATE del error indica que la conexión física ya no sirve
+    (clase 08: comunicación/enlace; HYT00/HYT01: timeout). Los demás errores
+    (sintaxis, restricciones, deadlock...) dejan la conexión utilizable: basta
+    el rollback que hace release().
     """
-    conn = None
+    sqlstate = error.args[0] if error.args and isinstance(error.args[0], str) else ""
+    return sqlstate.startswith("08") or sqlstate in ("HYT00", "HYT01")
+
+@contextmanager
+def _prestar_conexion(connection_type: DatabaseConnection):
+    """Presta una _PooledConnection y la devuelve al pool (descartándola si falló la conexión)."""
+    pool = get_pool(connection_type)
+    pooled = None
+    broken = False
     try:
-        conn_str = get_connection_string(connection_type)
-        conn = pyodbc.connect(conn_str)
-        logger.debug(f"Conexión a BD ({connection_type.value}) establecida.")
-        yield conn
+        pooled = pool.acquire()
+        yield pooled
 
     except pyodbc.Error as e:
+        broken = _es_error_de_conexion(e)
         logger.error(f"Error de conexión a la base de datos ({connection_type.value}): {str(e)}")
         raise DatabaseError(status_code=500, detail=f"Error de conexión: {str(e)}")
 
+    except DatabaseError as e:
+        # Los helpers de app/db/queries.py envuelven el pyodbc.Error original (queda en __context__)
+        broken = isinstance(e.__context__, pyodbc.Error) and _es_error_de_conexion(e.__context__)
+        raise
+
     finally:
-        if conn:
-            conn.close()
-            logger.debug(f"Conexión a BD ({connection_type.value}) cerrada.")
\ No newline at end of file
+        if pooled is not None:
+            pool.release(pooled, discard=broken)
+
+@contextmanager
+def get_db_connection(connection_type: DatabaseConnection = DatabaseConnection.DEFAULT):
+    """
+    Context manager para obtener una conexión del pool y devolverla al terminar.
+    Permite especificar el tipo de conexión requerida.
+    """
+    with _prestar_conexion(connection_type) as pooled:
+        yield pooled.connection
+
+@contextmanager
+def get_db_statements(connection_type: DatabaseConnection = DatabaseConnection.DEFAULT):
+    """
+    Como get_db_connection, pero entrega el RegistroSentencias de la conexión
+    prestada para ejecutar sentencias preparadas.
+    """
+    with _prestar_conexion(connection_type) as pooled:
+        yield pooled.sentencias
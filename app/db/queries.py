@@ -1,6 +1,9 @@
 # app/db/queries.py
-from typing import List, Dict, Any, Callable
-from app.db.connection import get_db_connection, DatabaseConnection
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
+from app.db.connection import get_db_connection, get_db_statements, DatabaseConnection
+from app.db.sentencias import SentenciaPreparada, TIPO_INT, tipo_nvarchar
+from app.db.versiones import IncrementoVersiones
+from app.core.config import settings
 from app.core.exceptions import DatabaseError
 import pyodbc
 import logging
@@ -20,6 +23,33 @@ def execute_query(query: str, params: tuple = (), connection_type: DatabaseConne
         finally:
             cursor.close()
 
+def execute_prepared_query(
+    sentencia: SentenciaPreparada,
+    params: tuple = (),
+    connection_type: DatabaseConnection = DatabaseConnection.DEFAULT
+) -> List[Dict[str, Any]]:
+    """
+    Igual que execute_query, pero con el cursor preparado de 'sentencia' en la
+    conexión prestada (ver app/db/sentencias.py): en una conexión que ya la
+    ejecutó, SQL Server no vuelve a compilarla ni a inferir los tipos.
+    """
+    if not settings.DB_PREPARED_STATEMENTS_ENABLED:
+        return execute_query(sentencia.sql, params, connection_type)
+
+    with get_db_statements(connection_type) as sentencias:
+        try:
+            cursor = sentencias.cursor(sentencia)
+            cursor.execute(sentencia.sql, params)
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+            # Agota los resultados: libera la conexión para otros cursores sin perder la preparación
+            cursor.nextset()
+            return [dict(zip(columns, row)) for row in rows]
+        except Exception as e:
+            sentencias.descartar(sentencia)
+            logger.error(f"Error en execute_prepared_query ({sentencia.nombre}): {str(e)}")
+            raise DatabaseError(status_code=500, detail=f"Error en la consulta: {str(e)}")
+
 def execute_auth_query(query: str, params: tuple = ()) -> Dict[str, Any]:
     """
     Ejecuta una consulta específica para autenticación y retorna un único registro.
@@ -47,7 +77,13 @@ def execute_auth_query(query: str, params: tuple = ()) -> Dict[str, Any]:
             if cursor:
                 cursor.close()
 
-def execute_insert(query: str, params: tuple = (), connection_type: DatabaseConnection = DatabaseConnection.DEFAULT) -> Dict[str, Any]:
+def execute_insert(
+    query: str,
+    params: tuple = (),
+    connection_type: DatabaseConnection = DatabaseConnection.DEFAULT,
+    versiones: Optional[IncrementoVersiones] = None
+) -> Dict[str, Any]:
+    """'versiones': contadores compartidos a incrementar en la misma transacción (ver app/db/versiones.py)."""
     with get_db_connection(connection_type) as conn:
         try:
             cursor = conn.cursor()
@@ -59,6 +95,8 @@ def execute_insert(query: str, params: tuple = (), connection_type: DatabaseConn
             else:
                 result = {}
 
+            if versiones is not None:
+                versiones.aplicar(cursor)
             conn.commit()
             logger.info("Inserción exitosa")
             return result
@@ -69,7 +107,13 @@ def execute_insert(query: str, params: tuple = (), connection_type: DatabaseConn
         finally:
             cursor.close()
 
-def execute_update(query: str, params: tuple = (), connection_type: DatabaseConnection = DatabaseConnection.DEFAULT) -> Dict[str, Any]:
+def execute_update(
+    query: str,
+    params: tuple = (),
+    connection_type: DatabaseConnection = DatabaseConnection.DEFAULT,
+    versiones: Optional[IncrementoVersiones] = None
+) -> Dict[str, Any]:
+    """'versiones': contadores compartidos a incrementar en la misma transacción (ver app/db/versiones.py)."""
     with get_db_connection(connection_type) as conn:
         try:
             cursor = conn.cursor()
@@ -81,6 +125,8 @@ def execute_update(query: str, params: tuple = (), connection_type: DatabaseConn
             else:
                 result = {}
 
+            if versiones is not None:
+                versiones.aplicar(cursor)
             conn.commit()
             logger.info("Actualización exitosa")
             return result
@@ -142,6 +188,58 @@ def execute_procedure_params(
         finally:
             cursor.close()
 
+def iter_procedure_params_filas(
+    procedure_name: str,
+    params: dict,
+    connection_type: DatabaseConnection = DatabaseConnection.DEFAULT,
+    batch_size: Optional[int] = None
+) -> Iterator[Tuple[List[str], List[Any]]]:
+    """
+    Variante en streaming de execute_procedure_params.
+    Lee con fetchmany(batch_size) todos los result sets y entrega lotes
+    (columnas, filas) a medida que llegan, así la memoria depende del tamaño
+    del lote y no del total de filas. La conexión se mantiene prestada
+    mientras el generador esté abierto y se devuelve al pool al agotarlo o
+    cerrarlo.
+    """
+    batch_size = batch_size or settings.DB_FETCH_BATCH_SIZE
+    with get_db_connection(connection_type) as conn:
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.arraysize = batch_size
+            param_str = ", ".join([f"@{key} = ?" for key in params.keys()])
+            query = f"EXEC {procedure_name} {param_str}".rstrip()
+
+            cursor.execute(query, tuple(params.values()))
+
+            while True:
+                if cursor.description:
+                    columns = [column[0] for column in cursor.description]
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        yield columns, rows
+                if not cursor.nextset():
+                    break
+        except Exception as e:
+            logger.error(f"Error en iter_procedure_params_filas: {str(e)}")
+            raise DatabaseError(status_code=500, detail=f"Error en el procedimiento: {str(e)}")
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+def iter_procedure_params(
+    procedure_name: str,
+    params: dict,
+    connection_type: DatabaseConnection = DatabaseConnection.DEFAULT,
+    batch_size: Optional[int] = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """Igual que iter_procedure_params_filas, pero cada lote como lista de diccionarios."""
+    for columns, rows in iter_procedure_params_filas(procedure_name, params, connection_type, batch_size):
+        yield [dict(zip(columns, row)) for row in rows]
+
 def execute_transaction(
     operations_func: Callable[[pyodbc.Cursor], None],
     connection_type: DatabaseConnection = DatabaseConnection.DEFAULT
@@ -167,40 +265,178 @@ def execute_transaction(
         logger.error(f"Error inesperado (no pyodbc) en transacción: {e}", exc_info=True)
         raise DatabaseError(status_code=500, detail=f"Error inesperado en transacción: {str(e)}")
 
-# Consulta para obtener usuarios paginados con sus roles, filtrando eliminados y buscando
+# Consulta para obtener una página de usuarios (sin roles), filtrando eliminados y buscando.
+# Se pagina sobre usuarios y no sobre usuario x rol: la página trae siempre 'limit'
+# usuarios completos; sus roles se cargan aparte con SELECT_ROLES_DE_USUARIOS_TEMPLATE.
+# Parámetros: (filtro de búsqueda x9, offset, limit); ver UsuarioService._filtro_busqueda
 SELECT_USUARIOS_PAGINATED = """
-WITH UserRoles AS (
-    SELECT
-        u.usuario_id,
-        u.nombre_usuario,
-        u.correo,
-        u.nombre,
-        u.apellido,
-        u.es_activo,
-        u.correo_confirmado,
-        u.fecha_creacion,
-        u.fecha_ultimo_acceso,
-        u.fecha_actualizacion,
-        r.rol_id,
-        r.nombre AS nombre_rol
-        -- Añade aquí otros campos de 'usuario' o 'rol' que necesites
-    FROM usuario u
-    LEFT JOIN usuario_rol ur ON u.usuario_id = ur.usuario_id AND ur.es_activo = 1
-    LEFT JOIN rol r ON ur.rol_id = r.rol_id AND r.es_activo = 1
-    WHERE
-        u.es_eliminado = 0
-        AND (? IS NULL OR (
-            u.nombre_usuario LIKE ? OR
-            u.correo LIKE ? OR
-            u.nombre LIKE ? OR
-            u.apellido LIKE ?
-        ))
-)
-SELECT * FROM UserRoles
-ORDER BY usuario_id -- O el campo por el que prefieras ordenar por defecto
+SELECT
+    u.usuario_id,
+    u.nombre_usuario,
+    u.correo,
+    u.nombre,
+    u.apellido,
+    u.es_activo,
+    u.correo_confirmado,
+    u.fecha_creacion,
+    u.fecha_ultimo_acceso,
+    u.fecha_actualizacion
+FROM usuario u
+WHERE
+    u.es_eliminado = 0
+    AND (? IS NULL OR (
+        u.nombre_usuario LIKE ? OR u.nombre_usuario LIKE ? OR
+        u.correo LIKE ? OR u.correo LIKE ? OR
+        u.nombre LIKE ? OR u.nombre LIKE ? OR
+        u.apellido LIKE ? OR u.apellido LIKE ?
+    ))
+ORDER BY u.usuario_id
 OFFSET ? ROWS FETCH NEXT ? ROWS ONLY;
 """
 
+# Paginación por cursor (keyset): los N usuarios siguientes al último ID entregado
+# Parámetros: (top, ultimo_usuario_id, filtro de búsqueda x9)
+SELECT_USUARIOS_KEYSET = """
+SELECT TOP (?)
+    u.usuario_id,
+    u.nombre_usuario,
+    u.correo,
+    u.nombre,
+    u.apellido,
+    u.es_activo,
+    u.correo_confirmado,
+    u.fecha_creacion,
+    u.fecha_ultimo_acceso,
+    u.fecha_actualizacion
+FROM usuario u
+WHERE
+    u.es_eliminado = 0
+    AND u.usuario_id > ?
+    AND (? IS NULL OR (
+        u.nombre_usuario LIKE ? OR u.nombre_usuario LIKE ? OR
+        u.correo LIKE ? OR u.correo LIKE ? OR
+        u.nombre LIKE ? OR u.nombre LIKE ? OR
+        u.apellido LIKE ? OR u.apellido LIKE ?
+    ))
+ORDER BY u.usuario_id;
+"""
+
+# Usuarios de una página resuelta por el índice de búsqueda en memoria.
+# {placeholders} = "?, ?, ..." (uno por usuario_id)
+SELECT_USUARIOS_POR_IDS_TEMPLATE = """
+SELECT
+    u.usuario_id,
+    u.nombre_usuario,
+    u.correo,
+    u.nombre,
+    u.apellido,
+    u.es_activo,
+    u.correo_confirmado,
+    u.fecha_creacion,
+    u.fecha_ultimo_acceso,
+    u.fecha_actualizacion
+FROM usuario u
+WHERE
+    u.usuario_id IN ({placeholders})
+    AND u.es_eliminado = 0
+ORDER BY u.usuario_id;
+"""
+
+# Importación masiva: usuarios (incluso eliminados, por la UNIQUE) que ya usan alguno
+# de los nombres de usuario o correos del lote. {nombres} y {correos} = "?, ?, ..."
+# Sin LOWER() sobre las columnas para que SQL Server pueda buscar en los índices
+# de las UNIQUE: la intercalación de la BD ya compara sin distinguir mayúsculas.
+SELECT_USUARIOS_EXISTENTES_TEMPLATE = """
+SELECT nombre_usuario, correo
+FROM usuario
+WHERE nombre_usuario IN ({nombres})
+   OR correo IN ({correos});
+"""
+
+# Importación masiva: una fila por usuario, ejecutada con executemany (fast_executemany)
+INSERT_USUARIO_IMPORT = """
+INSERT INTO usuario (
+    nombre_usuario, correo, contrasena, nombre, apellido,
+    es_activo, correo_confirmado, es_eliminado
+)
+VALUES (?, ?, ?, ?, ?, ?, 0, 0);
+"""
+
+# IDs asignados a los usuarios recién importados (misma transacción). {placeholders} = "?, ?, ..."
+SELECT_USUARIOS_IMPORTADOS_TEMPLATE = """
+SELECT usuario_id, nombre_usuario
+FROM usuario
+WHERE nombre_usuario IN ({placeholders}) AND es_eliminado = 0;
+"""
+
+# --- Asignación masiva de roles (usuario_ids x rol_ids) ---
+# {placeholders} = "?, ?, ..." (uno por ID)
+SELECT_USUARIOS_EXISTENTES_POR_IDS_TEMPLATE = """
+SELECT usuario_id
+FROM usuario
+WHERE usuario_id IN ({placeholders}) AND es_eliminado = 0;
+"""
+
+SELECT_ROLES_POR_IDS_TEMPLATE = """
+SELECT rol_id, es_activo
+FROM rol
+WHERE rol_id IN ({placeholders});
+"""
+
+# Asignaciones existentes del producto cartesiano, bloqueadas hasta el commit.
+# {usuarios} y {roles} = "?, ?, ..."
+SELECT_USUARIO_ROL_PARA_ACTUALIZAR_TEMPLATE = """
+SELECT usuario_rol_id, usuario_id, rol_id, es_activo
+FROM usuario_rol WITH (UPDLOCK, HOLDLOCK)
+WHERE usuario_id IN ({usuarios}) AND rol_id IN ({roles});
+"""
+
+# Parámetros: (usuario_id, rol_id)
+INSERT_USUARIO_ROL = """
+INSERT INTO usuario_rol (usuario_id, rol_id, es_activo)
+VALUES (?, ?, 1);
+"""
+
+# Parámetros: (usuario_rol_id,)
+REACTIVATE_USUARIO_ROL = """
+UPDATE usuario_rol
+SET es_activo = 1, fecha_asignacion = GETDATE()
+WHERE usuario_rol_id = ?;
+"""
+
+# Parámetros: (usuario_rol_id,)
+DEACTIVATE_USUARIO_ROL = """
+UPDATE usuario_rol
+SET es_activo = 0
+WHERE usuario_rol_id = ?;
+"""
+
+# Campos de búsqueda de todos los usuarios no eliminados (carga del índice de búsqueda)
+SELECT_USUARIOS_BUSQUEDA = """
+SELECT usuario_id, nombre_usuario, correo, nombre, apellido
+FROM usuario
+WHERE es_eliminado = 0;
+"""
+
+# Roles activos de un lote de usuarios (los de una página) en una sola consulta.
+# {placeholders} = "?, ?, ..." (uno por usuario_id)
+SELECT_ROLES_DE_USUARIOS_TEMPLATE = """
+SELECT
+    ur.usuario_id,
+    r.rol_id,
+    r.nombre,
+    r.descripcion,
+    r.es_activo,
+    r.fecha_creacion
+FROM usuario_rol ur
+INNER JOIN rol r ON ur.rol_id = r.rol_id
+WHERE
+    ur.usuario_id IN ({placeholders})
+    AND ur.es_activo = 1
+    AND r.es_activo = 1
+ORDER BY ur.usuario_id, r.nombre;
+"""
+
 # Consulta para contar el total de usuarios que coinciden con la búsqueda y no están eliminados
 COUNT_USUARIOS_PAGINATED = """
 SELECT COUNT(DISTINCT u.usuario_id)
@@ -208,10 +444,10 @@ FROM usuario u
 WHERE
     u.es_eliminado = 0
     AND (? IS NULL OR (
-        u.nombre_usuario LIKE ? OR
-        u.correo LIKE ? OR
-        u.nombre LIKE ? OR
-        u.apellido LIKE ?
+        u.nombre_usuario LIKE ? OR u.nombre_usuario LIKE ? OR
+        u.correo LIKE ? OR u.correo LIKE ? OR
+        u.nombre LIKE ? OR u.nombre LIKE ? OR
+        u.apellido LIKE ? OR u.apellido LIKE ?
     ));
 """
 
@@ -269,6 +505,20 @@ SELECT_ROLES_PAGINATED = """
     -- Nota: No filtra por es_activo aquí
     -- Usamos LOWER() para búsqueda insensible a mayúsculas/minúsculas
 """
+# Paginación por cursor (keyset) de roles. Parámetros: (top, ultimo_rol_id, search x3)
+SELECT_ROLES_KEYSET = """
+    SELECT TOP (?)
+        rol_id, nombre, descripcion, es_activo, fecha_creacion
+    FROM
+        dbo.rol
+    WHERE rol_id > ?
+      AND (? IS NULL OR (
+        LOWER(nombre) LIKE LOWER(?) OR
+        LOWER(descripcion) LIKE LOWER(?)
+    ))
+    ORDER BY
+        rol_id;
+"""
 # --- FIN NUEVAS QUERIES ---
 
 # --- NUEVA CONSULTA PARA MENUS (ADMIN) ---
@@ -285,6 +535,16 @@ SELECT_PERMISOS_POR_ROL = """
     WHERE rol_id = ?;
 """
 
+# Matriz completa de permisos con los datos de su menú (índice en memoria, ver app/core/permisos_cache.py)
+SELECT_ALL_PERMISOS = """
+    SELECT
+        p.rol_menu_id, p.rol_id, p.menu_id,
+        p.puede_ver, p.puede_editar, p.puede_eliminar,
+        m.nombre AS menu_nombre, m.ruta AS menu_url, m.icono AS menu_icono, m.orden AS menu_orden
+    FROM rol_menu_permiso p
+    INNER JOIN menu m ON p.menu_id = m.menu_id;
+"""
+
 # Elimina TODOS los permisos asociados a un rol específico.
 # Se usa antes de insertar los nuevos permisos actualizados.
 DELETE_PERMISOS_POR_ROL = """
@@ -299,6 +559,27 @@ INSERT_PERMISO_ROL = """
     VALUES (?, ?, ?, ?, ?);
 """
 
+# Permisos actuales del rol dentro de la transacción de actualización; los bloqueos
+# impiden que otra actualización del mismo rol cambie las filas entre la lectura y el diff
+SELECT_PERMISOS_POR_ROL_PARA_ACTUALIZAR = """
+    SELECT menu_id, puede_ver, puede_editar, puede_eliminar
+    FROM rol_menu_permiso WITH (UPDLOCK, HOLDLOCK)
+    WHERE rol_id = ?;
+"""
+
+# Parámetros: (puede_ver, puede_editar, puede_eliminar, rol_id, menu_id)
+UPDATE_PERMISO_ROL_MENU = """
+    UPDATE rol_menu_permiso
+    SET puede_ver = ?, puede_editar = ?, puede_eliminar = ?
+    WHERE rol_id = ? AND menu_id = ?;
+"""
+
+# Parámetros: (rol_id, menu_id)
+DELETE_PERMISO_ROL_MENU = """
+    DELETE FROM rol_menu_permiso
+    WHERE rol_id = ? AND menu_id = ?;
+"""
+
 # --- FIN DE NUEVAS CONSULTAS ---
 
 # --- NUEVAS QUERIES PARA MANTENIMIENTO DE MENÚ ---
@@ -382,6 +663,19 @@ GET_AREAS_PAGINATED_QUERY = """
     OFFSET ? ROWS FETCH NEXT ? ROWS ONLY; -- Sintaxis SQL Server
 """
 
+# Paginación por cursor (keyset) de áreas. Parámetros: (top, ultimo_area_id, search, search x2)
+GET_AREAS_KEYSET_QUERY = """
+    SELECT TOP (?)
+        area_id, nombre, descripcion, icono, es_activo, fecha_creacion
+    FROM
+        area_menu
+    WHERE
+        area_id > ?
+        AND (? IS NULL OR LOWER(nombre) LIKE LOWER(?) OR LOWER(descripcion) LIKE LOWER(?))
+    ORDER BY
+        area_id ASC;
+"""
+
 COUNT_AREAS_QUERY = """
     SELECT
         COUNT(*) as total_count
@@ -465,4 +759,62 @@ GET_MAX_ORDEN_FOR_ROOT = """
     SELECT MAX(orden) as max_orden
     FROM menu
     WHERE area_id = ? AND padre_menu_id IS NULL;
-"""
\ No newline at end of file
+"""
+
+# Versión compartida de cada recurso (dbo.version_recurso, ver app/db/versiones.py):
+# una fila por recurso, leída por PK. La usan los ETag, el índice de permisos y el
+# índice de búsqueda de usuarios para saber si otro worker escribió.
+SELECT_VERSIONES_RECURSOS = """
+SELECT recurso, version
+FROM dbo.version_recurso;
+"""
+
+# --- Consultas del camino de autenticación ---
+
+# Usuario del token (app/api/deps.py). Parámetros: (nombre_usuario,)
+SELECT_USUARIO_AUTH_BY_NOMBRE = """
+SELECT usuario_id, nombre_usuario, correo, nombre, apellido, es_activo,
+       fecha_creacion, fecha_ultimo_acceso, correo_confirmado
+FROM usuario
+WHERE nombre_usuario = ? AND es_eliminado = 0
+"""
+
+# Roles activos de un usuario (detalle). Parámetros: (usuario_id,)
+SELECT_ROLES_ACTIVOS_DE_USUARIO = """
+SELECT
+    r.rol_id, r.nombre, r.descripcion, r.es_activo, r.fecha_creacion
+FROM dbo.rol r
+INNER JOIN dbo.usuario_rol ur ON r.rol_id = ur.rol_id
+WHERE ur.usuario_id = ? AND ur.es_activo = 1 AND r.es_activo = 1
+ORDER BY r.nombre;
+"""
+
+# Sólo los nombres de los roles activos (login). Parámetros: (usuario_id,)
+SELECT_NOMBRES_ROLES_DE_USUARIO = """
+SELECT r.nombre
+FROM dbo.rol r
+INNER JOIN dbo.usuario_rol ur ON r.rol_id = ur.rol_id
+WHERE ur.usuario_id = ? AND ur.es_activo = 1 AND r.es_activo = 1;
+"""
+
+# Versión de permisos de los tokens autocontenidos (claim 'pv'): contador monotónico
+# usuario.version_permisos, que sube en la misma transacción que cualquier cambio del
+# perfil, estado o roles del usuario (ver app/db/versiones.py). Lectura por PK.
+# Parámetros: (usuario_id,)
+SELECT_VERSION_PERMISOS_USUARIO = """
+SELECT es_activo, version_permisos
+FROM dbo.usuario
+WHERE usuario_id = ? AND es_eliminado = 0;
+"""
+
+# --- Sentencias preparadas (execute_prepared_query) ---
+# Consultas que se ejecutan en casi todas las solicitudes: se preparan una vez
+# por conexión del pool y con los tipos de parámetro fijos según database.md.
+SENTENCIA_USUARIO_AUTH = SentenciaPreparada("usuario_auth", SELECT_USUARIO_AUTH_BY_NOMBRE, (tipo_nvarchar(50),))
+SENTENCIA_VERSIONES_RECURSOS = SentenciaPreparada("versiones_recursos", SELECT_VERSIONES_RECURSOS)
+SENTENCIA_VERSION_PERMISOS = SentenciaPreparada("version_permisos", SELECT_VERSION_PERMISOS_USUARIO, (TIPO_INT,))
+SENTENCIA_ROLES_DE_USUARIO = SentenciaPreparada("roles_de_usuario", SELECT_ROLES_ACTIVOS_DE_USUARIO, (TIPO_INT,))
+SENTENCIA_NOMBRES_ROLES_DE_USUARIO = SentenciaPreparada("nombres_roles_de_usuario", SELECT_NOMBRES_ROLES_DE_USUARIO, (TIPO_INT,))
+SENTENCIA_ROL_BY_ID = SentenciaPreparada("rol_by_id", SELECT_ROL_BY_ID, (TIPO_INT,))
+SENTENCIA_MENU_BY_ID = SentenciaPreparada("menu_by_id", SELECT_MENU_BY_ID, (TIPO_INT,))
+SENTENCIA_CHECK_MENU_EXISTS = SentenciaPreparada("check_menu_exists", CHECK_MENU_EXISTS, (TIPO_INT,))
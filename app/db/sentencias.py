@@ -0,0 +1,127 @@
+# app/db/sentencias.py
+"""
+Registro de sentencias preparadas por conexión del pool.
+
+pyodbc prepara una sentencia (SQLPrepare) la primera vez que un cursor la
+ejecuta y, si el MISMO cursor vuelve a ejecutar el mismo texto SQL, reutiliza
+el handle preparado sin volver a enviarlo a compilar ni a describir sus
+parámetros. Un cursor nuevo por consulta (lo habitual en app/db/queries.py)
+pierde eso en cada llamada.
+
+Cada _PooledConnection lleva un RegistroSentencias con un cursor dedicado por
+sentencia "caliente" (ver SentenciaPreparada en app/db/queries.py): el primer
+uso en esa conexión prepara (miss) y los siguientes reutilizan el handle (hit).
+Los tipos de los parámetros se fijan una vez con setinputsizes, así SQL Server
+recibe siempre la misma firma (p. ej. NVARCHAR(50) en lugar de NVARCHAR(n)
+según el largo del valor) y no hace conversiones implícitas.
+
+Los cursores viven lo que vive la conexión física: se cierran cuando el pool
+la descarta.
+"""
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+import pyodbc
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (tipo SQL de pyodbc, tamaño, dígitos decimales), como los acepta setinputsizes
+TipoParametro = Tuple[int, int, int]
+
+TIPO_INT: TipoParametro = (pyodbc.SQL_INTEGER, 0, 0)
+
+
+def tipo_nvarchar(longitud: int) -> TipoParametro:
+    return (pyodbc.SQL_WVARCHAR, longitud, 0)
+
+
+class SentenciaPreparada:
+    """Texto SQL de una consulta frecuente con los tipos fijos de sus parámetros."""
+
+    __slots__ = ("nombre", "sql", "tipos")
+
+    def __init__(self, nombre: str, sql: str, tipos: Sequence[TipoParametro] = ()):
+        self.nombre = nombre
+        self.sql = sql
+        self.tipos = tuple(tipos)
+
+
+_lock = threading.Lock()
+# nombre de sentencia -> [preparaciones (miss), reutilizaciones (hit)]
+_contadores: Dict[str, list] = {}
+_descartadas_total = 0
+
+
+def _contar(nombre: str, reutilizada: bool) -> None:
+    with _lock:
+        contadores = _contadores.setdefault(nombre, [0, 0])
+        contadores[1 if reutilizada else 0] += 1
+
+
+class RegistroSentencias:
+    """
+    Cursores preparados de UNA conexión física. Como la conexión la usa un
+    solo hilo mientras está prestada, no necesita lock propio.
+    """
+
+    __slots__ = ("_connection", "_cursores")
+
+    def __init__(self, connection: pyodbc.Connection):
+        self._connection = connection
+        self._cursores: Dict[str, pyodbc.Cursor] = {}
+
+    def cursor(self, sentencia: SentenciaPreparada) -> pyodbc.Cursor:
+        """Cursor dedicado a 'sentencia' en esta conexión (lo crea en el primer uso)."""
+        cursor = self._cursores.get(sentencia.nombre)
+        if cursor is not None:
+            _contar(sentencia.nombre, reutilizada=True)
+            return cursor
+        cursor = self._connection.cursor()
+        if sentencia.tipos:
+            # Se conservan en el cursor para todas sus ejecuciones
+            cursor.setinputsizes(list(sentencia.tipos))
+        self._cursores[sentencia.nombre] = cursor
+        _contar(sentencia.nombre, reutilizada=False)
+        return cursor
+
+    def descartar(self, sentencia: SentenciaPreparada) -> None:
+        """Cierra el cursor de 'sentencia' tras un error; el siguiente uso vuelve a prepararla."""
+        global _descartadas_total
+        cursor: Optional[pyodbc.Cursor] = self._cursores.pop(sentencia.nombre, None)
+        if cursor is None:
+            return
+        with _lock:
+            _descartadas_total += 1
+        try:
+            cursor.close()
+        except pyodbc.Error as e:
+            logger.debug(f"Error cerrando cursor preparado '{sentencia.nombre}': {e}")
+
+    def cerrar(self) -> None:
+        """Cierra todos los cursores (la conexión física se va a cerrar)."""
+        cursores, self._cursores = list(self._cursores.values()), {}
+        for cursor in cursores:
+            try:
+                cursor.close()
+            except pyodbc.Error:
+                pass
+
+    def __len__(self) -> int:
+        return len(self._cursores)
+
+
+def sentencias_stats() -> Dict[str, object]:
+    with _lock:
+        por_sentencia = {
+            nombre: {"preparaciones": preparaciones, "reutilizaciones": reutilizaciones}
+            for nombre, (preparaciones, reutilizaciones) in _contadores.items()
+        }
+        descartadas = _descartadas_total
+    return {
+        "preparaciones_total": sum(s["preparaciones"] for s in por_sentencia.values()),
+        "reutilizaciones_total": sum(s["reutilizaciones"] for s in por_sentencia.values()),
+        "descartadas_total": descartadas,
+        "por_sentencia": por_sentencia,
+    }
@@ -0,0 +1,91 @@
+# app/db/versiones.py
+"""
+Versiones compartidas por todos los workers (ver database.md):
+
+- dbo.version_recurso: un contador BIGINT por recurso ('menus', 'areas',
+  'roles', 'permisos', 'usuarios').
+- usuario.version_permisos: contador por usuario que sube con cada cambio de
+  su perfil, estado o roles (es el 'pv' de los tokens autocontenidos).
+
+Los escritores las incrementan en la MISMA transacción que su cambio, con un
+IncrementoVersiones que aceptan execute_insert / execute_update o llamando a
+aplicar(cursor) dentro de execute_transaction. Así una versión nueva nunca es
+visible antes que los datos que la motivan y, como sólo crecen, los lectores
+pueden comparar con '>=' sin riesgo de colisiones.
+"""
+from typing import Dict, Iterable
+
+import pyodbc
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Límite de valores por IN, por debajo de los 2100 parámetros de SQL Server
+_MAX_VALORES_IN = 1000
+
+# {placeholders} = "?, ?, ..." (uno por recurso)
+INCREMENTAR_VERSIONES_RECURSOS_TEMPLATE = """
+UPDATE dbo.version_recurso
+SET version = version + 1
+OUTPUT INSERTED.recurso, INSERTED.version
+WHERE recurso IN ({placeholders});
+"""
+
+# {placeholders} = "?, ?, ..." (uno por usuario_id)
+INCREMENTAR_VERSION_PERMISOS_USUARIOS_TEMPLATE = """
+UPDATE dbo.usuario
+SET version_permisos = version_permisos + 1
+WHERE usuario_id IN ({placeholders});
+"""
+
+# Todos los usuarios que tienen (o tuvieron) asignado el rol
+INCREMENTAR_VERSION_PERMISOS_POR_ROL = """
+UPDATE u
+SET version_permisos = u.version_permisos + 1
+FROM dbo.usuario u
+WHERE EXISTS (
+    SELECT 1 FROM dbo.usuario_rol ur
+    WHERE ur.usuario_id = u.usuario_id AND ur.rol_id = ?
+);
+"""
+
+
+class IncrementoVersiones:
+    """
+    Versiones que una escritura incrementa dentro de su transacción.
+
+    - recursos: filas de dbo.version_recurso.
+    - usuarios: version_permisos de esos usuarios.
+    - roles: version_permisos de los usuarios que tienen esos roles.
+
+    Tras aplicar(), 'nuevas' tiene la versión resultante de cada recurso.
+    """
+
+    __slots__ = ("recursos", "usuarios", "roles", "nuevas")
+
+    def __init__(self, *recursos: str, usuarios: Iterable[int] = (), roles: Iterable[int] = ()):
+        self.recursos = tuple(dict.fromkeys(recursos))
+        self.usuarios = tuple(dict.fromkeys(usuarios))
+        self.roles = tuple(dict.fromkeys(roles))
+        self.nuevas: Dict[str, int] = {}
+
+    def aplicar(self, cursor: pyodbc.Cursor) -> None:
+        """Ejecuta los incrementos con 'cursor' (antes del commit de su transacción)."""
+        if self.recursos:
+            cursor.execute(
+                INCREMENTAR_VERSIONES_RECURSOS_TEMPLATE.format(placeholders=", ".join("?" * len(self.recursos))),
+                self.recursos
+            )
+            self.nuevas = {recurso: version for recurso, version in cursor.fetchall()}
+            faltantes = [recurso for recurso in self.recursos if recurso not in self.nuevas]
+            if faltantes:
+                logger.warning(f"Recursos sin fila en dbo.version_recurso (ver database.md), su versión no cambia: {faltantes}")
+        for inicio in range(0, len(self.usuarios), _MAX_VALORES_IN):
+            lote = self.usuarios[inicio:inicio + _MAX_VALORES_IN]
+            cursor.execute(
+                INCREMENTAR_VERSION_PERMISOS_USUARIOS_TEMPLATE.format(placeholders=", ".join("?" * len(lote))),
+                lote
+            )
+        for rol_id in self.roles:
+            cursor.execute(INCREMENTAR_VERSION_PERMISOS_POR_ROL, (rol_id,))
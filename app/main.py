@@ -1,11 +1,29 @@
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from app.core.config import settings
 from app.core.exceptions import configure_exception_handlers
 from app.api.v1.api import api_router
-from app.db.connection import get_db_connection
+from app.api.deps import RoleChecker
+from app.db.connection import get_db_connection, get_pool, close_all_pools, pools_stats, DatabaseConnection
+from app.db.async_queries import run_in_db_executor, shutdown_db_executor
+from app.db.sentencias import sentencias_stats
 from app.core.logging_config import setup_logging
+from app.utils.single_flight import single_flight_stats
+from app.utils.costura_cache import cache_eficiencia_diaria
+from app.services import administracion_service, costura_service
+from app.core.auth_cache import usuario_activo_cache
+from app.utils.menu_cache import menu_por_roles_cache
+from app.utils.etag import etag_stats
+from app.core.versiones_cache import versiones_stats
+from app.utils.paginacion import conteo_cache
+from app.core.permisos_cache import iniciar_refresco_permisos, detener_refresco_permisos, indice_permisos_stats
+from app.core.busqueda_usuarios import (
+    iniciar_refresco_busqueda_usuarios, detener_refresco_busqueda_usuarios, busqueda_usuarios_stats
+)
+from app.core.security import warm_up_password_executor, shutdown_password_executor, password_executor_stats
+from contextlib import asynccontextmanager
+import asyncio
 import logging
 from typing import Any
 
@@ -13,6 +31,42 @@ from typing import Any
 setup_logging()
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Inicializa recursos compartidos al arrancar y los libera al apagar.
+    """
+    # Pre-abrir las conexiones mínimas del pool principal (no bloquea el arranque si falla)
+    try:
+        await run_in_db_executor(get_pool(DatabaseConnection.DEFAULT).warm_up)
+    except Exception as e:
+        logger.warning(f"No se pudo pre-calentar el pool de conexiones: {str(e)}")
+
+    # Arrancar los procesos de bcrypt antes del primer login
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, warm_up_password_executor)
+    except Exception as e:
+        logger.warning(f"No se pudo pre-calentar el pool de bcrypt: {str(e)}")
+
+    # Cargar y mantener fresco el snapshot de cuentas por cobrar y pagar
+    administracion_service.iniciar_refresco_cuentas()
+
+    # Cargar el índice de permisos rol × menú
+    iniciar_refresco_permisos()
+
+    # Cargar el índice de búsqueda de usuarios
+    iniciar_refresco_busqueda_usuarios()
+
+    yield
+
+    await administracion_service.detener_refresco_cuentas()
+    await detener_refresco_permisos()
+    await detener_refresco_busqueda_usuarios()
+    shutdown_db_executor()
+    shutdown_password_executor()
+    close_all_pools()
+    logger.info("Executors de BD y bcrypt y pools de conexiones cerrados.")
+
 def create_application() -> FastAPI:
     """
     Crea y configura la aplicación FastAPI
@@ -22,7 +76,8 @@ def create_application() -> FastAPI:
         version=settings.VERSION,
         description=settings.DESCRIPTION,
         docs_url="/docs",
-        redoc_url="/redoc"
+        redoc_url="/redoc",
+        lifespan=lifespan
     )
 
     # Configurar CORS
@@ -64,18 +119,22 @@ async def root():
         "docs": "/docs"
     }
 
+def _probar_conexion_bd() -> bool:
+    """Toma y devuelve una conexión del pool (bloqueante: usar con run_in_db_executor)."""
+    with get_db_connection() as conn:
+        return conn is not None
+
 @app.get("/health")
 async def health_check():
     """
     Endpoint para verificar el estado de la aplicación y la conexión a la BD
     """
     try:
-        # Verificar conexión a la base de datos
-        with get_db_connection() as conn:
-            if conn:
-                db_status = "connected"
-            else:
-                db_status = "disconnected"
+        # Verificar conexión a la base de datos (fuera del event loop: puede esperar al pool o a la red)
+        if await run_in_db_executor(_probar_conexion_bd):
+            db_status = "connected"
+        else:
+            db_status = "disconnected"
     except Exception as e:
         logger.error(f"Error en health check: {str(e)}")
         db_status = "error"
@@ -86,15 +145,40 @@ async def health_check():
         "database": db_status
     }
 
+# Las métricas exponen tamaños de pools, claves de caché y nombres de sentencias: sólo administradores
+@app.get("/metrics", dependencies=[Depends(RoleChecker(["Administrador"]))])
+async def metrics():
+    """
+    Métricas internas: pools de conexiones, sentencias preparadas, llamadas coalescidas (single-flight),
+    caché diaria y streams del reporte de eficiencia, snapshot de cuentas, caché del
+    usuario autenticado, pool de bcrypt, índice de permisos, caché de menús,
+    ETags, versiones compartidas, conteos de los listados e índice de búsqueda de usuarios
+    """
+    return {
+        "pools": pools_stats(),
+        "sentencias_preparadas": sentencias_stats(),
+        "single_flight": single_flight_stats(),
+        "cache_eficiencia_diaria": cache_eficiencia_diaria.stats(),
+        "streaming_costura": costura_service.streaming_stats(),
+        "snapshot_cuentas_cobrar_pagar": administracion_service.snapshot_cuentas_stats(),
+        "cache_usuario_autenticado": usuario_activo_cache.stats(),
+        "pool_bcrypt": password_executor_stats(),
+        "indice_permisos": indice_permisos_stats(),
+        "indice_busqueda_usuarios": busqueda_usuarios_stats(),
+        "cache_menu_por_roles": menu_por_roles_cache.stats(),
+        "etag": etag_stats(),
+        "versiones_recursos": versiones_stats(),
+        "conteo_paginacion": conteo_cache.stats(),
+    }
+
 # Para compatibilidad con el código existente
 @app.get("/api/test")
 async def test_db():
     try:
-        with get_db_connection() as conn:
-            if conn:
-                return {"message": "Conexión exitosa"}
-            else:
-                return {"error": "Conexión fallida: objeto de conexión es None"}
+        if await run_in_db_executor(_probar_conexion_bd):
+            return {"message": "Conexión exitosa"}
+        else:
+            return {"error": "Conexión fallida: objeto de conexión es None"}
     except Exception as e:
         import traceback
         return {
@@ -1,5 +1,5 @@
 # app/schemas/administracion.py
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 from typing import Optional, List
 from pydantic import BaseModel, Field
@@ -38,7 +38,41 @@ class CuentaCobrarPagarResponse(BaseModel):
     status: bool = True
     message: str = "Proceso ejecutado correctamente"
     data: List[CuentaCobrarPagarBase]
+    as_of: Optional[datetime] = Field(None, description="Momento (UTC) en que se leyeron los datos del SP.")
+    total: Optional[int] = Field(None, description="Total de cuentas que cumplen los filtros (sólo en consultas filtradas o paginadas).")
+    siguiente_cursor: Optional[str] = Field(None, description="Cursor para pedir la siguiente página; null si no hay más.")
     debug_note: Optional[str] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+# --- Resumen (antigüedad de saldos y totales) ---
+class GrupoResumenCuentasSchema(BaseModel):
+    # Sólo vienen informadas las dimensiones del grupo; los importes suman pendiente_cobrar
+    tipo_cuenta: str
+    moneda: Optional[str] = None
+    empresa: Optional[str] = None
+    codigo_responsable: Optional[str] = None
+    responsable: Optional[str] = None
+
+    cantidad: int = 0
+    total_pendiente: Decimal = Decimal(0)
+    por_vencer: Decimal = Decimal(0)
+    vencido_0_30: Decimal = Decimal(0)
+    vencido_31_60: Decimal = Decimal(0)
+    vencido_61_90: Decimal = Decimal(0)
+    vencido_mas_90: Decimal = Decimal(0)
+    sin_vencimiento: Decimal = Decimal(0)
+
+class ResumenCuentasCobrarPagarResponse(BaseModel):
+    status: bool = True
+    message: str = "Resumen de cuentas por cobrar y pagar generado correctamente"
+    as_of: Optional[datetime] = Field(None, description="Momento (UTC) en que se leyeron los datos del SP.")
+    fecha_referencia: date = Field(..., description="Fecha contra la que se calculan los días vencidos.")
+    por_moneda: List[GrupoResumenCuentasSchema]
+    por_empresa: List[GrupoResumenCuentasSchema]
+    por_responsable: List[GrupoResumenCuentasSchema]
+
+    class Config:
+        from_attributes = True
@@ -41,8 +41,9 @@ class AreaSimpleList(BaseModel):
 # --- Schema para la Respuesta Paginada ---
 class PaginatedAreaResponse(BaseModel):
     areas: List[AreaRead]
-    total_areas: int
-    pagina_actual: int
-    total_paginas: int
+    total_areas: Optional[int] = None
+    pagina_actual: Optional[int] = None
+    total_paginas: Optional[int] = None
+    siguiente_cursor: Optional[str] = None
 
 
@@ -45,4 +45,34 @@ class ReporteEficienciaCosturaResponseSchema(BaseModel):
     debug_note: Optional[str] = Field(None, description="Nota adicional para debugging, por ejemplo, si los datos fueron limitados.")
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+# --- Esquemas para el reporte agrupado (group_by) ---
+class GrupoEficienciaCosturaSchema(BaseModel):
+    # Sólo vienen informadas las dimensiones incluidas en group_by
+    linea: Optional[str] = None
+    bloque: Optional[str] = None
+    codigo_trabajador: Optional[str] = None
+    codigo_operacion: Optional[str] = None
+    fecha_proceso: Optional[date] = None
+
+    cantidad_registros: int
+    total_prendas_producidas: int
+    total_minutos_producidos: float
+    total_minutos_disponibles: float # Minutos disponibles únicos por (trabajador, fecha) dentro del grupo
+    eficiencia_porcentaje: float
+
+
+class ReporteEficienciaAgrupadoResponseSchema(BaseModel):
+    fecha_inicio_reporte: date
+    fecha_fin_reporte: date
+    agrupado_por: List[str]
+    grupos: List[GrupoEficienciaCosturaSchema]
+    total_prendas_producidas_periodo: Optional[int] = None
+    total_minutos_producidos_periodo: Optional[float] = None
+    total_minutos_disponibles_periodo: Optional[float] = None
+    eficiencia_promedio_general_periodo: Optional[float] = None
+
+    class Config:
+        from_attributes = True
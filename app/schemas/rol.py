@@ -31,9 +31,10 @@ class RolRead(RolBase):
 class PaginatedRolResponse(BaseModel):
     """Schema para la respuesta paginada de roles."""
     roles: List[RolRead] = Field(..., description="Lista de roles para la página actual")
-    total_roles: int = Field(..., gt=-1, description="Número total de roles que coinciden con la búsqueda/filtros")
-    pagina_actual: int = Field(..., gt=0, description="Número de la página actual devuelta")
-    total_paginas: int = Field(..., gt=-1, description="Número total de páginas disponibles")
+    total_roles: Optional[int] = Field(None, gt=-1, description="Número total de roles que coinciden con la búsqueda/filtros (None si incluir_total=false)")
+    pagina_actual: Optional[int] = Field(None, gt=0, description="Número de la página actual devuelta (None en paginación por cursor)")
+    total_paginas: Optional[int] = Field(None, gt=-1, description="Número total de páginas disponibles (None si incluir_total=false)")
+    siguiente_cursor: Optional[str] = Field(None, description="Cursor para pedir la página siguiente; None si no hay más")
 
 class PermisoBase(BaseModel):
     """Schema base para la información de permiso sobre un menú."""
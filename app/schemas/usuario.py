@@ -48,7 +48,27 @@ class UsuarioReadWithRoles(UsuarioRead):
 class PaginatedUsuarioResponse(BaseModel):
     """Schema para la respuesta paginada de la lista de usuarios."""
     usuarios: List[UsuarioReadWithRoles]
-    total_usuarios: int
-    pagina_actual: int
-    total_paginas: int
+    # None si se pidió incluir_total=false
+    total_usuarios: Optional[int] = None
+    # None en paginación por cursor
+    pagina_actual: Optional[int] = None
+    total_paginas: Optional[int] = None
+    siguiente_cursor: Optional[str] = None
+
+# --- IMPORTACIÓN MASIVA ---
+class UsuarioImportResultadoFila(BaseModel):
+    """Resultado de una fila de la importación masiva."""
+    fila: int = Field(..., description="Número de fila (1 = primer usuario del archivo/lista)")
+    nombre_usuario: Optional[str] = None
+    correo: Optional[str] = None
+    creado: bool
+    usuario_id: Optional[int] = None
+    error: Optional[str] = None
+
+class UsuarioImportResponse(BaseModel):
+    """Resumen de la importación masiva de usuarios."""
+    total_filas: int
+    creados: int
+    con_error: int
+    resultados: List[UsuarioImportResultadoFila]
 # Podrías tener otros schemas como UsuarioInDB, etc., si los necesitas
\ No newline at end of file
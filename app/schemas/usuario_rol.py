@@ -1,6 +1,7 @@
 # app/schemas/usuario_rol.py
 from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import List
 
 class UsuarioRolBase(BaseModel):
     """Schema base para la relación usuario-rol."""
@@ -17,6 +18,20 @@ class UsuarioRolUpdate(BaseModel):
     """Schema para actualizar el estado de la asignación (activar/desactivar)."""
     es_activo: bool
 
+class UsuarioRolMasivoRequest(BaseModel):
+    """Asignación o revocación de varios roles a varios usuarios (producto cartesiano)."""
+    usuario_ids: List[int] = Field(..., min_length=1, max_length=1000, description="IDs de los usuarios")
+    rol_ids: List[int] = Field(..., min_length=1, max_length=100, description="IDs de los roles")
+
+class UsuarioRolMasivoResponse(BaseModel):
+    """Resumen de una asignación o revocación masiva."""
+    usuarios: int = Field(..., description="Usuarios distintos de la solicitud")
+    roles: int = Field(..., description="Roles distintos de la solicitud")
+    creadas: int = Field(0, description="Asignaciones nuevas")
+    reactivadas: int = Field(0, description="Asignaciones inactivas que se reactivaron")
+    desactivadas: int = Field(0, description="Asignaciones activas que se revocaron")
+    sin_cambios: int = Field(0, description="Pares usuario-rol que ya estaban en el estado pedido")
+
 class UsuarioRolRead(UsuarioRolBase):
     """Schema para leer datos de la asignación usuario-rol."""
     usuario_rol_id: int = Field(..., description="ID único de la asignación")
@@ -1,12 +1,20 @@
 # app/services/administracion_service.py
-import asyncio
 import time
+from datetime import date, datetime
 from decimal import Decimal
-from typing import List, Dict, Any
-from app.db.queries import execute_procedure
+from typing import AsyncIterator, List, Dict, Any, Optional
+from pydantic import TypeAdapter
+from app.db.async_queries import aiter_procedure_params
 from app.db.connection import DatabaseConnection
-from app.schemas.administracion import CuentaCobrarPagarBase
+from app.schemas.administracion import (
+    CuentaCobrarPagarBase, CuentaCobrarPagarResponse,
+    GrupoResumenCuentasSchema, ResumenCuentasCobrarPagarResponse
+)
 from app.core.exceptions import ServiceError
+from app.utils.single_flight import get_single_flight
+from app.utils.snapshot_cache import Snapshot, SnapshotCache
+from app.utils.indice_cuentas import IndiceCuentas, parsear_orden
+from app.core.config import settings
 try:
     from app.core.exceptions import DatabaseError
 except ImportError:
@@ -16,73 +24,285 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+_SP_CUENTAS_COBRAR_PAGAR = "dbo.sp_administracion_obtener_cuentas_cobrar_pagar"
+_single_flight = get_single_flight("administracion")
+
+def _construir_cuenta(row: Dict[str, Any]) -> CuentaCobrarPagarBase:
+    moneda = row['moneda'] if row['moneda'] is not None else ""
+
+    return CuentaCobrarPagarBase(
+        tipo_cuenta=row['tipo_cuenta'],
+        codigo_cliente_proveedor=row['codigo_cliente_proveedor'],
+        cliente_proveedor=row['cliente_proveedor'],
+        cuenta_contable=row['cuenta_contable'],
+        tipo_comprobante=row['tipo_comprobante'],
+        serie_comprobante=row['serie_comprobante'],
+        numero_comprobante=row['numero_comprobante'],
+        fecha_comprobante=row['fecha_comprobante'],
+        tipo_cambio=Decimal(str(row['tipo_cambio'])) if row['tipo_cambio'] else None,
+        moneda=moneda,
+        importe_soles=Decimal(str(row['importe_soles'])) if row['importe_soles'] else None,
+        importe_dolares=Decimal(str(row['importe_dolares'])) if row['importe_dolares'] else None,
+        importe_moneda_funcional=Decimal(str(row['importe_moneda_funcional'])) if row['importe_moneda_funcional'] else None,
+        fecha_vencimiento=row['fecha_vencimiento'],
+        fecha_ultimo_pago=row['fecha_ultimo_pago'],
+        tipo_venta=row['tipo_venta'],
+        usuario=row['usuario'],
+        observacion=row['observacion'],
+        descripcion_comprobante=row['descripcion_comprobante'],
+        servicio=row['servicio'],
+        importe_original=Decimal(str(row['importe_original'])) if row['importe_original'] else None,
+        codigo_responsable=row['codigo_responsable'],
+        responsable=row['responsable'],
+        empresa=row['empresa'],
+        ruta_comprobante_pdf=row['ruta_comprobante_pdf'],
+        semana=row['semana'],
+        semana_ajustada=row['semana_ajustada'],
+        pendiente_cobrar=row['pendiente_cobrar']
+    )
+
+async def iterar_cuentas_cobrar_pagar() -> AsyncIterator[List[CuentaCobrarPagarBase]]:
+    """
+    Lee el SP en lotes (fetchmany) y entrega cada lote ya convertido a
+    CuentaCobrarPagarBase, sin materializar todas las filas crudas.
+    """
+    logger.debug(f"Servicio Administración: Llamando SP (streaming): {_SP_CUENTAS_COBRAR_PAGAR}")
+
+    fila_idx = 0
+    async for raw_batch in aiter_procedure_params(_SP_CUENTAS_COBRAR_PAGAR, {}, DatabaseConnection.ADMIN):
+        cuentas_lote: List[CuentaCobrarPagarBase] = []
+        for row in raw_batch:
+            try:
+                cuentas_lote.append(_construir_cuenta(row))
+            except Exception as e:
+                logger.error(f"Servicio Administración: Error procesando fila #{fila_idx}: {row}. Error: {e}", exc_info=True)
+            fila_idx += 1
+        if cuentas_lote:
+            yield cuentas_lote
+
+    logger.info(f"Servicio Administración: Filas leídas del SP en streaming: {fila_idx}.")
+
+async def _cargar_cuentas_cobrar_pagar() -> List[CuentaCobrarPagarBase]:
+    # Las llamadas concurrentes comparten una sola ejecución del SP
+    return await _single_flight.ejecutar((_SP_CUENTAS_COBRAR_PAGAR,), _get_cuentas_cobrar_pagar)
+
+_ADAPTADOR_CUENTAS = TypeAdapter(List[CuentaCobrarPagarBase])
+
+def _cuentas_json(snapshot: Snapshot) -> bytes:
+    # JSON de todas las cuentas, serializado una sola vez por snapshot
+    return snapshot.derivado("cuentas_json", _ADAPTADOR_CUENTAS.dump_json)
+
+def _indice_cuentas(snapshot: Snapshot) -> IndiceCuentas:
+    return snapshot.derivado("indice", IndiceCuentas)
+
+def _tramo_antiguedad(fecha_vencimiento: Optional[datetime], hoy: date) -> str:
+    if fecha_vencimiento is None:
+        return "sin_vencimiento"
+    dias = (hoy - fecha_vencimiento.date()).days
+    if dias < 0:
+        return "por_vencer"
+    if dias <= 30:
+        return "vencido_0_30"
+    if dias <= 60:
+        return "vencido_31_60"
+    if dias <= 90:
+        return "vencido_61_90"
+    return "vencido_mas_90"
+
+def _calcular_resumen(cuentas: List[CuentaCobrarPagarBase], hoy: date) -> Dict[str, List[GrupoResumenCuentasSchema]]:
+    """
+    Antigüedad de saldos y totales por moneda, empresa y responsable en una sola
+    pasada. Suma pendiente_cobrar (Decimal, exacto) de las cuentas con saldo
+    distinto de cero, siempre separando por tipo_cuenta y moneda.
+    """
+    por_moneda: Dict[tuple, Dict[str, Any]] = {}
+    por_empresa: Dict[tuple, Dict[str, Any]] = {}
+    por_responsable: Dict[tuple, Dict[str, Any]] = {}
+    tramos = ("por_vencer", "vencido_0_30", "vencido_31_60", "vencido_61_90", "vencido_mas_90", "sin_vencimiento")
+
+    def acumular(grupos: Dict[tuple, Dict[str, Any]], clave: tuple, dimensiones: Dict[str, Any], tramo: str, importe: Decimal) -> None:
+        grupo = grupos.get(clave)
+        if grupo is None:
+            grupo = dict(dimensiones, cantidad=0, total_pendiente=Decimal(0), **{t: Decimal(0) for t in tramos})
+            grupos[clave] = grupo
+        grupo["cantidad"] += 1
+        grupo["total_pendiente"] += importe
+        grupo[tramo] += importe
+
+    for cuenta in cuentas:
+        importe = cuenta.pendiente_cobrar
+        if not importe:
+            continue
+        tramo = _tramo_antiguedad(cuenta.fecha_vencimiento, hoy)
+        tipo, moneda = cuenta.tipo_cuenta, cuenta.moneda
+        acumular(por_moneda, (tipo, moneda), {"tipo_cuenta": tipo, "moneda": moneda}, tramo, importe)
+        acumular(por_empresa, (tipo, cuenta.empresa, moneda),
+                 {"tipo_cuenta": tipo, "empresa": cuenta.empresa, "moneda": moneda}, tramo, importe)
+        acumular(por_responsable, (tipo, cuenta.codigo_responsable, moneda),
+                 {"tipo_cuenta": tipo, "codigo_responsable": cuenta.codigo_responsable,
+                  "responsable": cuenta.responsable, "moneda": moneda}, tramo, importe)
+
+    def a_lista(grupos: Dict[tuple, Dict[str, Any]]) -> List[GrupoResumenCuentasSchema]:
+        # Orden estable para el dashboard; los nulos al final
+        claves = sorted(grupos, key=lambda c: tuple((v is None, v or "") for v in c))
+        return [GrupoResumenCuentasSchema(**grupos[c]) for c in claves]
+
+    return {
+        "por_moneda": a_lista(por_moneda),
+        "por_empresa": a_lista(por_empresa),
+        "por_responsable": a_lista(por_responsable),
+    }
+
+def _resumen_cuentas(snapshot: Snapshot, hoy: date) -> Dict[str, List[GrupoResumenCuentasSchema]]:
+    # Los tramos dependen del día: un derivado por fecha de referencia
+    return snapshot.derivado(f"resumen_{hoy.isoformat()}", lambda cuentas: _calcular_resumen(cuentas, hoy))
+
+def _precalcular_derivados(snapshot: Snapshot) -> None:
+    _cuentas_json(snapshot)
+    _indice_cuentas(snapshot)
+    _resumen_cuentas(snapshot, date.today())
+
+_snapshot_cuentas = SnapshotCache(
+    "cuentas_cobrar_pagar",
+    _cargar_cuentas_cobrar_pagar,
+    ttl_segundos=settings.CUENTAS_SNAPSHOT_TTL_SECONDS,
+    stale_segundos=settings.CUENTAS_SNAPSHOT_STALE_SECONDS,
+    al_cargar=_precalcular_derivados
+)
+
+async def obtener_snapshot_cuentas() -> Snapshot:
+    """
+    Snapshot en memoria de las cuentas por cobrar y pagar (ver SnapshotCache).
+    snapshot.datos es la lista compartida de CuentaCobrarPagarBase (no mutarla)
+    y snapshot.as_of el momento en que se leyó del SP.
+    """
+    return await _snapshot_cuentas.obtener()
+
 async def get_cuentas_cobrar_pagar() -> List[CuentaCobrarPagarBase]:
-    logger.info("Servicio Administración: Iniciando obtención de cuentas por cobrar y pagar.")
+    """
+    Cuentas por cobrar y pagar servidas desde el snapshot en memoria.
+    La lista es compartida entre solicitudes: no mutarla.
+    """
+    snapshot = await obtener_snapshot_cuentas()
+    return snapshot.datos
 
-    total_service_start_time = time.time()
+def serializar_respuesta_cuentas(snapshot: Snapshot, message: str, debug_note: Optional[str] = None) -> bytes:
+    """
+    JSON de CuentaCobrarPagarResponse con todas las cuentas del snapshot,
+    reutilizando el JSON de 'data' ya calculado en lugar de serializar cada fila.
+    """
+    sobre = CuentaCobrarPagarResponse(
+        status=True,
+        message=message,
+        data=[],
+        as_of=snapshot.as_of,
+        debug_note=debug_note
+    ).model_dump_json().encode()
+    return sobre.replace(b'"data":[]', b'"data":' + _cuentas_json(snapshot), 1)
 
+async def consultar_cuentas_cobrar_pagar(
+    tipo_cuenta: Optional[str] = None,
+    empresa: Optional[str] = None,
+    moneda: Optional[str] = None,
+    codigo_cliente_proveedor: Optional[str] = None,
+    vencimiento_desde: Optional[date] = None,
+    vencimiento_hasta: Optional[date] = None,
+    solo_pendientes: bool = False,
+    ordenar_por: Optional[str] = None,
+    limite: Optional[int] = None,
+    cursor: Optional[str] = None
+) -> CuentaCobrarPagarResponse:
+    """
+    Filtra, ordena y pagina las cuentas del snapshot usando su índice en memoria
+    (ver IndiceCuentas). Sin 'ordenar_por' se ordena por la identidad del comprobante.
+    """
+    if vencimiento_desde and vencimiento_hasta and vencimiento_desde > vencimiento_hasta:
+        raise ServiceError(status_code=400, detail="'vencimiento_desde' no puede ser posterior a 'vencimiento_hasta'.")
     try:
-        stored_procedure_name = "dbo.sp_administracion_obtener_cuentas_cobrar_pagar"
+        orden = parsear_orden(ordenar_por)
+    except ValueError as e:
+        raise ServiceError(status_code=400, detail=str(e))
 
-        logger.debug(f"Servicio Administración: Llamando SP: {stored_procedure_name}")
+    igualdad = {
+        campo: valor for campo, valor in (
+            ("tipo_cuenta", tipo_cuenta),
+            ("empresa", empresa),
+            ("moneda", moneda),
+            ("codigo_cliente_proveedor", codigo_cliente_proveedor),
+        ) if valor is not None
+    }
 
-        db_call_start_time = time.time()
-        raw_data_list: List[Dict[str, Any]] = await asyncio.to_thread(
-            execute_procedure,
-            stored_procedure_name,
-            DatabaseConnection.ADMIN
+    snapshot = await obtener_snapshot_cuentas()
+    try:
+        pagina, total, siguiente_cursor = _indice_cuentas(snapshot).consultar(
+            version=snapshot.as_of.isoformat(),
+            igualdad=igualdad,
+            vencimiento_desde=vencimiento_desde,
+            vencimiento_hasta=vencimiento_hasta,
+            solo_pendientes=solo_pendientes,
+            orden=orden,
+            limite=limite,
+            cursor=cursor
         )
-        db_call_end_time = time.time()
-        logger.info(f"Servicio Administración: Llamada a DB (asyncio.to_thread + execute_procedure) tomó: {db_call_end_time - db_call_start_time:.4f} segundos.")
-        logger.info(f"Servicio Administración: Datos crudos recibidos del SP: {len(raw_data_list)} filas.")
+    except ValueError as e:
+        raise ServiceError(status_code=400, detail=f"Cursor no válido: {e}")
 
-        if not raw_data_list:
-            logger.info("Servicio Administración: No se encontraron datos para el reporte.")
-            return []
+    logger.info(f"Servicio Administración: Consulta de cuentas con filtros {igualdad}, orden {orden}: {len(pagina)} de {total} cuentas.")
+    return CuentaCobrarPagarResponse(
+        status=True,
+        message="Cuentas por cobrar y pagar obtenidas correctamente",
+        data=pagina,
+        as_of=snapshot.as_of,
+        total=total,
+        siguiente_cursor=siguiente_cursor
+    )
+
+async def get_resumen_cuentas_cobrar_pagar() -> ResumenCuentasCobrarPagarResponse:
+    """
+    Resumen de antigüedad de saldos (0-30, 31-60, 61-90 y más de 90 días desde
+    fecha_vencimiento) y totales por moneda, empresa y responsable, calculado
+    una vez por snapshot.
+    """
+    snapshot = await obtener_snapshot_cuentas()
+    hoy = date.today()
+    resumen = _resumen_cuentas(snapshot, hoy)
+    return ResumenCuentasCobrarPagarResponse(
+        status=True,
+        message="Resumen de cuentas por cobrar y pagar generado correctamente",
+        as_of=snapshot.as_of,
+        fecha_referencia=hoy,
+        **resumen
+    )
+
+def iniciar_refresco_cuentas() -> None:
+    """Arranca el refresco periódico del snapshot (llamar desde el lifespan)."""
+    if settings.CUENTAS_SNAPSHOT_BACKGROUND_REFRESH:
+        _snapshot_cuentas.iniciar_refresco_periodico()
+
+async def detener_refresco_cuentas() -> None:
+    await _snapshot_cuentas.detener_refresco_periodico()
+
+def snapshot_cuentas_stats() -> Dict[str, Any]:
+    return _snapshot_cuentas.stats()
 
+async def _get_cuentas_cobrar_pagar() -> List[CuentaCobrarPagarBase]:
+    logger.info("Servicio Administración: Iniciando obtención de cuentas por cobrar y pagar.")
+
+    total_service_start_time = time.time()
+
+    try:
         python_processing_start_time = time.time()
 
         cuentas: List[CuentaCobrarPagarBase] = []
-        for i, row in enumerate(raw_data_list):
-            try:
-                moneda = row['moneda'] if row['moneda'] is not None else ""
-
-                cuenta = CuentaCobrarPagarBase(
-                    tipo_cuenta=row['tipo_cuenta'],
-                    codigo_cliente_proveedor=row['codigo_cliente_proveedor'],
-                    cliente_proveedor=row['cliente_proveedor'],
-                    cuenta_contable=row['cuenta_contable'],
-                    tipo_comprobante=row['tipo_comprobante'],
-                    serie_comprobante=row['serie_comprobante'],
-                    numero_comprobante=row['numero_comprobante'],
-                    fecha_comprobante=row['fecha_comprobante'],
-                    tipo_cambio=Decimal(str(row['tipo_cambio'])) if row['tipo_cambio'] else None,
-                    moneda=moneda,
-                    importe_soles=Decimal(str(row['importe_soles'])) if row['importe_soles'] else None,
-                    importe_dolares=Decimal(str(row['importe_dolares'])) if row['importe_dolares'] else None,
-                    importe_moneda_funcional=Decimal(str(row['importe_moneda_funcional'])) if row['importe_moneda_funcional'] else None,
-                    fecha_vencimiento=row['fecha_vencimiento'],
-                    fecha_ultimo_pago=row['fecha_ultimo_pago'],
-                    tipo_venta=row['tipo_venta'],
-                    usuario=row['usuario'],
-                    observacion=row['observacion'],
-                    descripcion_comprobante=row['descripcion_comprobante'],
-                    servicio=row['servicio'],
-                    importe_original=Decimal(str(row['importe_original'])) if row['importe_original'] else None,
-                    codigo_responsable=row['codigo_responsable'],
-                    responsable=row['responsable'],
-                    empresa=row['empresa'],
-                    ruta_comprobante_pdf=row['ruta_comprobante_pdf'],
-                    semana=row['semana'],
-                    semana_ajustada=row['semana_ajustada'],
-                    pendiente_cobrar=row['pendiente_cobrar']
-                )
-                cuentas.append(cuenta)
-            except Exception as e:
-                logger.error(f"Servicio Administración: Error procesando fila #{i}: {row}. Error: {e}", exc_info=True)
+        async for cuentas_lote in iterar_cuentas_cobrar_pagar():
+            cuentas.extend(cuentas_lote)
+
+        if not cuentas:
+            logger.info("Servicio Administración: No se encontraron datos para el reporte.")
+            return []
 
         python_processing_end_time = time.time()
-        logger.info(f"Servicio Administración: Procesamiento de datos en Python tomó: {python_processing_end_time - python_processing_start_time:.4f} segundos.")
+        logger.info(f"Servicio Administración: Lectura en streaming del SP y procesamiento tomó: {python_processing_end_time - python_processing_start_time:.4f} segundos.")
 
         total_service_end_time = time.time()
         logger.info(f"Servicio Administración: Tiempo total de ejecución de get_cuentas_cobrar_pagar: {total_service_end_time - total_service_start_time:.4f} segundos.")
@@ -6,16 +6,20 @@ import logging
 from app.schemas.area import AreaSimpleList
 
 # Ajusta las rutas de importación según tu estructura
+from app.db.async_queries import aexecute_query, aexecute_insert, aexecute_update
 from app.db.queries import (
-    execute_query, execute_insert, execute_update,
     # Importa las NUEVAS queries (asegúrate que COUNT_AREAS_QUERY tenga alias 'total_count')
-    GET_AREAS_PAGINATED_QUERY, COUNT_AREAS_QUERY, GET_AREA_BY_ID_QUERY,
+    GET_AREAS_PAGINATED_QUERY, GET_AREAS_KEYSET_QUERY, COUNT_AREAS_QUERY, GET_AREA_BY_ID_QUERY,
     CHECK_AREA_EXISTS_BY_NAME_QUERY, CREATE_AREA_QUERY,
     UPDATE_AREA_BASE_QUERY_TEMPLATE, TOGGLE_AREA_STATUS_QUERY,GET_ACTIVE_AREAS_SIMPLE_LIST_QUERY
 )
+from app.db.versiones import IncrementoVersiones
 # Importa los schemas necesarios
 from app.schemas.area import AreaCreate, AreaUpdate, AreaRead, PaginatedAreaResponse
 from app.core.exceptions import ServiceError # Usa tu excepción personalizada
+from app.utils.menu_cache import menu_por_roles_cache
+from app.utils.etag import incrementar_version, RECURSO_AREAS
+from app.utils.paginacion import codificar_cursor, decodificar_cursor, conteo_cache
 
 logger = logging.getLogger(__name__)
 
@@ -37,7 +41,7 @@ class AreaService:
         params = (nombre.lower(), id_a_excluir)
         try:
             # Llama a execute_query SIN fetch_one.
-            resultado_lista = execute_query(CHECK_AREA_EXISTS_BY_NAME_QUERY, params)
+            resultado_lista = await aexecute_query(CHECK_AREA_EXISTS_BY_NAME_QUERY, params)
             if resultado_lista:
                 # Accede al primer (y único) diccionario y luego al valor 'count'
                 return resultado_lista[0].get('count', 0) > 0
@@ -66,11 +70,12 @@ class AreaService:
                 area_data.es_activo
             )
             # Asume que execute_insert devuelve un diccionario del registro creado
-            resultado_insert = execute_insert(CREATE_AREA_QUERY, params)
+            resultado_insert = await aexecute_insert(CREATE_AREA_QUERY, params, versiones=IncrementoVersiones(RECURSO_AREAS))
             if not resultado_insert:
                  raise ServiceError(status_code=500, detail="La inserción del área no devolvió el registro creado.")
 
             created_area = AreaRead(**resultado_insert)
+            incrementar_version(RECURSO_AREAS)
             logger.info(f"Área '{created_area.nombre}' creada con ID: {created_area.area_id}")
             return created_area
 
@@ -91,7 +96,7 @@ class AreaService:
         try:
             # Llama a execute_query SIN fetch_one.
             # Asume que devuelve una lista de diccionarios.
-            resultado_lista = execute_query(GET_AREA_BY_ID_QUERY, (area_id,))
+            resultado_lista = await aexecute_query(GET_AREA_BY_ID_QUERY, (area_id,))
             # Si la lista no está vacía, toma el primer diccionario
             if resultado_lista:
                 return AreaRead(**resultado_lista[0])
@@ -108,48 +113,81 @@ class AreaService:
     async def obtener_areas_paginadas(
         skip: int = 0,
         limit: int = 10,
-        search: Optional[str] = None
+        search: Optional[str] = None,
+        cursor: Optional[str] = None,
+        incluir_total: bool = True
     ) -> PaginatedAreaResponse:
-        """Obtiene una lista paginada y filtrada de áreas desde 'area_menu'."""
-        logger.info(f"Obteniendo áreas paginadas: skip={skip}, limit={limit}, search='{search}'")
+        """
+        Obtiene una lista paginada y filtrada de áreas desde 'area_menu'.
+
+        Con 'cursor' pagina por keyset sobre area_id (ignora 'skip'); con
+        incluir_total=False no se cuenta el total. El conteo se cachea unos segundos.
+        """
+        logger.info(f"Obteniendo áreas paginadas: skip={skip}, limit={limit}, search='{search}', cursor={'sí' if cursor else 'no'}")
+        ultimo_id = None
+        if cursor:
+            try:
+                ultimo_id = decodificar_cursor(cursor, search)
+            except ValueError as e:
+                raise ServiceError(status_code=400, detail=f"Cursor de paginación no válido: {e}.")
+
         search_param = f"%{search}%" if search else None
         where_params = (search, search_param, search_param)
-        total_count = 0
+        total_count = None
         areas_lista: List[AreaRead] = []
 
-        try:
-            # 1. Obtener el conteo total filtrado
+        async def contar_areas() -> int:
             # Llama a execute_query SIN fetch_one.
             # Asume que devuelve una lista con un diccionario: [{'total_count': N}]
-            count_result_list = execute_query(COUNT_AREAS_QUERY, where_params)
+            count_result_list = await aexecute_query(COUNT_AREAS_QUERY, where_params)
             if count_result_list:
                 # Accede al primer diccionario y obtiene 'total_count'
-                total_count = count_result_list[0].get('total_count', 0)
-            else:
-                 logger.warning("La consulta COUNT_AREAS_QUERY no devolvió resultados.")
-                 total_count = 0 # Asegura que sea 0 si no hay resultado
-
-            # 2. Obtener los datos paginados si hay resultados y el límite es > 0
-            if total_count > 0 and limit > 0:
-                pagination_params = where_params + (skip, limit)
-                # execute_query sin fetch_one devuelve una lista de diccionarios
-                rows = execute_query(GET_AREAS_PAGINATED_QUERY, pagination_params)
-                if rows:
-                    for row_dict in rows:
-                        try:
-                            areas_lista.append(AreaRead(**row_dict))
-                        except Exception as map_err:
-                            logger.error(f"Error al mapear fila de área a AreaRead: {map_err}. Fila: {row_dict}", exc_info=True)
+                return count_result_list[0].get('total_count', 0)
+            logger.warning("La consulta COUNT_AREAS_QUERY no devolvió resultados.")
+            return 0 # Asegura que sea 0 si no hay resultado
+
+        try:
+            # 1. Obtener el conteo total filtrado (opcional, cacheado)
+            if incluir_total:
+                total_count = await conteo_cache.obtener(RECURSO_AREAS, search, contar_areas)
+
+            # 2. Obtener los datos paginados si puede haber resultados y el límite es > 0
+            rows = []
+            hay_siguiente = False
+            if total_count != 0 and limit > 0:
+                if ultimo_id is not None:
+                    # Un área de más para saber si hay página siguiente
+                    rows = await aexecute_query(GET_AREAS_KEYSET_QUERY, (limit + 1, ultimo_id) + where_params) or []
+                    hay_siguiente = len(rows) > limit
+                    rows = rows[:limit]
+                else:
+                    pagination_params = where_params + (skip, limit)
+                    # execute_query sin fetch_one devuelve una lista de diccionarios
+                    rows = await aexecute_query(GET_AREAS_PAGINATED_QUERY, pagination_params) or []
+                    hay_siguiente = skip + limit < total_count if total_count is not None else len(rows) >= limit
+                for row_dict in rows:
+                    try:
+                        areas_lista.append(AreaRead(**row_dict))
+                    except Exception as map_err:
+                        logger.error(f"Error al mapear fila de área a AreaRead: {map_err}. Fila: {row_dict}", exc_info=True)
 
             # 3. Calcular detalles de paginación
-            total_pages = math.ceil(total_count / limit) if limit > 0 else 0
-            current_page = (skip // limit) + 1 if limit > 0 else 1
+            total_pages = None
+            if total_count is not None:
+                total_pages = math.ceil(total_count / limit) if limit > 0 else 0
+            current_page = None
+            if ultimo_id is None:
+                current_page = (skip // limit) + 1 if limit > 0 else 1
+            siguiente_cursor = None
+            if hay_siguiente and rows:
+                siguiente_cursor = codificar_cursor(rows[-1]['area_id'], search)
 
             return PaginatedAreaResponse(
                 areas=areas_lista,
                 total_areas=total_count,
                 pagina_actual=current_page,
-                total_paginas=total_pages
+                total_paginas=total_pages,
+                siguiente_cursor=siguiente_cursor
             )
         except KeyError:
              # Error si el alias 'total_count' no está presente
@@ -196,7 +234,10 @@ class AreaService:
             # --- Punto Crítico: Salida de execute_update ---
             # Asume que execute_update devuelve un diccionario del registro actualizado
             # Si devuelve otra cosa (ej. None o número de filas), esta parte fallará.
-            resultado_update = execute_update(update_query, tuple(params_list))
+            resultado_update = await aexecute_update(update_query, tuple(params_list), versiones=IncrementoVersiones(RECURSO_AREAS))
+            # El nombre y el estado del área van en el menú de navegación
+            menu_por_roles_cache.invalidar("área actualizada")
+            incrementar_version(RECURSO_AREAS)
             if not resultado_update:
                  # Si execute_update NO devuelve el diccionario, necesitas obtenerlo después
                  logger.warning(f"execute_update no devolvió el registro actualizado para ID {area_id}. Intentando obtenerlo de nuevo.")
@@ -239,7 +280,9 @@ class AreaService:
 
             # --- Punto Crítico: Salida de execute_update ---
             # Asume que execute_update devuelve un diccionario del registro actualizado
-            resultado_toggle = execute_update(TOGGLE_AREA_STATUS_QUERY, (activar, area_id))
+            resultado_toggle = await aexecute_update(TOGGLE_AREA_STATUS_QUERY, (activar, area_id), versiones=IncrementoVersiones(RECURSO_AREAS))
+            menu_por_roles_cache.invalidar(f"área {'reactivada' if activar else 'desactivada'}")
+            incrementar_version(RECURSO_AREAS)
             if not resultado_toggle:
                 # Si execute_update NO devuelve el diccionario
                 logger.warning(f"execute_update no devolvió el registro actualizado al {accion} ID {area_id}. Intentando obtenerlo de nuevo.")
@@ -272,7 +315,7 @@ class AreaService:
         logger.info("Obteniendo lista simple de áreas activas desde el servicio.")
         try:
             # Llama a execute_query SIN fetch_one, espera lista de dicts
-            rows = execute_query(GET_ACTIVE_AREAS_SIMPLE_LIST_QUERY)
+            rows = await aexecute_query(GET_ACTIVE_AREAS_SIMPLE_LIST_QUERY)
             if not rows:
                 logger.info("No se encontraron áreas activas para la lista simple.")
                 return []
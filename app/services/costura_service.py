@@ -1,15 +1,23 @@
 # app/services/costura_service.py
 import asyncio
 import time
-import json # --- NUEVO ---
-from datetime import date
-from typing import List, Dict, Any
-from app.db.queries import execute_procedure_params
+import json
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple, Union
+from app.db.async_queries import aiter_procedure_params_filas
 from app.schemas.costura import (
     EficienciaCosturaItemSchema,
-    ReporteEficienciaCosturaResponseSchema
+    ReporteEficienciaCosturaResponseSchema,
+    ReporteEficienciaAgrupadoResponseSchema
 )
+from app.core.config import settings
 from app.core.exceptions import ServiceError
+from app.utils.costura_cache import cache_eficiencia_diaria
+from app.utils.single_flight import get_single_flight
+from app.utils.eficiencia_costura import (
+    AcumuladorAgrupadoEficiencia, AcumuladorTotalesEficiencia, LoteColumnarEficiencia,
+    DIMENSIONES_AGRUPACION, procesar_fila_eficiencia
+)
 try:
     from app.core.exceptions import DatabaseError
 except ImportError:
@@ -19,34 +27,431 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+_SP_EFICIENCIA = "dbo.sp_costura_eficiencia_web"
+_single_flight = get_single_flight("costura")
+
+# Un reporte en streaming retiene su conexión del pool hasta que el cliente
+# termina de descargar: se limitan muy por debajo de DB_POOL_MAX_SIZE para que
+# unas pocas descargas lentas no dejen sin conexiones al resto de la API.
+_MAX_STREAMS = settings.COSTURA_STREAM_MAX_CONCURRENT or max(1, settings.DB_POOL_MAX_SIZE // 4)
+_streams_disponibles = asyncio.Semaphore(_MAX_STREAMS)
+_streams_activos = 0
+_streams_rechazados_total = 0
+
+
+class CupoStreaming:
+    """Lugar reservado para un reporte en streaming; liberar() es idempotente."""
+
+    def __init__(self):
+        self._liberado = False
+
+    def liberar(self) -> None:
+        global _streams_activos
+        if not self._liberado:
+            self._liberado = True
+            _streams_activos -= 1
+            _streams_disponibles.release()
+
+
+async def reservar_cupo_streaming() -> CupoStreaming:
+    """
+    Reserva un lugar para un reporte en streaming, esperando hasta
+    COSTURA_STREAM_WAIT_SECONDS. Lanza ServiceError 503 si no se libera ninguno.
+    """
+    global _streams_activos, _streams_rechazados_total
+    try:
+        await asyncio.wait_for(_streams_disponibles.acquire(), timeout=settings.COSTURA_STREAM_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        _streams_rechazados_total += 1
+        logger.warning(f"Servicio Costura: {_MAX_STREAMS} reportes en streaming en curso; se rechaza uno nuevo.")
+        raise ServiceError(
+            status_code=503,
+            detail="Hay demasiados reportes en streaming en curso. Intente nuevamente en unos segundos o use format=json."
+        )
+    _streams_activos += 1
+    return CupoStreaming()
+
+def streaming_stats() -> Dict[str, int]:
+    return {
+        "max_concurrentes": _MAX_STREAMS,
+        "activos": _streams_activos,
+        "rechazados_total": _streams_rechazados_total,
+    }
+
+async def invalidar_cache_eficiencia(desde: Optional[date] = None, hasta: Optional[date] = None) -> int:
+    """
+    Borra las particiones diarias en [desde, hasta] (todas si no se indica),
+    p. ej. tras corregir datos de días ya cerrados. Devuelve cuántas borró.
+    """
+    logger.info(f"Servicio Costura: invalidando la caché diaria de {desde or 'el inicio'} a {hasta or 'hoy'}.")
+    return await asyncio.to_thread(cache_eficiencia_diaria.invalidar, desde, hasta)
+
+def _a_fecha(valor: Any) -> date:
+    return valor.date() if isinstance(valor, datetime) else valor
+
+async def _consultar_sp_eficiencia(
+    desde: date,
+    hasta: date,
+    hoy: date
+) -> AsyncIterator[Tuple[List[str], List[Any]]]:
+    """
+    Consulta el SP para [desde, hasta] y reenvía los lotes tal cual.
+    Si el rango incluye días cerrados, guarda sus particiones (también las
+    vacías) en la caché diaria.
+
+    Cada lote se reparte por fecha_proceso y las filas de los días cerrados se
+    añaden a la partición temporal de su día, así que no hace falta que el SP
+    las devuelva ordenadas y en memoria sólo queda el lote en curso. Las
+    particiones se publican recién cuando el SP se leyó completo; si se corta
+    antes (error o cliente que se desconecta) los temporales se descartan.
+    """
+    sp_params = {
+        "fecha_inicio": desde,
+        "fecha_fin": hasta
+    }
+    logger.debug(f"Servicio Costura: Llamando SP (streaming): {_SP_EFICIENCIA} con params: {sp_params}")
+
+    cache = cache_eficiencia_diaria
+    dias_cerrados = set()
+    if settings.COSTURA_CACHE_ENABLED:
+        dia = desde
+        while dia <= hasta:
+            if cache.es_dia_cerrado(dia, hoy):
+                dias_cerrados.add(dia)
+            dia += timedelta(days=1)
+
+    columnas: Optional[List[str]] = None
+    idx_fecha: Optional[int] = None
+    pendientes: Dict[date, str] = {}  # día cerrado -> partición temporal aún no publicada
+
+    async def _agregar_filas(dia: date, filas_dia: List[tuple]) -> None:
+        ruta_tmp = pendientes.get(dia)
+        if ruta_tmp is None:
+            ruta_tmp = await asyncio.to_thread(cache.preparar, dia, columnas, filas_dia)
+            if ruta_tmp is not None:
+                pendientes[dia] = ruta_tmp
+                return
+        elif await asyncio.to_thread(cache.agregar, dia, ruta_tmp, filas_dia):
+            return
+        # Sin partición completa, ese día no se cachea en esta consulta
+        dias_cerrados.discard(dia)
+        ruta_tmp = pendientes.pop(dia, None)
+        if ruta_tmp is not None:
+            cache.descartar(ruta_tmp)
+
+    try:
+        async for columnas_sp, filas in aiter_procedure_params_filas(_SP_EFICIENCIA, sp_params):
+            if dias_cerrados:
+                if columnas is None:
+                    columnas = columnas_sp
+                    if "fecha_proceso" in columnas_sp:
+                        idx_fecha = columnas_sp.index("fecha_proceso")
+                    else:
+                        logger.warning("Servicio Costura: el SP no devolvió 'fecha_proceso'; no se puede particionar por día.")
+                        dias_cerrados = set()
+                filas_por_dia: Dict[date, List[tuple]] = {}
+                for fila in filas if dias_cerrados else ():
+                    dia = _a_fecha(fila[idx_fecha])
+                    if dia in dias_cerrados:
+                        filas_por_dia.setdefault(dia, []).append(tuple(fila))
+                for dia, filas_dia in filas_por_dia.items():
+                    if dia in dias_cerrados:
+                        await _agregar_filas(dia, filas_dia)
+            yield columnas_sp, filas
+
+        # Sólo se llega aquí si el SP se leyó completo: nunca se publican particiones parciales
+        for dia in sorted(dias_cerrados):
+            ruta_tmp = pendientes.pop(dia, None)
+            if ruta_tmp is not None:
+                await asyncio.to_thread(cache.confirmar, dia, ruta_tmp)
+            else:
+                await asyncio.to_thread(cache.guardar, dia, columnas or [], [])
+    finally:
+        for ruta_tmp in pendientes.values():
+            cache.descartar(ruta_tmp)
+
+async def _iterar_filas_sp_eficiencia(
+    fecha_inicio: date,
+    fecha_fin: date
+) -> AsyncIterator[Tuple[List[str], List[Any]]]:
+    """
+    Lotes (columnas, filas) del SP para el rango, en orden cronológico.
+    Con la caché activa, los días cerrados ya guardados se leen de disco y sólo
+    los días faltantes o abiertos (hoy) se consultan al SP, agrupando los días
+    consecutivos en una sola llamada.
+    """
+    hoy = date.today()
+    if not settings.COSTURA_CACHE_ENABLED:
+        async for lote in _consultar_sp_eficiencia(fecha_inicio, fecha_fin, hoy):
+            yield lote
+        return
+
+    cache = cache_eficiencia_diaria
+    tramos: List[List[Any]] = []  # [origen, desde, hasta] con origen "cache" o "sp"
+    dia = fecha_inicio
+    while dia <= fecha_fin:
+        if cache.es_dia_cerrado(dia, hoy) and cache.existe(dia):
+            tramos.append(["cache", dia, dia])
+        elif tramos and tramos[-1][0] == "sp":
+            tramos[-1][2] = dia
+        else:
+            tramos.append(["sp", dia, dia])
+        dia += timedelta(days=1)
+
+    dias_en_cache = sum(1 for origen, _, _ in tramos if origen == "cache")
+    logger.info(f"Servicio Costura: {dias_en_cache} días desde caché y {len(tramos) - dias_en_cache} consultas al SP para {fecha_inicio} a {fecha_fin}.")
+
+    batch_size = settings.DB_FETCH_BATCH_SIZE
+    for origen, desde, hasta in tramos:
+        if origen == "cache":
+            particion = await asyncio.to_thread(cache.leer, desde)
+            if particion is not None:
+                columnas, filas = particion
+                for i in range(0, len(filas), batch_size):
+                    yield columnas, filas[i:i + batch_size]
+                continue
+            # Partición dañada o borrada entre medio: consultar ese día al SP
+        async for lote in _consultar_sp_eficiencia(desde, hasta, hoy):
+            yield lote
+
+async def _iterar_lotes_eficiencia(
+    fecha_inicio: date,
+    fecha_fin: date
+) -> AsyncIterator[Union[LoteColumnarEficiencia, List[EficienciaCosturaItemSchema]]]:
+    """
+    Lee el SP en lotes (fetchmany). Cada lote se entrega como LoteColumnarEficiencia
+    si trae los tipos esperados, o como lista de items validados fila por fila.
+    La memoria usada depende del tamaño del lote, no del rango de fechas.
+    """
+    fila_idx = 0
+    async for columnas_sp, filas in _iterar_filas_sp_eficiencia(fecha_inicio, fecha_fin):
+        # Ruta columnar (NumPy) si el lote trae los tipos esperados
+        lote = LoteColumnarEficiencia.desde_filas(columnas_sp, filas)
+        if lote is not None:
+            fila_idx += len(lote)
+            yield lote
+            continue
+
+        items_lote: List[EficienciaCosturaItemSchema] = []
+        for fila in filas:
+            row_dict = dict(zip(columnas_sp, fila))
+            try:
+                items_lote.append(procesar_fila_eficiencia(row_dict))
+            except Exception as e:
+                logger.error(f"Servicio Costura: Error procesando fila #{fila_idx}: {row_dict}. Error: {e}", exc_info=True)
+            fila_idx += 1
+        if items_lote:
+            yield items_lote
+
+    logger.info(f"Servicio Costura: Filas leídas del SP en streaming: {fila_idx}.")
+
+
+async def iterar_reporte_eficiencia(
+    fecha_inicio: date,
+    fecha_fin: date,
+    acumulador: AcumuladorTotalesEficiencia
+) -> AsyncIterator[List[EficienciaCosturaItemSchema]]:
+    """
+    Entrega los items del reporte por lotes, actualizando 'acumulador'.
+    Al terminar la iteración los totales están completos.
+    """
+    async for lote in _iterar_lotes_eficiencia(fecha_inicio, fecha_fin):
+        if isinstance(lote, LoteColumnarEficiencia):
+            acumulador.agregar_lote(lote)
+            yield lote.items()
+        else:
+            for item_data in lote:
+                acumulador.agregar(item_data)
+            yield lote
+
+
+async def generar_reporte_eficiencia_agrupado(
+    fecha_inicio: date,
+    fecha_fin: date,
+    group_by: List[str]
+) -> ReporteEficienciaAgrupadoResponseSchema:
+    """
+    Reporte agregado en el servidor por las dimensiones de 'group_by'
+    (ver DIMENSIONES_AGRUPACION). No crea items por fila: sólo acumula por grupo.
+    Las llamadas concurrentes idénticas comparten una sola ejecución.
+    """
+    clave = (_SP_EFICIENCIA, fecha_inicio, fecha_fin, "group_by", tuple(group_by))
+    return await _single_flight.ejecutar(
+        clave, lambda: _generar_reporte_eficiencia_agrupado(fecha_inicio, fecha_fin, group_by)
+    )
+
+async def _generar_reporte_eficiencia_agrupado(
+    fecha_inicio: date,
+    fecha_fin: date,
+    group_by: List[str]
+) -> ReporteEficienciaAgrupadoResponseSchema:
+    logger.info(f"Servicio Costura: Iniciando reporte de eficiencia agrupado por {group_by} para: {fecha_inicio} a {fecha_fin}")
+    start_time = time.time()
+
+    dimensiones_invalidas = [d for d in group_by if d not in DIMENSIONES_AGRUPACION]
+    if not group_by or dimensiones_invalidas:
+        raise ServiceError(
+            status_code=400,
+            detail=f"group_by inválido: {', '.join(dimensiones_invalidas) or '(vacío)'}. Valores permitidos: {', '.join(DIMENSIONES_AGRUPACION)}."
+        )
+
+    try:
+        acumulador = AcumuladorTotalesEficiencia()
+        agrupado = AcumuladorAgrupadoEficiencia(group_by)
+        async for lote in _iterar_lotes_eficiencia(fecha_inicio, fecha_fin):
+            if isinstance(lote, LoteColumnarEficiencia):
+                acumulador.agregar_lote(lote)
+                agrupado.agregar_lote(lote)
+            else:
+                for item_data in lote:
+                    acumulador.agregar(item_data)
+                    agrupado.agregar(item_data)
+
+        response = ReporteEficienciaAgrupadoResponseSchema(
+            fecha_inicio_reporte=fecha_inicio,
+            fecha_fin_reporte=fecha_fin,
+            agrupado_por=group_by,
+            grupos=agrupado.grupos(),
+            **acumulador.totales()
+        )
+        logger.info(f"Servicio Costura: Reporte agrupado ({len(response.grupos)} grupos de {acumulador.total_items} registros) generado en {time.time() - start_time:.4f} segundos.")
+        return response
+
+    except DatabaseError as db_err:
+        logger.error(f"Servicio Costura: DatabaseError al generar reporte agrupado: {getattr(db_err, 'detail', str(db_err))}", exc_info=True)
+        raise ServiceError(
+            status_code=500,
+            detail=f"Error de base de datos al generar el reporte de costura: {getattr(db_err, 'detail', str(db_err))}"
+        )
+    except Exception as e:
+        logger.error(f"Servicio Costura: Error inesperado al generar reporte agrupado: {e}", exc_info=True)
+        raise ServiceError(
+            status_code=500,
+            detail=f"Error interno del servidor al generar el reporte de costura: {str(e)}"
+        )
+
+
+FORMATOS_STREAMING = ("ndjson", "json-stream")
+
+def _error_stream(detail: str) -> str:
+    return json.dumps({"tipo_registro": "error", "detail": detail}, ensure_ascii=False)
+
+async def stream_reporte_eficiencia(
+    fecha_inicio: date,
+    fecha_fin: date,
+    formato: str,
+    limite_items: Optional[int] = None,
+    cupo: Optional[CupoStreaming] = None
+) -> AsyncIterator[bytes]:
+    """
+    Serializa el reporte a medida que se leen los lotes del SP, sin armar
+    ReporteEficienciaCosturaResponseSchema.
+    - 'ndjson': un item por línea y al final un registro {"tipo_registro": "totales", ...}.
+    - 'json-stream': el mismo JSON que la respuesta normal, con los totales
+      después de 'datos_reporte'.
+    'limite_items' corta los items emitidos, pero los totales siguen
+    correspondiendo al conjunto completo (igual que debug_limit).
+    Si falla a mitad de camino ya se enviaron cabeceras, así que el error
+    se informa como último registro.
+    'cupo' (ver reservar_cupo_streaming) se libera al terminar o cortarse el stream.
+    """
+    try:
+        async for chunk in _stream_reporte_eficiencia(fecha_inicio, fecha_fin, formato, limite_items):
+            yield chunk
+    finally:
+        if cupo is not None:
+            cupo.liberar()
+
+async def _stream_reporte_eficiencia(
+    fecha_inicio: date,
+    fecha_fin: date,
+    formato: str,
+    limite_items: Optional[int]
+) -> AsyncIterator[bytes]:
+    if formato not in FORMATOS_STREAMING:
+        raise ServiceError(status_code=400, detail=f"Formato de streaming no soportado: {formato}")
+
+    logger.info(f"Servicio Costura: Iniciando reporte de eficiencia en streaming ({formato}) para: {fecha_inicio} a {fecha_fin}")
+    start_time = time.time()
+    es_ndjson = formato == "ndjson"
+    acumulador = AcumuladorTotalesEficiencia()
+    emitidos = 0
+
+    if not es_ndjson:
+        yield (
+            f'{{"fecha_inicio_reporte":"{fecha_inicio.isoformat()}",'
+            f'"fecha_fin_reporte":"{fecha_fin.isoformat()}","datos_reporte":['
+        ).encode("utf-8")
+
+    try:
+        async for items_lote in iterar_reporte_eficiencia(fecha_inicio, fecha_fin, acumulador):
+            if limite_items is not None:
+                items_lote = items_lote[:max(0, limite_items - emitidos)]
+                if not items_lote:
+                    continue  # Seguir leyendo para que los totales sean del conjunto completo
+            items_json = [item.model_dump_json() for item in items_lote]
+            if es_ndjson:
+                chunk = "\n".join(items_json) + "\n"
+            else:
+                chunk = ("," if emitidos else "") + ",".join(items_json)
+            emitidos += len(items_lote)
+            yield chunk.encode("utf-8")
+    except Exception as e:
+        detail = getattr(e, "detail", str(e))
+        logger.error(f"Servicio Costura: Error durante el streaming del reporte: {detail}", exc_info=True)
+        if es_ndjson:
+            yield (_error_stream(detail) + "\n").encode("utf-8")
+        else:
+            yield ("]," + json.dumps({"error": detail}, ensure_ascii=False)[1:]).encode("utf-8")
+        return
+
+    totales = acumulador.totales()
+    totales["debug_note"] = None
+    if limite_items is not None and acumulador.total_items > emitidos:
+        totales["debug_note"] = (
+            f"Resultados limitados a los primeros {limite_items} registros para debugging. "
+            f"Los totales generales corresponden al conjunto completo de {acumulador.total_items} registros."
+        )
+    if es_ndjson:
+        yield (json.dumps({"tipo_registro": "totales", "total_items": acumulador.total_items, **totales}, ensure_ascii=False) + "\n").encode("utf-8")
+    else:
+        yield ("]," + json.dumps(totales, ensure_ascii=False)[1:]).encode("utf-8")
+
+    logger.info(f"Servicio Costura: Streaming ({formato}) de {emitidos} items completado en {time.time() - start_time:.4f} segundos.")
+
 async def generar_reporte_eficiencia(
     fecha_inicio: date,
     fecha_fin: date
+) -> ReporteEficienciaCosturaResponseSchema:
+    """
+    Reporte completo. Las llamadas concurrentes con las mismas fechas comparten
+    una sola ejecución del SP y el mismo objeto de respuesta (no mutarlo).
+    """
+    return await _single_flight.ejecutar(
+        (_SP_EFICIENCIA, fecha_inicio, fecha_fin),
+        lambda: _generar_reporte_eficiencia(fecha_inicio, fecha_fin)
+    )
+
+async def _generar_reporte_eficiencia(
+    fecha_inicio: date,
+    fecha_fin: date
 ) -> ReporteEficienciaCosturaResponseSchema:
     logger.info(f"Servicio Costura: Iniciando reporte de eficiencia para: {fecha_inicio} a {fecha_fin}")
 
     total_service_start_time = time.time()
 
     try:
-        stored_procedure_name = "dbo.sp_costura_eficiencia_web"
-        sp_params = {
-            "fecha_inicio": fecha_inicio,
-            "fecha_fin": fecha_fin
-        }
-
-        logger.debug(f"Servicio Costura: Llamando SP: {stored_procedure_name} con params: {sp_params}")
-
-        db_call_start_time = time.time()
-        raw_data_list: List[Dict[str, Any]] = await asyncio.to_thread(
-            execute_procedure_params,
-            stored_procedure_name,
-            sp_params
-        )
-        db_call_end_time = time.time()
-        logger.info(f"Servicio Costura: Llamada a DB (asyncio.to_thread + execute_procedure_params) tomó: {db_call_end_time - db_call_start_time:.4f} segundos.")
-        logger.info(f"Servicio Costura: Datos crudos recibidos del SP: {len(raw_data_list)} filas.")
+        processing_start_time = time.time()
+
+        acumulador = AcumuladorTotalesEficiencia()
+        items_procesados: List[EficienciaCosturaItemSchema] = []
+        async for items_lote in iterar_reporte_eficiencia(fecha_inicio, fecha_fin, acumulador):
+            items_procesados.extend(items_lote)
+
+        processing_end_time = time.time()
+        logger.info(f"Servicio Costura: Lectura en streaming del SP y procesamiento tomó: {processing_end_time - processing_start_time:.4f} segundos.")
 
-        if not raw_data_list:
+        if not items_procesados:
             logger.info("Servicio Costura: No se encontraron datos para el reporte.")
             return ReporteEficienciaCosturaResponseSchema(
                 fecha_inicio_reporte=fecha_inicio,
@@ -58,91 +463,18 @@ async def generar_reporte_eficiencia(
                 eficiencia_promedio_general_periodo=0.0
             )
 
-        python_processing_start_time = time.time()
-
-        items_procesados: List[EficienciaCosturaItemSchema] = []
-        sum_total_prendas = 0
-        sum_total_min_producidos = 0.0
-        min_disponibles_unicos_tracker = {}
-        sum_total_min_disponibles_unicos = 0.0
-
-        for i, row_dict in enumerate(raw_data_list):
-            try:
-                item_data = EficienciaCosturaItemSchema.parse_obj(row_dict)
-
-                if item_data.minutos_disponibles_jornada is not None and item_data.minutos_disponibles_jornada > 0:
-                    item_data.eficiencia_porcentaje = round(
-                        (item_data.minutos_producidos_total / item_data.minutos_disponibles_jornada) * 100, 2
-                    )
-                else:
-                    item_data.eficiencia_porcentaje = 0.0
-                items_procesados.append(item_data)
-                sum_total_prendas += item_data.cantidad_prendas_producidas
-                sum_total_min_producidos += item_data.minutos_producidos_total
-                tracker_key = (item_data.codigo_trabajador, item_data.fecha_proceso)
-                if tracker_key not in min_disponibles_unicos_tracker:
-                    minutos_jornada_actual = item_data.minutos_disponibles_jornada or 0.0
-                    min_disponibles_unicos_tracker[tracker_key] = minutos_jornada_actual
-                    sum_total_min_disponibles_unicos += minutos_jornada_actual
-            except Exception as e:
-                logger.error(f"Servicio Costura: Error procesando fila #{i}: {row_dict}. Error: {e}", exc_info=True)
-
-        eficiencia_general_promedio = 0.0
-        if sum_total_min_disponibles_unicos > 0:
-            eficiencia_general_promedio = round(
-                (sum_total_min_producidos / sum_total_min_disponibles_unicos) * 100, 2
-            )
-
-        python_processing_end_time = time.time()
-        logger.info(f"Servicio Costura: Procesamiento de datos en Python (bucle y Pydantic) tomó: {python_processing_end_time - python_processing_start_time:.4f} segundos.")
-
         response_object_creation_start_time = time.time()
         response = ReporteEficienciaCosturaResponseSchema(
             fecha_inicio_reporte=fecha_inicio,
             fecha_fin_reporte=fecha_fin,
             datos_reporte=items_procesados,
-            total_prendas_producidas_periodo=sum_total_prendas,
-            total_minutos_producidos_periodo=round(sum_total_min_producidos, 2),
-            total_minutos_disponibles_periodo=round(sum_total_min_disponibles_unicos, 2),
-            eficiencia_promedio_general_periodo=eficiencia_general_promedio
+            **acumulador.totales()
         )
         response_object_creation_end_time = time.time()
         logger.info(f"Servicio Costura: Creación del objeto de respuesta Pydantic tomó: {response_object_creation_end_time - response_object_creation_start_time:.4f} segundos.")
 
-        # --- NUEVO: Medir serialización a JSON y tamaño ---
-        json_serialization_start_time = time.time()
-        json_output = "{}" # Fallback
-        json_size_bytes = 0
-        try:
-            # Para Pydantic v2 (recomendado con FastAPI moderno):
-            if hasattr(response, 'model_dump_json'):
-                json_output = response.model_dump_json()
-            # Para Pydantic v1 (si estás en una versión más antigua):
-            elif hasattr(response, 'json'):
-                json_output = response.json() # type: ignore
-            else:
-                logger.warning("Servicio Costura: El objeto de respuesta no tiene 'model_dump_json()' ni 'json()'. No se puede serializar para medir.")
-                # Como fallback, intentamos con el módulo json estándar, aunque no es lo que FastAPI usaría directamente con Pydantic.
-                # Esto es solo para tener una idea del tamaño si los métodos de Pydantic no están.
-                # Necesitarías convertir el objeto Pydantic a dict primero si usas json.dumps directamente.
-                # Por ahora, lo dejamos simple. La idea es que uno de los métodos de Pydantic debería existir.
-                pass # json_output sigue siendo "{}"
-
-            if json_output != "{}": # Solo calcular tamaño si la serialización tuvo éxito
-                json_size_bytes = len(json_output.encode('utf-8'))
-                logger.info(f"Servicio Costura: Tamaño estimado del JSON de respuesta: {json_size_bytes / (1024*1024):.2f} MB ({json_size_bytes} bytes)")
-            else:
-                logger.info("Servicio Costura: No se pudo serializar la respuesta para medir el tamaño del JSON.")
-
-        except Exception as e:
-            logger.error(f"Servicio Costura: Error al intentar serializar a JSON para medir: {e}", exc_info=True)
-
-        json_serialization_end_time = time.time()
-        logger.info(f"Servicio Costura: Serialización del objeto de respuesta a JSON (dentro del servicio) tomó: {json_serialization_end_time - json_serialization_start_time:.4f} segundos.")
-        # --- FIN NUEVO ---
-
-        total_service_end_time = time.time() # --- MODIFICADO: Mover esta línea después de la medición JSON ---
-        logger.info(f"Servicio Costura: Tiempo total de ejecución de generar_reporte_eficiencia (incluyendo medición JSON): {total_service_end_time - total_service_start_time:.4f} segundos.")
+        total_service_end_time = time.time()
+        logger.info(f"Servicio Costura: Tiempo total de ejecución de generar_reporte_eficiencia: {total_service_end_time - total_service_start_time:.4f} segundos.")
 
         logger.info("Servicio Costura: Reporte de eficiencia generado exitosamente.")
         return response
@@ -1,5 +1,5 @@
 from typing import List, Dict, Optional
-from app.db.queries import execute_query, execute_procedure_params
+from app.db.async_queries import aexecute_query, aexecute_procedure_params
 from app.core.exceptions import ServiceError, ValidationError
 from app.schemas.empleado import EmpleadoBusquedaParams
 import logging
@@ -11,7 +11,7 @@ class EmpleadoService:
     async def get_all_empleados() -> List[Dict]:
         try:
             query = "SELECT * FROM pdgaop00 where nordpr='230152'"
-            return execute_query(query)
+            return await aexecute_query(query)
         except Exception as e:
             logger.error(f"Error obteniendo empleados: {str(e)}")
             raise ServiceError(status_code=500, detail=f"Error obteniendo empleados: {str(e)}")
@@ -25,7 +25,7 @@ class EmpleadoService:
             )
 
         try:
-            return execute_procedure_params("sp_plan_cuotas_op_api", {"wnordpr": nordpr})
+            return await aexecute_procedure_params("sp_plan_cuotas_op_api", {"wnordpr": nordpr})
         except Exception as e:
             logger.error(f"Error obteniendo plan de cuotas: {str(e)}")
             raise ServiceError(status_code=500, detail=f"Error obteniendo plan de cuotas: {str(e)}")
@@ -40,7 +40,7 @@ class EmpleadoService:
 
         try:
             query = "SELECT * FROM ousuar00 WHERE LOWER(ctraba) = LOWER(?)"
-            return execute_query(query, (codigo,))
+            return await aexecute_query(query, (codigo,))
         except Exception as e:
             logger.error(f"Error buscando empleado: {str(e)}")
             raise ServiceError(status_code=500, detail=f"Error buscando empleado: {str(e)}")
\ No newline at end of file
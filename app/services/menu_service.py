@@ -2,15 +2,24 @@
 
 from typing import List, Dict, Optional, Any
 # Asegúrate de importar todas las funciones y constantes de queries necesarias
+from app.db.async_queries import (
+    aexecute_procedure, aexecute_procedure_params, aexecute_query, aexecute_prepared_query,
+    aexecute_insert, aexecute_update
+)
 from app.db.queries import (
-    execute_procedure, execute_procedure_params, execute_query, execute_insert, execute_update,
-    GET_ALL_MENUS_ADMIN, INSERT_MENU, SELECT_MENU_BY_ID, UPDATE_MENU_TEMPLATE,
-    DEACTIVATE_MENU, REACTIVATE_MENU, CHECK_MENU_EXISTS, CHECK_AREA_EXISTS,
-    GET_MENUS_BY_AREA_FOR_TREE_QUERY,GET_MAX_ORDEN_FOR_SIBLINGS, GET_MAX_ORDEN_FOR_ROOT
+    GET_ALL_MENUS_ADMIN, INSERT_MENU, UPDATE_MENU_TEMPLATE,
+    DEACTIVATE_MENU, REACTIVATE_MENU, CHECK_AREA_EXISTS,
+    GET_MENUS_BY_AREA_FOR_TREE_QUERY,GET_MAX_ORDEN_FOR_SIBLINGS, GET_MAX_ORDEN_FOR_ROOT,
+    SENTENCIA_MENU_BY_ID, SENTENCIA_CHECK_MENU_EXISTS
 )
+from app.db.versiones import IncrementoVersiones
 # --- SOLO IMPORTAMOS ServiceError (y DatabaseError si existe y se usa) ---
 from app.core.exceptions import ServiceError #, DatabaseError # Descomenta DatabaseError si existe y la usas
+from app.core.permisos_cache import obtener_indice_permisos
 from app.utils.menu_helper import build_menu_tree
+from app.utils.menu_cache import menu_por_roles_cache
+from app.utils.etag import incrementar_version, RECURSO_MENUS
+from app.utils.single_flight import get_single_flight
 # Importa los schemas necesarios
 from app.schemas.menu import (
     MenuResponse, MenuItem, MenuCreate, MenuUpdate, MenuReadSingle
@@ -19,6 +28,8 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+_single_flight = get_single_flight("menu_usuario")
+
 # --- ASUMIMOS QUE DatabaseError PUEDE O NO ESTAR DEFINIDA ---
 # Si no está definida en tus excepciones, elimina el bloque 'except DatabaseError'
 # o reemplázalo por 'except Exception'.
@@ -46,7 +57,7 @@ class MenuService:
         logger.info(f"Obteniendo menú filtrado para usuario_id: {usuario_id} usando {procedure_name}")
         try:
             # Llamar a execute_procedure_params con el diccionario corregido
-            resultado_sp = execute_procedure_params(procedure_name, params_dict)
+            resultado_sp = await aexecute_procedure_params(procedure_name, params_dict)
 
             if not resultado_sp:
                 logger.info(f"No se encontraron menús permitidos para el usuario ID: {usuario_id}.")
@@ -69,6 +80,67 @@ class MenuService:
             logger.error(f"Error inesperado al obtener/construir árbol de menú para usuario {usuario_id}: {e}", exc_info=True)
             raise ServiceError(status_code=500, detail="Error interno al procesar el menú del usuario.")
 
+    @staticmethod
+    async def get_menu_for_roles(rol_ids: List[int]) -> MenuResponse:
+        """
+        Estructura de menú que ven los roles dados: los menús activos de
+        sp_GetFullMenu sobre los que alguno tiene 'puede_ver' (según el índice
+        de permisos), más sus ancestros para que el árbol conserve su forma.
+        Depende sólo de rol_ids, no de los roles que la BD tenga hoy para un usuario.
+        """
+        try:
+            filas = await aexecute_procedure("sp_GetFullMenu")
+            permitidos = (await obtener_indice_permisos()).menus_permitidos(rol_ids, "ver")
+
+            por_id = {fila["menu_id"]: fila for fila in filas or [] if fila.get("es_activo", True)}
+            visibles = set()
+            for menu_id in permitidos:
+                # Subir por los padres hasta la raíz o hasta uno ya incluido
+                while menu_id in por_id and menu_id not in visibles:
+                    visibles.add(menu_id)
+                    menu_id = por_id[menu_id].get("padre_menu_id")
+
+            if not visibles:
+                logger.info(f"No se encontraron menús permitidos para los roles {sorted(set(rol_ids))}.")
+                return MenuResponse(menu=[])
+
+            menu_tree: List[MenuItem] = build_menu_tree([fila for menu_id, fila in por_id.items() if menu_id in visibles])
+            logger.info(f"Árbol de menú construido para los roles {sorted(set(rol_ids))} con {len(menu_tree)} items raíz.")
+            return MenuResponse(menu=menu_tree)
+
+        except DatabaseError as db_err:
+             logger.error(f"Error de DB al obtener menú para los roles {rol_ids}: {db_err}", exc_info=True)
+             raise ServiceError(status_code=500, detail=f"Error DB al obtener menú del usuario: {getattr(db_err, 'detail', str(db_err))}")
+        except Exception as e:
+            logger.error(f"Error inesperado al obtener/construir árbol de menú para los roles {rol_ids}: {e}", exc_info=True)
+            raise ServiceError(status_code=500, detail="Error interno al procesar el menú del usuario.")
+
+    @staticmethod
+    async def get_menu_json_for_user(rol_ids: List[int]) -> bytes:
+        """
+        Menú de get_menu_for_roles ya serializado y cacheado por conjunto de
+        roles activos (menu_por_roles_cache): todos los usuarios con los mismos
+        roles comparten el mismo árbol. El contenido se construye con los
+        mismos rol_ids que forman la clave, así que una entrada nunca refleja
+        los roles de otro usuario ni de otro momento.
+        """
+        clave = menu_por_roles_cache.clave_roles(rol_ids)
+        contenido = menu_por_roles_cache.obtener(clave)
+        if contenido is not None:
+            return contenido
+
+        # Tomada antes de leer la BD: si alguien invalida mientras tanto, no se guarda
+        generacion = menu_por_roles_cache.generacion()
+
+        async def _construir() -> bytes:
+            menu = await MenuService.get_menu_for_roles(list(clave))
+            contenido = menu.model_dump_json().encode()
+            menu_por_roles_cache.guardar(clave, contenido, generacion)
+            return contenido
+
+        # Usuarios con los mismos roles que llegan a la vez comparten una sola lectura
+        return await _single_flight.ejecutar((clave, generacion), _construir)
+
     # --- Métodos existentes (get_full_menu, obtener_menu_por_id) ---
     # (Los dejamos como estaban en tu código original, ya que no usaban las nuevas excepciones)
     @staticmethod
@@ -76,7 +148,7 @@ class MenuService:
         """Obtiene el menú completo y lo estructura en árbol."""
         try:
             procedure_name = "sp_GetFullMenu"
-            resultado = execute_procedure(procedure_name)
+            resultado = await aexecute_procedure(procedure_name)
             if not resultado: return []
             return build_menu_tree(resultado)
         except Exception as e:
@@ -90,7 +162,7 @@ class MenuService:
         logger.debug(f"Buscando menú con ID: {menu_id}")
         try:
             # Usamos la query que incluye el nombre del área
-            resultado = execute_query(SELECT_MENU_BY_ID, (menu_id,))
+            resultado = await aexecute_prepared_query(SENTENCIA_MENU_BY_ID, (menu_id,))
             if not resultado:
                 logger.debug(f"Menú con ID {menu_id} no encontrado.")
                 return None
@@ -115,7 +187,7 @@ class MenuService:
     async def obtener_todos_menus_estructurados_admin() -> MenuResponse:
         logger.info("Obteniendo estructura completa de menús para admin.")
         try:
-            resultado_sp = execute_procedure(GET_ALL_MENUS_ADMIN)
+            resultado_sp = await aexecute_procedure(GET_ALL_MENUS_ADMIN)
             if not resultado_sp:
                 logger.warning(f"{GET_ALL_MENUS_ADMIN} no devolvió resultados.")
                 return MenuResponse(menu=[])
@@ -139,13 +211,13 @@ class MenuService:
         try:
             # --- Validaciones Previas ---
             if menu_data.padre_menu_id:
-                padre_exists = execute_query(CHECK_MENU_EXISTS, (menu_data.padre_menu_id,))
+                padre_exists = await aexecute_prepared_query(SENTENCIA_CHECK_MENU_EXISTS, (menu_data.padre_menu_id,))
                 if not padre_exists:
                     raise ServiceError(status_code=400, detail=f"El menú padre con ID {menu_data.padre_menu_id} no existe.")
             if not menu_data.area_id: # Asumimos que area_id es obligatorio
                  raise ServiceError(status_code=400, detail="El ID del área es obligatorio para crear un menú.")
             else:
-                area_exists = execute_query(CHECK_AREA_EXISTS, (menu_data.area_id,))
+                area_exists = await aexecute_query(CHECK_AREA_EXISTS, (menu_data.area_id,))
                 if not area_exists:
                      raise ServiceError(status_code=400, detail=f"El área con ID {menu_data.area_id} no existe.")
 
@@ -153,10 +225,10 @@ class MenuService:
             max_orden_result = None
             if menu_data.padre_menu_id:
                 # Buscar max orden entre hermanos
-                max_orden_result = execute_query(GET_MAX_ORDEN_FOR_SIBLINGS, (menu_data.area_id, menu_data.padre_menu_id))
+                max_orden_result = await aexecute_query(GET_MAX_ORDEN_FOR_SIBLINGS, (menu_data.area_id, menu_data.padre_menu_id))
             else:
                 # Buscar max orden entre raíces del área
-                max_orden_result = execute_query(GET_MAX_ORDEN_FOR_ROOT, (menu_data.area_id,))
+                max_orden_result = await aexecute_query(GET_MAX_ORDEN_FOR_ROOT, (menu_data.area_id,))
 
             max_orden = 0 # Valor por defecto si no hay hermanos/raíces
             if max_orden_result and max_orden_result[0]['max_orden'] is not None:
@@ -178,17 +250,19 @@ class MenuService:
             )
 
             # --- Ejecutar Inserción ---
-            resultado = execute_insert(INSERT_MENU, params)
+            resultado = await aexecute_insert(INSERT_MENU, params, versiones=IncrementoVersiones(RECURSO_MENUS))
             if not resultado or 'menu_id' not in resultado: # Verificar que se devolvió el ID
                  raise ServiceError(status_code=500, detail="La inserción no devolvió el registro creado correctamente.")
 
             # --- Obtener nombre del área (opcional, para la respuesta) ---
             area_nombre = None
             if resultado.get('area_id'):
-                 area_info = execute_query("SELECT nombre FROM area_menu WHERE area_id = ?", (resultado['area_id'],))
+                 area_info = await aexecute_query("SELECT nombre FROM area_menu WHERE area_id = ?", (resultado['area_id'],))
                  if area_info: area_nombre = area_info[0]['nombre']
 
             # --- Crear y devolver respuesta ---
+            menu_por_roles_cache.invalidar("menú creado")
+            incrementar_version(RECURSO_MENUS)
             # Asegurarse que el 'orden' en la respuesta es el insertado
             created_menu = MenuReadSingle(**resultado, area_nombre=area_nombre)
             logger.info(f"Menú '{created_menu.nombre}' creado con ID: {created_menu.menu_id} y orden: {created_menu.orden}")
@@ -225,11 +299,11 @@ class MenuService:
             if 'padre_menu_id' in update_payload and update_payload['padre_menu_id'] is not None:
                 if menu_id == update_payload['padre_menu_id']:
                      raise ServiceError(status_code=400, detail="Un menú no puede ser su propio padre.")
-                padre_exists = execute_query(CHECK_MENU_EXISTS, (update_payload['padre_menu_id'],))
+                padre_exists = await aexecute_prepared_query(SENTENCIA_CHECK_MENU_EXISTS, (update_payload['padre_menu_id'],))
                 if not padre_exists:
                     raise ServiceError(status_code=400, detail=f"El menú padre con ID {update_payload['padre_menu_id']} no existe.")
             if 'area_id' in update_payload and update_payload['area_id'] is not None:
-                area_exists = execute_query(CHECK_AREA_EXISTS, (update_payload['area_id'],))
+                area_exists = await aexecute_query(CHECK_AREA_EXISTS, (update_payload['area_id'],))
                 if not area_exists:
                      raise ServiceError(status_code=400, detail=f"El área con ID {update_payload['area_id']} no existe.")
 
@@ -239,15 +313,17 @@ class MenuService:
                 update_payload.get('area_id'), update_payload.get('es_activo'),
                 menu_id
             )
-            resultado = execute_update(UPDATE_MENU_TEMPLATE, params)
+            resultado = await aexecute_update(UPDATE_MENU_TEMPLATE, params, versiones=IncrementoVersiones(RECURSO_MENUS))
             if not resultado:
                  raise ServiceError(status_code=500, detail="La actualización no devolvió el registro actualizado.")
 
             area_nombre = None
             if resultado.get('area_id'):
-                 area_info = execute_query("SELECT nombre FROM area_menu WHERE area_id = ?", (resultado['area_id'],))
+                 area_info = await aexecute_query("SELECT nombre FROM area_menu WHERE area_id = ?", (resultado['area_id'],))
                  if area_info: area_nombre = area_info[0]['nombre']
 
+            menu_por_roles_cache.invalidar("menú actualizado")
+            incrementar_version(RECURSO_MENUS)
             updated_menu = MenuReadSingle(**resultado, area_nombre=area_nombre)
             logger.info(f"Menú ID: {menu_id} actualizado exitosamente.")
             return updated_menu
@@ -267,10 +343,10 @@ class MenuService:
     async def desactivar_menu(menu_id: int) -> Dict[str, Any]:
         logger.info(f"Intentando desactivar menú ID: {menu_id}")
         try:
-            resultado = execute_update(DEACTIVATE_MENU, (menu_id,))
+            resultado = await aexecute_update(DEACTIVATE_MENU, (menu_id,), versiones=IncrementoVersiones(RECURSO_MENUS))
             if not resultado:
                 # Verificar si existe (podría ya estar inactivo)
-                menu_existente = execute_query(CHECK_MENU_EXISTS, (menu_id,))
+                menu_existente = await aexecute_prepared_query(SENTENCIA_CHECK_MENU_EXISTS, (menu_id,))
                 if not menu_existente:
                      # Levanta ServiceError en lugar de NotFoundError
                      raise ServiceError(status_code=404, detail=f"Menú con ID {menu_id} no encontrado para desactivar.")
@@ -281,6 +357,8 @@ class MenuService:
                      raise ServiceError(status_code=400, detail=f"Menú con ID {menu_id} ya estaba inactivo.")
 
             logger.info(f"Menú ID: {menu_id} desactivado exitosamente.")
+            menu_por_roles_cache.invalidar("menú desactivado")
+            incrementar_version(RECURSO_MENUS)
             return {"menu_id": resultado.get('menu_id'), "es_activo": resultado.get('es_activo')}
 
         except DatabaseError as db_err: # Mantenemos captura específica si existe
@@ -298,12 +376,14 @@ class MenuService:
     async def reactivar_menu(menu_id: int) -> Dict[str, Any]:
         logger.info(f"Intentando reactivar menú ID: {menu_id}")
         try:
-            resultado = execute_update(REACTIVATE_MENU, (menu_id,))
+            resultado = await aexecute_update(REACTIVATE_MENU, (menu_id,), versiones=IncrementoVersiones(RECURSO_MENUS))
             if not resultado:
                  # Levanta ServiceError en lugar de NotFoundError
                  raise ServiceError(status_code=404, detail=f"Menú con ID {menu_id} no encontrado o ya estaba activo.")
 
             logger.info(f"Menú ID: {menu_id} reactivado exitosamente.")
+            menu_por_roles_cache.invalidar("menú reactivado")
+            incrementar_version(RECURSO_MENUS)
             return {"menu_id": resultado.get('menu_id'), "es_activo": resultado.get('es_activo')}
         except DatabaseError as db_err: # Mantenemos captura específica si existe
              raise ServiceError(status_code=500, detail=f"Error DB al reactivar: {getattr(db_err, 'detail', str(db_err))}")
@@ -319,7 +399,7 @@ class MenuService:
         try:
             # Ejecuta la query para obtener la lista plana de menús del área
             params = (area_id,)
-            menu_items_raw_list = execute_query(GET_MENUS_BY_AREA_FOR_TREE_QUERY, params)
+            menu_items_raw_list = await aexecute_query(GET_MENUS_BY_AREA_FOR_TREE_QUERY, params)
 
             if not menu_items_raw_list:
                 logger.info(f"No se encontraron menús para el área ID: {area_id}.")
@@ -1,8 +1,12 @@
 # app/services/permiso_service.py
 
 from typing import Dict, List, Optional
-from app.db.queries import execute_query, execute_insert, execute_update
+from app.db.async_queries import aexecute_query, aexecute_insert, aexecute_update
+from app.db.versiones import IncrementoVersiones
 from app.core.exceptions import ServiceError, ValidationError
+from app.core.permisos_cache import obtener_indice_permisos, refrescar_indice_permisos
+from app.utils.menu_cache import menu_por_roles_cache
+from app.utils.etag import incrementar_version, RECURSO_PERMISOS
 import logging
 
 # Importar otros servicios si necesitamos validar IDs
@@ -47,7 +51,7 @@ class PermisoService:
             FROM rol_menu_permiso
             WHERE rol_id = ? AND menu_id = ?
             """
-            existing_perm = execute_query(check_query, (rol_id, menu_id))
+            existing_perm = await aexecute_query(check_query, (rol_id, menu_id))
 
             permiso_data = {}
             if puede_ver is not None: permiso_data['puede_ver'] = puede_ver
@@ -80,7 +84,7 @@ class PermisoService:
                     SELECT rol_menu_id, rol_id, menu_id, puede_ver, puede_editar, puede_eliminar
                     FROM rol_menu_permiso WHERE rol_menu_id = ?
                     """
-                    return execute_query(get_query, (perm_id,))[0]
+                    return (await aexecute_query(get_query, (perm_id,)))[0]
 
 
                 params.append(perm_id) # Añadir ID para el WHERE
@@ -92,10 +96,13 @@ class PermisoService:
                        INSERTED.puede_ver, INSERTED.puede_editar, INSERTED.puede_eliminar
                 WHERE rol_menu_id = ?
                 """
-                result = execute_update(update_query, tuple(params))
+                result = await aexecute_update(update_query, tuple(params), versiones=IncrementoVersiones(RECURSO_PERMISOS))
                 if not result:
                      raise ServiceError(status_code=500, detail="Error al actualizar el permiso.")
                 logger.info(f"Permiso ID {perm_id} actualizado exitosamente.")
+                await refrescar_indice_permisos()
+                menu_por_roles_cache.invalidar("permisos modificados")
+                incrementar_version(RECURSO_PERMISOS)
                 return result
 
             else:
@@ -113,10 +120,13 @@ class PermisoService:
                 VALUES (?, ?, ?, ?, ?)
                 """
                 params = (rol_id, menu_id, final_puede_ver, final_puede_editar, final_puede_eliminar)
-                result = execute_insert(insert_query, params)
+                result = await aexecute_insert(insert_query, params, versiones=IncrementoVersiones(RECURSO_PERMISOS))
                 if not result:
                     raise ServiceError(status_code=500, detail="Error al crear el permiso.")
                 logger.info(f"Permiso creado exitosamente con ID {result['rol_menu_id']}.")
+                await refrescar_indice_permisos()
+                menu_por_roles_cache.invalidar("permisos modificados")
+                incrementar_version(RECURSO_PERMISOS)
                 return result
 
         except ValidationError as e:
@@ -140,17 +150,9 @@ class PermisoService:
                 logger.warning(f"Intento de obtener permisos para rol inexistente ID {rol_id}.")
                 return []
 
-            query = """
-            SELECT
-                p.rol_menu_id, p.rol_id, p.menu_id,
-                p.puede_ver, p.puede_editar, p.puede_eliminar,
-                m.nombre AS menu_nombre, m.ruta AS menu_url, m.icono AS menu_icono -- Añadir campos del menú
-            FROM rol_menu_permiso p
-            INNER JOIN menu m ON p.menu_id = m.menu_id -- Unir con tabla menu
-            WHERE p.rol_id = ?
-            ORDER BY m.orden; -- Opcional: ordenar por menú
-            """
-            permisos = execute_query(query, (rol_id,))
+            # Servido desde el índice en memoria de permisos (ver app/core/permisos_cache.py),
+            # igual que RolService.obtener_permisos_por_rol
+            permisos = (await obtener_indice_permisos()).permisos_de_rol_con_menu(rol_id)
             logger.debug(f"Obtenidos {len(permisos)} permisos para rol ID {rol_id}.")
             return permisos
 
@@ -164,16 +166,12 @@ class PermisoService:
         Obtiene el permiso específico de un rol sobre un menú.
         """
         try:
-            query = """
-            SELECT rol_menu_id, rol_id, menu_id, puede_ver, puede_editar, puede_eliminar
-            FROM rol_menu_permiso
-            WHERE rol_id = ? AND menu_id = ?
-            """
-            resultados = execute_query(query, (rol_id, menu_id))
-            if not resultados:
+            # Servido desde el índice en memoria de permisos (ver app/core/permisos_cache.py)
+            permiso = (await obtener_indice_permisos()).permiso(rol_id, menu_id)
+            if permiso is None:
                 logger.debug(f"No se encontró permiso para Rol {rol_id}, Menú {menu_id}.")
                 return None
-            return resultados[0]
+            return permiso
         except Exception as e:
             logger.error(f"Error obteniendo permiso específico para Rol {rol_id}, Menú {menu_id}: {str(e)}", exc_info=True)
             raise ServiceError(status_code=500, detail=f"Error obteniendo permiso específico: {str(e)}")
@@ -189,7 +187,12 @@ class PermisoService:
             # await PermisoService._validar_rol_y_menu(rol_id, menu_id)
 
             # 2. Verificar si el permiso existe antes de intentar eliminar
-            permiso_existente = await PermisoService.obtener_permiso_especifico(rol_id, menu_id)
+            # (contra la BD y no el índice en memoria, que puede no tener aún cambios de otro worker)
+            check_query = """
+            SELECT rol_menu_id FROM rol_menu_permiso
+            WHERE rol_id = ? AND menu_id = ?
+            """
+            permiso_existente = await aexecute_query(check_query, (rol_id, menu_id))
             if not permiso_existente:
                  raise ValidationError(status_code=404, detail=f"No se encontró permiso para eliminar (Rol ID: {rol_id}, Menú ID: {menu_id}).")
 
@@ -200,12 +203,12 @@ class PermisoService:
             DELETE FROM rol_menu_permiso
             WHERE rol_id = ? AND menu_id = ?
             """
-            # execute_update maneja commit/rollback pero no devuelve datos en DELETE simple
-            # Para confirmar, podemos verificar las filas afectadas si la librería lo permite
-            # o simplemente asumir éxito si no hay excepción.
-            # Por simplicidad, usaremos execute_query para simular un DELETE que no necesita retorno
-            with execute_query(delete_query, (rol_id, menu_id)) as cursor:
-                 pass # La ejecución ocurre dentro del context manager de execute_query/update/insert
+            # execute_update maneja commit/rollback y devuelve {} en un DELETE simple;
+            # se asume éxito si no hay excepción.
+            await aexecute_update(delete_query, (rol_id, menu_id), versiones=IncrementoVersiones(RECURSO_PERMISOS))
+            await refrescar_indice_permisos()
+            menu_por_roles_cache.invalidar("permisos modificados")
+            incrementar_version(RECURSO_PERMISOS)
 
             logger.info(f"Permiso revocado exitosamente para Rol {rol_id}, Menú {menu_id}.")
             return {"message": "Permiso revocado exitosamente"}
@@ -217,6 +220,19 @@ class PermisoService:
             logger.error(f"Error inesperado revocando permiso para Rol {rol_id}, Menú {menu_id}: {str(e)}", exc_info=True)
             raise ServiceError(status_code=500, detail=f"Error al revocar permiso: {str(e)}")
 
+    @staticmethod
+    async def usuario_puede(rol_ids: List[int], menu_id: int, accion: str = "ver") -> bool:
+        """
+        True si alguno de los roles tiene 'accion' ('ver', 'editar' o 'eliminar')
+        sobre el menú. Resuelto con el índice en memoria, sin consultar la BD.
+        """
+        return (await obtener_indice_permisos()).puede(rol_ids, menu_id, accion)
+
+    @staticmethod
+    async def menus_permitidos(rol_ids: List[int], accion: str = "ver") -> List[int]:
+        """IDs de los menús sobre los que alguno de los roles tiene 'accion' (índice en memoria)."""
+        return (await obtener_indice_permisos()).menus_permitidos(rol_ids, accion)
+
     # Podrías añadir métodos para revocar todos los permisos de un rol o menú si es necesario
     # async def revocar_todos_permisos_por_rol(rol_id: int): ...
     # async def revocar_todos_permisos_por_menu(menu_id: int): ...
\ No newline at end of file
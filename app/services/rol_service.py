@@ -3,19 +3,24 @@ from fastapi import status
 import math
 from typing import Dict, List, Optional
 # Importar las queries necesarias, incluyendo REACTIVATE_ROL
+from app.db.async_queries import aexecute_query, aexecute_prepared_query, aexecute_insert, aexecute_update, aexecute_transaction
 from app.db.queries import (
-    execute_query, execute_insert, execute_update, execute_transaction,
-    COUNT_ROLES_PAGINATED, SELECT_ROLES_PAGINATED,
+    COUNT_ROLES_PAGINATED, SELECT_ROLES_PAGINATED, SELECT_ROLES_KEYSET,
     DEACTIVATE_ROL, REACTIVATE_ROL, # <-- Añadir DEACTIVATE_ROL y REACTIVATE_ROL
-    SELECT_PERMISOS_POR_ROL,
-    DELETE_PERMISOS_POR_ROL,
-    INSERT_PERMISO_ROL
+    INSERT_PERMISO_ROL, SELECT_PERMISOS_POR_ROL_PARA_ACTUALIZAR,
+    UPDATE_PERMISO_ROL_MENU, DELETE_PERMISO_ROL_MENU, SENTENCIA_ROL_BY_ID
 )
+from app.db.versiones import IncrementoVersiones
 from app.schemas.rol import (    
     # --- AÑADIR IMPORTACIONES DE SCHEMAS DE PERMISOS ---
     PermisoRead, PermisoUpdatePayload, PermisoBase
 )
 from app.core.exceptions import ServiceError, ValidationError, DatabaseError
+from app.core.auth_cache import usuario_activo_cache
+from app.core.permisos_cache import obtener_indice_permisos, refrescar_indice_permisos
+from app.utils.menu_cache import menu_por_roles_cache
+from app.utils.etag import incrementar_version, RECURSO_ROLES, RECURSO_PERMISOS
+from app.utils.paginacion import codificar_cursor, decodificar_cursor, conteo_cache
 import logging
 import pyodbc
 
@@ -38,7 +43,7 @@ class RolService:
                 query += " AND rol_id != ?"
                 params.append(rol_id_excluir)
 
-            resultados = execute_query(query, tuple(params)) # No necesita await si execute_query es síncrona
+            resultados = await aexecute_query(query, tuple(params))
 
             if resultados:
                 raise ValidationError(
@@ -77,13 +82,14 @@ class RolService:
                 rol_data.get('es_activo', True) # Valor por defecto si no se proporciona
             )
 
-            result = execute_insert(insert_query, params) # No necesita await si execute_insert es síncrona
+            result = await aexecute_insert(insert_query, params, versiones=IncrementoVersiones(RECURSO_ROLES))
 
             if not result: # execute_insert devuelve {} si no hay OUTPUT o falla silenciosamente
                 # Podría ser mejor que execute_insert lance error si falla
                 raise ServiceError(status_code=500, detail="La creación del rol no devolvió resultados.")
 
             logger.info(f"Rol '{result.get('nombre', 'N/A')}' (ID: {result.get('rol_id', 'N/A')}) creado exitosamente.")
+            incrementar_version(RECURSO_ROLES)
             return result
 
         except ValidationError as e:
@@ -103,17 +109,16 @@ class RolService:
         Permite opcionalmente incluir roles inactivos.
         """
         try:
-            # Modificar query para incluir inactivos si se solicita
-            query = """
-            SELECT rol_id, nombre, descripcion, es_activo, fecha_creacion
-            FROM rol
-            WHERE rol_id = ?
-            """
-            params = [rol_id]
-            if not incluir_inactivos:
-                query += " AND es_activo = 1" # Por defecto solo activos
-
-            resultados = execute_query(query, tuple(params)) # No necesita await
+            if incluir_inactivos:
+                query = """
+                SELECT rol_id, nombre, descripcion, es_activo, fecha_creacion
+                FROM rol
+                WHERE rol_id = ?
+                """
+                resultados = await aexecute_query(query, (rol_id,))
+            else:
+                # Caso habitual (sólo activos): sentencia preparada por conexión
+                resultados = await aexecute_prepared_query(SENTENCIA_ROL_BY_ID, (rol_id,))
 
             if not resultados:
                 logger.debug(f"Rol con ID {rol_id} no encontrado (incluir_inactivos={incluir_inactivos}).")
@@ -146,7 +151,7 @@ class RolService:
             if not incluir_inactivos:
                 query += " AND es_activo = 1" # Por defecto solo activos
 
-            resultados = execute_query(query, tuple(params)) # No necesita await
+            resultados = await aexecute_query(query, tuple(params))
 
             if not resultados:
                 logger.debug(f"Rol con nombre '{nombre}' no encontrado (incluir_inactivos={incluir_inactivos}).")
@@ -179,7 +184,7 @@ class RolService:
             base_query += " ORDER BY rol_id OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
             params.extend([skip, limit])
 
-            resultados = execute_query(base_query, tuple(params)) # No necesita await
+            resultados = await aexecute_query(base_query, tuple(params))
             logger.debug(f"Obtenidos {len(resultados)} roles (skip={skip}, limit={limit}, activos_only={activos_only}).")
 
             # Convertir es_activo a bool si es necesario
@@ -246,7 +251,7 @@ class RolService:
             WHERE rol_id = ?
             """
 
-            result = execute_update(update_query, tuple(params)) # No necesita await
+            result = await aexecute_update(update_query, tuple(params), versiones=IncrementoVersiones(RECURSO_ROLES, roles=(rol_id,)))
 
             if not result:
                 # Esto podría ocurrir si el rol fue eliminado justo antes del update
@@ -255,6 +260,9 @@ class RolService:
                 raise ServiceError(status_code=500, detail="Error al actualizar el rol, posible concurrencia o fallo en la BD.")
 
             logger.info(f"Rol '{result.get('nombre', 'N/A')}' (ID: {result.get('rol_id', 'N/A')}) actualizado exitosamente.")
+            # Los roles van embebidos en los usuarios cacheados: descartarlos todos
+            usuario_activo_cache.invalidar_todo()
+            incrementar_version(RECURSO_ROLES)
             # Convertir es_activo a bool si es necesario
             if 'es_activo' in result and isinstance(result['es_activo'], int):
                  result['es_activo'] = bool(result['es_activo'])
@@ -289,7 +297,7 @@ class RolService:
                 return rol_actual
 
             # 2. Usar la query DEACTIVATE_ROL de queries.py
-            result = execute_update(DEACTIVATE_ROL, (rol_id,)) # No necesita await
+            result = await aexecute_update(DEACTIVATE_ROL, (rol_id,), versiones=IncrementoVersiones(RECURSO_ROLES, roles=(rol_id,)))
 
             if not result:
                 # Podría ser por concurrencia (alguien lo desactivó entre el check y el update)
@@ -303,6 +311,9 @@ class RolService:
                 raise ServiceError(status_code=500, detail="Error al desactivar el rol, estado inconsistente o rol no encontrado.")
 
             logger.info(f"Rol '{result.get('nombre', 'N/A')}' (ID: {result.get('rol_id', 'N/A')}) desactivado exitosamente.")
+            # Los roles van embebidos en los usuarios cacheados: descartarlos todos
+            usuario_activo_cache.invalidar_todo()
+            incrementar_version(RECURSO_ROLES)
             # Convertir es_activo a bool si es necesario
             if 'es_activo' in result and isinstance(result['es_activo'], int):
                  result['es_activo'] = bool(result['es_activo'])
@@ -338,7 +349,7 @@ class RolService:
                 return rol_actual
 
             # 2. Usar la query REACTIVATE_ROL de queries.py
-            result = execute_update(REACTIVATE_ROL, (rol_id,)) # No necesita await
+            result = await aexecute_update(REACTIVATE_ROL, (rol_id,), versiones=IncrementoVersiones(RECURSO_ROLES, roles=(rol_id,)))
 
             if not result:
                 # Podría ser por concurrencia (alguien lo reactivó o eliminó entre el check y el update)
@@ -352,6 +363,9 @@ class RolService:
                 raise ServiceError(status_code=500, detail="Error al reactivar el rol, estado inconsistente o rol no encontrado.")
 
             logger.info(f"Rol '{result.get('nombre', 'N/A')}' (ID: {result.get('rol_id', 'N/A')}) reactivado exitosamente.")
+            # Los roles van embebidos en los usuarios cacheados: descartarlos todos
+            usuario_activo_cache.invalidar_todo()
+            incrementar_version(RECURSO_ROLES)
             # Convertir es_activo a bool si es necesario (aunque debería ser True)
             if 'es_activo' in result and isinstance(result['es_activo'], int):
                  result['es_activo'] = bool(result['es_activo'])
@@ -374,13 +388,19 @@ class RolService:
     async def obtener_roles_paginados( # Nombre en español mantenido
         page: int = 1,
         limit: int = 10,
-        search: Optional[str] = None
+        search: Optional[str] = None,
+        cursor: Optional[str] = None,
+        incluir_total: bool = True
     ) -> Dict:
         """
         Obtiene una lista paginada de roles (activos e inactivos).
         Permite búsqueda por nombre o descripción (insensible a mayúsculas/minúsculas).
+
+        Con 'cursor' (el 'siguiente_cursor' de la página anterior) pagina por
+        keyset sobre rol_id en lugar de OFFSET e ignora 'page'. Con
+        incluir_total=False no se cuenta el total; el conteo se cachea unos segundos.
         """
-        logger.info(f"Iniciando obtener_roles_paginados: page={page}, limit={limit}, search='{search}'")
+        logger.info(f"Iniciando obtener_roles_paginados: page={page}, limit={limit}, search='{search}', cursor={'sí' if cursor else 'no'}")
 
         # Validar entrada
         if page < 1:
@@ -389,6 +409,13 @@ class RolService:
             # Permitir limit=0 podría tener sentido si solo se quiere el conteo, pero usualmente no.
             raise ValidationError(status_code=400, detail="El límite por página debe ser mayor o igual a 0.")
 
+        ultimo_id = None
+        if cursor:
+            try:
+                ultimo_id = decodificar_cursor(cursor, search)
+            except ValueError as e:
+                raise ValidationError(status_code=400, detail=f"Cursor de paginación no válido: {e}.")
+
         offset = (page - 1) * limit
         # Preparar parámetro de búsqueda para LIKE (insensible a mayúsculas/minúsculas ya manejado en SQL con LOWER())
         search_param = f"%{search}%" if search else None
@@ -397,33 +424,50 @@ class RolService:
         count_params = (search_param, search_param, search_param)
         select_params = (search_param, search_param, search_param, offset, limit)
 
-        try:
-            # --- 1. Contar el total de roles que coinciden ---
+        async def contar_roles() -> int:
             logger.debug(f"Ejecutando COUNT_ROLES_PAGINATED con params: {count_params}")
-            count_result = execute_query(COUNT_ROLES_PAGINATED, count_params) # No necesita await
+            count_result = await aexecute_query(COUNT_ROLES_PAGINATED, count_params)
 
             # Validar resultado del conteo
             if not count_result or not isinstance(count_result, list) or len(count_result) == 0 or 'total' not in count_result[0]:
                  logger.error(f"Error al contar roles: la consulta COUNT_ROLES_PAGINATED no devolvió el resultado esperado ('total'). Resultado: {count_result}")
                  raise ServiceError(status_code=500, detail="Error al obtener el total de roles.")
+            return count_result[0]['total']
 
-            total_roles = count_result[0]['total']
-            logger.debug(f"Total de roles encontrados (sin paginar): {total_roles}")
+        try:
+            # --- 1. Contar el total de roles que coinciden (opcional, cacheado) ---
+            total_roles = None
+            if incluir_total:
+                total_roles = await conteo_cache.obtener(RECURSO_ROLES, search, contar_roles)
+                logger.debug(f"Total de roles encontrados (sin paginar): {total_roles}")
 
             # --- 2. Obtener los datos paginados de los roles (solo si hay roles o limit > 0) ---
             lista_roles = []
-            if total_roles > 0 and limit > 0:
+            hay_siguiente = False
+            if total_roles == 0:
+                 logger.debug("Total de roles es 0, no se recuperan roles.")
+            elif ultimo_id is not None:
+                # Un rol de más para saber si hay página siguiente
+                keyset_params = (limit + 1, ultimo_id, search_param, search_param, search_param)
+                logger.debug(f"Ejecutando SELECT_ROLES_KEYSET con params: {keyset_params}")
+                lista_roles = await aexecute_query(SELECT_ROLES_KEYSET, keyset_params)
+                hay_siguiente = len(lista_roles) > limit
+                lista_roles = lista_roles[:limit]
+                logger.debug(f"Obtenidos {len(lista_roles)} roles tras rol_id {ultimo_id}.")
+            else:
                 logger.debug(f"Ejecutando SELECT_ROLES_PAGINATED con params: {select_params}")
-                lista_roles = execute_query(SELECT_ROLES_PAGINATED, select_params) # No necesita await
+                lista_roles = await aexecute_query(SELECT_ROLES_PAGINATED, select_params)
+                hay_siguiente = offset + limit < total_roles if total_roles is not None else len(lista_roles) >= limit
                 logger.debug(f"Obtenidos {len(lista_roles)} roles para la página {page}.")
-            elif limit == 0:
-                 logger.debug("Limit es 0, no se recuperan roles, solo el conteo.")
-            else:
-                 logger.debug("Total de roles es 0, no se recuperan roles.")
 
 
-            # --- 3. Calcular total de páginas ---
-            total_paginas = math.ceil(total_roles / limit) if limit > 0 else 0
+            # --- 3. Calcular total de páginas y cursor siguiente ---
+            total_paginas = None
+            if total_roles is not None:
+                total_paginas = math.ceil(total_roles / limit) if limit > 0 else 0
+            siguiente_cursor = None
+            if hay_siguiente and lista_roles:
+                siguiente_cursor = codificar_cursor(lista_roles[-1]['rol_id'], search)
 
             # --- 4. Procesar y construir el diccionario de respuesta final ---
             roles_procesados = []
@@ -437,8 +481,9 @@ class RolService:
             response_data = {
                 "roles": roles_procesados,
                 "total_roles": total_roles,
-                "pagina_actual": page,
-                "total_paginas": total_paginas
+                "pagina_actual": page if ultimo_id is None else None,
+                "total_paginas": total_paginas,
+                "siguiente_cursor": siguiente_cursor
             }
 
             logger.info(f"obtener_roles_paginados completado exitosamente.")
@@ -475,9 +520,8 @@ class RolService:
             ORDER BY nombre ASC;
         """
         try:
-            # Asumiendo que execute_query maneja la conexión y es síncrona
             # (basado en el uso sin 'await' en otros métodos)
-            resultados = execute_query(query)
+            resultados = await aexecute_query(query)
 
             roles_procesados = []
             for rol_dict in resultados:
@@ -518,7 +562,8 @@ class RolService:
              raise ServiceError(status_code=status.HTTP_404_NOT_FOUND, detail=f"Rol con ID {rol_id} no encontrado.")
 
         try:
-            resultados = execute_query(SELECT_PERMISOS_POR_ROL, (rol_id,))
+            # Servido desde el índice en memoria de permisos (ver app/core/permisos_cache.py)
+            resultados = (await obtener_indice_permisos()).permisos_de_rol(rol_id)
             if not resultados:
                 logger.info(f"El rol ID {rol_id} no tiene permisos asignados.")
                 return [] # Devolver lista vacía si no hay permisos es correcto
@@ -549,33 +594,53 @@ class RolService:
         nuevos_permisos: List[PermisoBase] = permisos_payload.permisos
         logger.debug(f"Se actualizarán {len(nuevos_permisos)} permisos para el rol {rol_id}.")
 
+        # menu_id -> (ver, editar, eliminar) deseado; si un menú se repite gana el último
+        deseados = {
+            permiso.menu_id: (bool(permiso.puede_ver), bool(permiso.puede_editar), bool(permiso.puede_eliminar))
+            for permiso in nuevos_permisos
+        }
+        cambios = {"insertados": 0, "actualizados": 0, "eliminados": 0}
+
         # 2. Definir la función que contiene las operaciones de la transacción
         def _operaciones_permisos(cursor: pyodbc.Cursor): # La función recibe el cursor
-            # Borrar permisos existentes
-            logger.debug(f"Borrando permisos existentes para rol {rol_id} en transacción.")
-            cursor.execute(DELETE_PERMISOS_POR_ROL, (rol_id,))
-            logger.debug(f"Permisos existentes borrados para rol {rol_id}.")
-
-            # Insertar nuevos permisos
-            if nuevos_permisos:
-                logger.debug(f"Insertando {len(nuevos_permisos)} nuevos permisos para rol {rol_id}.")
-                insert_count = 0
-                for permiso in nuevos_permisos:
-                    # --- VALIDACIÓN DE DATOS (IMPORTANTE) ---
-                    # Aquí es donde ocurre el IntegrityError si menu_id es inválido.
-                    # El error de BD es correcto, pero el problema son los datos de entrada.
-                    params = (rol_id, permiso.menu_id, permiso.puede_ver, permiso.puede_editar, permiso.puede_eliminar)
-                    cursor.execute(INSERT_PERMISO_ROL, params)
-                    insert_count += 1
-                logger.debug(f"Insertados {insert_count} permisos para rol {rol_id}.")
-            else:
-                 logger.debug(f"No hay nuevos permisos para insertar para rol {rol_id}.")
+            # Leer los permisos actuales (bloqueados hasta el commit) y calcular el diff
+            cursor.execute(SELECT_PERMISOS_POR_ROL_PARA_ACTUALIZAR, (rol_id,))
+            actuales = {
+                menu_id: (bool(ver), bool(editar), bool(eliminar))
+                for menu_id, ver, editar, eliminar in cursor.fetchall()
+            }
+            inserts = [(rol_id, menu_id) + flags for menu_id, flags in deseados.items() if menu_id not in actuales]
+            updates = [
+                flags + (rol_id, menu_id) for menu_id, flags in deseados.items()
+                if menu_id in actuales and actuales[menu_id] != flags
+            ]
+            deletes = [(rol_id, menu_id) for menu_id in actuales if menu_id not in deseados]
+            logger.debug(f"Diff de permisos para rol {rol_id}: {len(inserts)} altas, {len(updates)} cambios, {len(deletes)} bajas.")
+
+            # Sólo las filas que cambian, cada grupo en un único executemany
+            cursor.fast_executemany = True
+            if deletes:
+                cursor.executemany(DELETE_PERMISO_ROL_MENU, deletes)
+            if updates:
+                cursor.executemany(UPDATE_PERMISO_ROL_MENU, updates)
+            if inserts:
+                # Un menu_id inexistente provoca aquí el IntegrityError (FK) y se revierte todo
+                cursor.executemany(INSERT_PERMISO_ROL, inserts)
+            cambios.update(insertados=len(inserts), actualizados=len(updates), eliminados=len(deletes))
+            if inserts or updates or deletes:
+                # Versión compartida de permisos, en la misma transacción (ETags e índices de otros workers)
+                IncrementoVersiones(RECURSO_PERMISOS).aplicar(cursor)
             # --- NO HACER COMMIT NI ROLLBACK AQUÍ ---
 
         try:
             # 3. Llamar a execute_transaction pasando la función de operaciones
-            execute_transaction(_operaciones_permisos)
-            logger.info(f"Permisos actualizados exitosamente para el rol ID: {rol_id}")
+            await aexecute_transaction(_operaciones_permisos)
+            logger.info(f"Permisos actualizados exitosamente para el rol ID: {rol_id} ({cambios})")
+            if not any(cambios.values()):
+                return
+            await refrescar_indice_permisos()
+            menu_por_roles_cache.invalidar("permisos modificados")
+            incrementar_version(RECURSO_PERMISOS)
 
         except DatabaseError as db_error: # Capturar DatabaseError de execute_transaction
             logger.error(f"Error de base de datos durante la transacción de permisos para rol {rol_id}: {db_error}", exc_info=True)
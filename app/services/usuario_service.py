@@ -1,12 +1,21 @@
 # app/services/usuario_service.py (MODIFICADO)
 
-from datetime import datetime # <--- AÑADIR ESTA LÍNEA
+import asyncio
 import math # Necesario para calcular total_paginas
-from typing import Dict, List, Optional
-# Asegúrate que estas funciones manejen correctamente conexiones/cursores asíncronos si es necesario
-from app.db.queries import execute_query, execute_insert, execute_update, execute_auth_query
-from app.core.exceptions import ServiceError, ValidationError
-from app.core.security import get_password_hash
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+import pyodbc
+from pydantic import ValidationError as PydanticValidationError
+# Versiones awaitables: ejecutan pyodbc en el executor de BD sin bloquear el event loop
+from app.db.async_queries import aexecute_query, aexecute_prepared_query, aexecute_insert, aexecute_update, aexecute_transaction
+from app.core.config import settings
+from app.core.exceptions import ServiceError, ValidationError, DatabaseError
+from app.core.security import aget_password_hash
+from app.core.auth_cache import usuario_activo_cache
+from app.core.busqueda_usuarios import obtener_indice_busqueda_usuarios, registrar_usuario, registrar_usuarios, quitar_usuario
+from app.utils.etag import incrementar_version, RECURSO_USUARIOS
+from app.utils.paginacion import codificar_cursor, decodificar_cursor, conteo_cache
 # --- Importar y configurar logger ---
 from app.core.logging_config import get_logger # Importa tu configuración de logger
 # --- Importar RolService ---
@@ -15,18 +24,35 @@ from app.services.rol_service import RolService
 
 # Asegúrate que las nuevas queries estén importadas o accesibles
 from app.db.queries import (
-    execute_query, execute_insert, execute_update, execute_auth_query,
     SELECT_USUARIOS_PAGINATED, # <--- NUEVA QUERY
-    COUNT_USUARIOS_PAGINATED   # <--- NUEVA QUERY
+    SELECT_USUARIOS_KEYSET,
+    SELECT_ROLES_DE_USUARIOS_TEMPLATE,
+    SELECT_USUARIOS_POR_IDS_TEMPLATE,
+    COUNT_USUARIOS_PAGINATED,   # <--- NUEVA QUERY
+    SELECT_USUARIOS_EXISTENTES_TEMPLATE,
+    INSERT_USUARIO_IMPORT,
+    SELECT_USUARIOS_IMPORTADOS_TEMPLATE,
+    SELECT_USUARIOS_EXISTENTES_POR_IDS_TEMPLATE,
+    SELECT_ROLES_POR_IDS_TEMPLATE,
+    SELECT_USUARIO_ROL_PARA_ACTUALIZAR_TEMPLATE,
+    INSERT_USUARIO_ROL,
+    REACTIVATE_USUARIO_ROL,
+    DEACTIVATE_USUARIO_ROL,
+    SENTENCIA_ROLES_DE_USUARIO,
+    SENTENCIA_NOMBRES_ROLES_DE_USUARIO
 )
+from app.db.versiones import IncrementoVersiones
 
 # Necesitamos los schemas para estructurar la respuesta y para los tipos internos
-from app.schemas.usuario import UsuarioReadWithRoles, PaginatedUsuarioResponse
+from app.schemas.usuario import UsuarioCreate, UsuarioReadWithRoles, PaginatedUsuarioResponse
 from app.schemas.rol import RolRead
 
 # --- Inicializar logger ---
 logger = get_logger(__name__) # Usa el logger configurado
 
+# Valores por lista IN: SQL Server admite hasta 2100 parámetros por consulta
+_MAX_VALORES_IN = 1000
+
 class UsuarioService:
 
     # --- MÉTODO NUEVO: Obtener solo nombres de roles para un usuario ---
@@ -38,15 +64,8 @@ class UsuarioService:
         """
         role_names = []
         try:
-            # Query para obtener solo los nombres de los roles activos
-            query = """
-            SELECT r.nombre
-            FROM dbo.rol r
-            INNER JOIN dbo.usuario_rol ur ON r.rol_id = ur.rol_id
-            WHERE ur.usuario_id = ? AND ur.es_activo = 1 AND r.es_activo = 1;
-            """
-            # Usar execute_query que debería devolver una lista de diccionarios
-            results = execute_query(query, (user_id,)) # execute_query debe ser async si la conexión lo es
+            # Sólo los nombres de los roles activos (sentencia preparada por conexión)
+            results = await aexecute_prepared_query(SENTENCIA_NOMBRES_ROLES_DE_USUARIO, (user_id,))
 
             if results:
                 # Extraer el nombre de cada diccionario en la lista
@@ -81,7 +100,7 @@ class UsuarioService:
             WHERE usuario_id = ? AND es_eliminado = 0
             """
             # Asumiendo que execute_query devuelve lista de dicts
-            resultados = execute_query(query, (usuario_id,)) # Debe ser await si execute_query es async
+            resultados = await aexecute_query(query, (usuario_id,))
 
             if not resultados:
                 logger.debug(f"Usuario con ID {usuario_id} no encontrado o está eliminado.")
@@ -121,7 +140,7 @@ class UsuarioService:
             FROM dbo.usuario_rol -- Añadir esquema dbo si es necesario
             WHERE usuario_id = ? AND rol_id = ?
             """
-            existing_assignment = execute_query(check_query, (usuario_id, rol_id)) # Debe ser await si es async
+            existing_assignment = await aexecute_query(check_query, (usuario_id, rol_id))
 
             if existing_assignment:
                 assignment = existing_assignment[0]
@@ -132,7 +151,7 @@ class UsuarioService:
                     SELECT usuario_rol_id, usuario_id, rol_id, fecha_asignacion, es_activo
                     FROM dbo.usuario_rol WHERE usuario_rol_id = ?
                     """
-                    final_result = execute_query(get_assignment_query, (assignment['usuario_rol_id'],)) # await?
+                    final_result = await aexecute_query(get_assignment_query, (assignment['usuario_rol_id'],))
                     if not final_result:
                          raise ServiceError(status_code=500, detail="Error obteniendo datos de asignación existente.")
                     return final_result[0]
@@ -146,10 +165,11 @@ class UsuarioService:
                            INSERTED.fecha_asignacion, INSERTED.es_activo
                     WHERE usuario_rol_id = ?
                     """
-                    result = execute_update(update_query, (assignment['usuario_rol_id'],)) # await?
+                    result = await aexecute_update(update_query, (assignment['usuario_rol_id'],), versiones=IncrementoVersiones(usuarios=(usuario_id,)))
                     if not result:
                          raise ServiceError(status_code=500, detail="Error reactivando la asignación de rol.")
                     logger.info(f"Asignación reactivada exitosamente.")
+                    usuario_activo_cache.invalidar_usuario(usuario_id)
                     return result
             else:
                 # Crear nueva asignación
@@ -160,10 +180,11 @@ class UsuarioService:
                        INSERTED.fecha_asignacion, INSERTED.es_activo
                 VALUES (?, ?, 1)
                 """
-                result = execute_insert(insert_query, (usuario_id, rol_id)) # await?
+                result = await aexecute_insert(insert_query, (usuario_id, rol_id), versiones=IncrementoVersiones(usuarios=(usuario_id,)))
                 if not result:
                     raise ServiceError(status_code=500, detail="Error creando la asignación de rol.")
                 logger.info(f"Asignación creada exitosamente.")
+                usuario_activo_cache.invalidar_usuario(usuario_id)
                 return result
 
         except ValidationError as e:
@@ -185,7 +206,7 @@ class UsuarioService:
             FROM dbo.usuario_rol -- Añadir esquema dbo si es necesario
             WHERE usuario_id = ? AND rol_id = ?
             """
-            existing_assignment = execute_query(check_query, (usuario_id, rol_id)) # await?
+            existing_assignment = await aexecute_query(check_query, (usuario_id, rol_id))
 
             if not existing_assignment:
                  raise ValidationError(status_code=404, detail=f"No existe asignación entre usuario ID {usuario_id} y rol ID {rol_id}.")
@@ -197,7 +218,7 @@ class UsuarioService:
                 SELECT usuario_rol_id, usuario_id, rol_id, fecha_asignacion, es_activo
                 FROM dbo.usuario_rol WHERE usuario_rol_id = ?
                 """
-                final_result = execute_query(get_assignment_query, (assignment['usuario_rol_id'],)) # await?
+                final_result = await aexecute_query(get_assignment_query, (assignment['usuario_rol_id'],))
                 return final_result[0] if final_result else {"message": "Asignación ya inactiva"}
 
             # 2. Desactivar la asignación
@@ -209,7 +230,7 @@ class UsuarioService:
                    INSERTED.fecha_asignacion, INSERTED.es_activo
             WHERE usuario_rol_id = ? AND es_activo = 1
             """
-            result = execute_update(update_query, (assignment['usuario_rol_id'],)) # await?
+            result = await aexecute_update(update_query, (assignment['usuario_rol_id'],), versiones=IncrementoVersiones(usuarios=(usuario_id,)))
 
             if not result:
                 logger.warning(f"No se pudo desactivar la asignación ID {assignment['usuario_rol_id']}, posible concurrencia o ya estaba inactiva.")
@@ -218,11 +239,12 @@ class UsuarioService:
                 SELECT usuario_rol_id, usuario_id, rol_id, fecha_asignacion, es_activo
                 FROM dbo.usuario_rol WHERE usuario_rol_id = ?
                 """
-                final_result = execute_query(get_assignment_query, (assignment['usuario_rol_id'],)) # await?
+                final_result = await aexecute_query(get_assignment_query, (assignment['usuario_rol_id'],))
                 return final_result[0] if final_result else {"message": "No se pudo desactivar la asignación"}
 
 
             logger.info(f"Asignación desactivada exitosamente.")
+            usuario_activo_cache.invalidar_usuario(usuario_id)
             return result
 
         except ValidationError as e:
@@ -232,6 +254,108 @@ class UsuarioService:
             logger.exception(f"Error inesperado revocando rol {rol_id} de usuario {usuario_id}: {str(e)}")
             raise ServiceError(status_code=500, detail=f"Error revocando rol: {str(e)}")
 
+    @staticmethod
+    async def _cambiar_roles_masivo(usuario_ids: List[int], rol_ids: List[int], activar: bool) -> Dict:
+        """
+        Deja activas (activar=True) o inactivas todas las asignaciones del
+        producto usuario_ids x rol_ids con dos consultas de validación y una
+        sola transacción, e invalida de una vez la caché de los usuarios afectados.
+        """
+        operacion = "asignación" if activar else "revocación"
+        usuario_ids = sorted(set(usuario_ids))
+        rol_ids = sorted(set(rol_ids))
+        logger.info(f"Iniciando {operacion} masiva: {len(usuario_ids)} usuarios x {len(rol_ids)} roles.")
+
+        try:
+            # 1. Validar todos los IDs con dos consultas
+            usuarios = await aexecute_query(
+                SELECT_USUARIOS_EXISTENTES_POR_IDS_TEMPLATE.format(placeholders=", ".join("?" * len(usuario_ids))),
+                tuple(usuario_ids)
+            )
+            roles = await aexecute_query(
+                SELECT_ROLES_POR_IDS_TEMPLATE.format(placeholders=", ".join("?" * len(rol_ids))),
+                tuple(rol_ids)
+            )
+            usuarios_faltantes = sorted(set(usuario_ids) - {u['usuario_id'] for u in usuarios or []})
+            if usuarios_faltantes:
+                raise ValidationError(status_code=404, detail=f"Usuarios no encontrados: {usuarios_faltantes}.")
+            roles_faltantes = sorted(set(rol_ids) - {r['rol_id'] for r in roles or []})
+            if roles_faltantes:
+                raise ValidationError(status_code=404, detail=f"Roles no encontrados: {roles_faltantes}.")
+            if activar:
+                roles_inactivos = sorted(r['rol_id'] for r in roles if not r['es_activo'])
+                if roles_inactivos:
+                    raise ValidationError(status_code=400, detail=f"Roles no activos: {roles_inactivos}.")
+
+            resumen = {"usuarios": len(usuario_ids), "roles": len(rol_ids), "creadas": 0, "reactivadas": 0, "desactivadas": 0, "sin_cambios": 0}
+            afectados = set()
+
+            # 2. Aplicar todo el diff en una transacción
+            def _operaciones(cursor: pyodbc.Cursor) -> None:
+                cursor.execute(
+                    SELECT_USUARIO_ROL_PARA_ACTUALIZAR_TEMPLATE.format(
+                        usuarios=", ".join("?" * len(usuario_ids)),
+                        roles=", ".join("?" * len(rol_ids))
+                    ),
+                    tuple(usuario_ids) + tuple(rol_ids)
+                )
+                existentes = {(usuario_id, rol_id): (usuario_rol_id, bool(es_activo))
+                              for usuario_rol_id, usuario_id, rol_id, es_activo in cursor.fetchall()}
+
+                inserts, cambios = [], []
+                for par in ((usuario_id, rol_id) for usuario_id in usuario_ids for rol_id in rol_ids):
+                    existente = existentes.get(par)
+                    if existente is None:
+                        if activar:
+                            inserts.append(par)
+                    elif existente[1] != activar:
+                        cambios.append((existente[0],))
+                    else:
+                        continue
+                    afectados.add(par[0])
+
+                cursor.fast_executemany = True
+                if inserts:
+                    cursor.executemany(INSERT_USUARIO_ROL, inserts)
+                if cambios:
+                    cursor.executemany(REACTIVATE_USUARIO_ROL if activar else DEACTIVATE_USUARIO_ROL, cambios)
+
+                resumen["creadas"] = len(inserts)
+                resumen["reactivadas" if activar else "desactivadas"] = len(cambios)
+                resumen["sin_cambios"] = len(usuario_ids) * len(rol_ids) - len(inserts) - len(cambios)
+                # Invalida los tokens autocontenidos de los afectados (claim 'pv'), en la misma transacción
+                IncrementoVersiones(usuarios=sorted(afectados)).aplicar(cursor)
+
+            await aexecute_transaction(_operaciones)
+
+            # 3. Invalidar de una vez la caché de los usuarios afectados
+            usuario_activo_cache.invalidar_usuarios(afectados)
+            logger.info(f"{operacion.capitalize()} masiva completada: {resumen}")
+            return resumen
+
+        except ValidationError as e:
+            logger.warning(f"Error de validación en la {operacion} masiva de roles: {e.detail}")
+            raise e
+        except DatabaseError as e:
+            logger.error(f"Error de base de datos en la {operacion} masiva de roles: {e.detail}")
+            raise ServiceError(status_code=500, detail=f"Error de base de datos en la {operacion} masiva de roles: {e.detail}")
+        except Exception as e:
+            logger.exception(f"Error inesperado en la {operacion} masiva de roles: {str(e)}")
+            raise ServiceError(status_code=500, detail=f"Error en la {operacion} masiva de roles: {str(e)}")
+
+    @staticmethod
+    async def asignar_roles_masivo(usuario_ids: List[int], rol_ids: List[int]) -> Dict:
+        """
+        Asigna todos los roles a todos los usuarios (crea o reactiva las
+        asignaciones que falten). Todo o nada.
+        """
+        return await UsuarioService._cambiar_roles_masivo(usuario_ids, rol_ids, activar=True)
+
+    @staticmethod
+    async def revocar_roles_masivo(usuario_ids: List[int], rol_ids: List[int]) -> Dict:
+        """Revoca (desactiva) todos los roles a todos los usuarios. Todo o nada."""
+        return await UsuarioService._cambiar_roles_masivo(usuario_ids, rol_ids, activar=False)
+
     @staticmethod
     async def obtener_roles_de_usuario(usuario_id: int) -> List[Dict]:
         """
@@ -244,15 +368,7 @@ class UsuarioService:
             #     logger.warning(f"Intento de obtener roles para usuario inexistente ID {usuario_id}.")
             #     return []
 
-            query = """
-            SELECT
-                r.rol_id, r.nombre, r.descripcion, r.es_activo, r.fecha_creacion
-            FROM dbo.rol r -- Añadir esquema dbo si es necesario
-            INNER JOIN dbo.usuario_rol ur ON r.rol_id = ur.rol_id -- Añadir esquema dbo si es necesario
-            WHERE ur.usuario_id = ? AND ur.es_activo = 1 AND r.es_activo = 1
-            ORDER BY r.nombre;
-            """
-            roles = execute_query(query, (usuario_id,)) # await?
+            roles = await aexecute_prepared_query(SENTENCIA_ROLES_DE_USUARIO, (usuario_id,))
             logger.debug(f"Obtenidos {len(roles)} roles activos (detalle) para usuario ID {usuario_id}.")
             return roles
 
@@ -279,8 +395,7 @@ class UsuarioService:
             """
             # Pasar los valores en minúsculas para la comparación
             params = (nombre_usuario.lower(), correo.lower())
-            # Asumiendo que execute_query es síncrono basado en tu código
-            resultados = execute_query(query, params) # await?
+            resultados = await aexecute_query(query, params)
 
             if resultados:
                 # Comprobar exactamente qué campo coincide (ya comparado en minúsculas en SQL)
@@ -319,7 +434,7 @@ class UsuarioService:
             )
 
             # 2. Hash de la contraseña
-            hashed_password = get_password_hash(usuario_data['contrasena'])
+            hashed_password = await aget_password_hash(usuario_data['contrasena'])
 
             # 3. Insertar nuevo usuario
             insert_query = """
@@ -341,12 +456,15 @@ class UsuarioService:
                 usuario_data.get('nombre'), # Usar .get() para campos opcionales
                 usuario_data.get('apellido')
             )
-            result = execute_insert(insert_query, params) # await?
+            versiones = IncrementoVersiones(RECURSO_USUARIOS)
+            result = await aexecute_insert(insert_query, params, versiones=versiones)
 
             if not result:
                 raise ServiceError(status_code=500, detail="Error creando usuario en la base de datos.")
 
             logger.info(f"Usuario creado exitosamente con ID: {result.get('usuario_id')}")
+            incrementar_version(RECURSO_USUARIOS)
+            registrar_usuario(result, versiones.nuevas.get(RECURSO_USUARIOS))
 
             # Opcional: Asignar rol por defecto
             # ... (código para asignar rol por defecto) ...
@@ -389,7 +507,7 @@ class UsuarioService:
                 check_nombre_usuario = usuario_data.get('nombre_usuario', usuario_existente.get('nombre_usuario'))
                 check_correo = usuario_data.get('correo', usuario_existente.get('correo'))
                 params_verify = (check_nombre_usuario, check_correo, usuario_id)
-                duplicados = execute_query(verify_query, params_verify) # await?
+                duplicados = await aexecute_query(verify_query, params_verify)
 
                 if duplicados:
                     if any(d['nombre_usuario'] == check_nombre_usuario for d in duplicados):
@@ -418,6 +536,7 @@ class UsuarioService:
 
 
             update_parts.append("fecha_actualizacion = GETDATE()") # Actualizar fecha
+            update_parts.append("version_permisos = version_permisos + 1") # Invalida sus tokens autocontenidos (claim 'pv')
             params_update.append(usuario_id) # Añadir ID para el WHERE
 
             update_query = f"""
@@ -429,7 +548,8 @@ class UsuarioService:
                 INSERTED.fecha_creacion, INSERTED.fecha_actualizacion
             WHERE usuario_id = ? AND es_eliminado = 0
             """
-            result = execute_update(update_query, tuple(params_update)) # await?
+            versiones = IncrementoVersiones(RECURSO_USUARIOS)
+            result = await aexecute_update(update_query, tuple(params_update), versiones=versiones)
 
             if not result:
                 # Podría ser que el usuario fue eliminado concurrentemente
@@ -437,6 +557,9 @@ class UsuarioService:
                 raise ServiceError(status_code=404, detail="Error al actualizar el usuario, no encontrado o no se pudo modificar.")
 
             logger.info(f"Usuario ID {usuario_id} actualizado exitosamente.")
+            usuario_activo_cache.invalidar_usuario(usuario_id)
+            incrementar_version(RECURSO_USUARIOS)
+            registrar_usuario(result, versiones.nuevas.get(RECURSO_USUARIOS))
             return result
 
         except ValidationError as e:
@@ -456,7 +579,7 @@ class UsuarioService:
             # 1. Verificar si el usuario existe y no está eliminado
             # Usar una query simple para verificar existencia y estado
             check_query = "SELECT es_eliminado FROM dbo.usuario WHERE usuario_id = ?"
-            user_status = execute_query(check_query, (usuario_id,)) # await?
+            user_status = await aexecute_query(check_query, (usuario_id,))
 
             if not user_status:
                  raise ValidationError(status_code=404, detail="Usuario no encontrado")
@@ -469,11 +592,12 @@ class UsuarioService:
             # 2. Realizar el borrado lógico
             update_query = """
             UPDATE dbo.usuario -- Añadir esquema dbo si es necesario
-            SET es_eliminado = 1, es_activo = 0, fecha_actualizacion = GETDATE()
+            SET es_eliminado = 1, es_activo = 0, fecha_actualizacion = GETDATE(), version_permisos = version_permisos + 1
             OUTPUT INSERTED.usuario_id, INSERTED.nombre_usuario, INSERTED.es_eliminado
             WHERE usuario_id = ? AND es_eliminado = 0 -- Condición extra por concurrencia
             """
-            result = execute_update(update_query, (usuario_id,)) # await?
+            versiones = IncrementoVersiones(RECURSO_USUARIOS)
+            result = await aexecute_update(update_query, (usuario_id,), versiones=versiones)
 
             if not result:
                 # Podría ser por concurrencia (alguien lo eliminó justo antes)
@@ -488,13 +612,16 @@ class UsuarioService:
                 WHERE usuario_id = ? AND es_activo = 1
                 """
                 # No necesitamos esperar el resultado, pero sí la ejecución si es async
-                execute_update(deactivate_roles_query, (usuario_id,)) # await?
+                await aexecute_update(deactivate_roles_query, (usuario_id,))
                 logger.info(f"Roles desactivados para usuario eliminado ID {usuario_id}.")
             except Exception as role_error:
                  logger.error(f"Error desactivando roles para usuario eliminado ID {usuario_id}: {role_error}")
                  # No fallar la eliminación principal por esto, solo loggear
 
             logger.info(f"Usuario ID {usuario_id} eliminado lógicamente exitosamente.")
+            usuario_activo_cache.invalidar_usuario(usuario_id)
+            incrementar_version(RECURSO_USUARIOS)
+            quitar_usuario(usuario_id, versiones.nuevas.get(RECURSO_USUARIOS))
             return {
                 "message": "Usuario eliminado lógicamente exitosamente",
                 "usuario_id": result['usuario_id'],
@@ -508,22 +635,72 @@ class UsuarioService:
             logger.exception(f"Error inesperado al eliminar usuario ID {usuario_id}: {str(e)}")
             raise ServiceError(status_code=500, detail=f"Error eliminando usuario: {str(e)}")
 
+    @staticmethod
+    async def _obtener_roles_de_usuarios(usuario_ids: List[int]) -> Dict[int, List[RolRead]]:
+        """
+        Roles activos de varios usuarios con una sola consulta (IN), agrupados
+        por usuario_id. Los usuarios sin roles no aparecen en el resultado.
+        """
+        if not usuario_ids:
+            return {}
+        query = SELECT_ROLES_DE_USUARIOS_TEMPLATE.format(placeholders=", ".join("?" * len(usuario_ids)))
+        filas = await aexecute_query(query, tuple(usuario_ids))
+        roles_por_usuario: Dict[int, List[RolRead]] = {}
+        for fila in filas or []:
+            roles_por_usuario.setdefault(fila['usuario_id'], []).append(RolRead(
+                rol_id=fila['rol_id'],
+                nombre=fila['nombre'],
+                descripcion=fila.get('descripcion'),
+                es_activo=fila['es_activo'],
+                fecha_creacion=fila['fecha_creacion']
+            ))
+        return roles_por_usuario
+
+    @staticmethod
+    def _filtro_busqueda(search: Optional[str]) -> Tuple[Optional[str], ...]:
+        """
+        Parámetros del filtro de búsqueda de SELECT_USUARIOS_PAGINATED,
+        SELECT_USUARIOS_KEYSET y COUNT_USUARIOS_PAGINATED: el término (o None
+        sin búsqueda) y dos patrones LIKE por campo.
+
+        Reproduce la semántica del índice en memoria (app/utils/indice_usuarios.py)
+        para que el resultado no dependa de cuál de los dos resuelve la búsqueda:
+        con 3 o más caracteres, subcadena ('%término%'); con 1 o 2, campo o
+        palabra tras un espacio que empieza por el término ('término%' y
+        '% término%'). Los comodines de LIKE del término se buscan literalmente.
+        """
+        if not search:
+            return (None,) * 9
+        termino = search.replace("[", "[[]").replace("%", "[%]").replace("_", "[_]")
+        if len(search) < 3:
+            patrones = (f"{termino}%", f"% {termino}%")
+        else:
+            patrones = (f"%{termino}%", f"%{termino}%")
+        return (search,) + patrones * 4
+
 # --- MÉTODO NUEVO PARA LISTADO PAGINADO ---
     @staticmethod
     async def get_usuarios_paginated(
         # db: pyodbc.Connection, # Descomentar si pasas la conexión directamente
         page: int = 1,
         limit: int = 10,
-        search: Optional[str] = None
+        search: Optional[str] = None,
+        cursor: Optional[str] = None,
+        incluir_total: bool = True
     ) -> Dict:
         """
         Obtiene una lista paginada de usuarios (no eliminados) con sus roles activos.
         Permite búsqueda por nombre de usuario, correo, nombre o apellido.
 
         Args:
-            page: Número de página solicitada (empieza en 1).
+            page: Número de página solicitada (empieza en 1). Se ignora si hay 'cursor'.
             limit: Número máximo de usuarios por página.
-            search: Término de búsqueda opcional.
+            search: Término de búsqueda opcional. Se resuelve con el índice en memoria
+                (app/core/busqueda_usuarios.py) y, si no está disponible, con LIKE en la BD.
+            cursor: 'siguiente_cursor' de la página anterior; pagina por keyset
+                (usuario_id > último entregado) en lugar de OFFSET.
+            incluir_total: Si es False no se cuenta el total (total_usuarios y
+                total_paginas vuelven como None). El total se cachea unos segundos.
 
         Returns:
             Un diccionario con la estructura de PaginatedUsuarioResponse.
@@ -532,98 +709,119 @@ class UsuarioService:
             ServiceError: Si ocurre un error durante la consulta a la BD.
             ValidationError: Si los parámetros de paginación son inválidos.
         """
-        logger.info(f"Iniciando get_usuarios_paginated: page={page}, limit={limit}, search='{search}'")
+        logger.info(f"Iniciando get_usuarios_paginated: page={page}, limit={limit}, search='{search}', cursor={'sí' if cursor else 'no'}")
 
         if page < 1:
             raise ValidationError(status_code=400, detail="El número de página debe ser mayor o igual a 1.")
         if limit < 1:
             raise ValidationError(status_code=400, detail="El límite por página debe ser mayor o igual a 0.")
 
+        ultimo_id = None
+        if cursor:
+            try:
+                ultimo_id = decodificar_cursor(cursor, search)
+            except ValueError as e:
+                raise ValidationError(status_code=400, detail=f"Cursor de paginación no válido: {e}.")
+
         offset = (page - 1) * limit
-        search_param = f"%{search}%" if search else None # Preparar para LIKE
+        filtro_busqueda = UsuarioService._filtro_busqueda(search) # Preparar para LIKE
 
-        try:
-            # --- 1. Contar el total de usuarios que coinciden ---
-            count_params = (search_param, search_param, search_param, search_param, search_param)
-            # NOTA: Asume que execute_query puede ser awaited si es necesario.
-            # Si execute_query es síncrono, elimina 'await' y haz el método síncrono.
-            count_result = execute_query(COUNT_USUARIOS_PAGINATED, count_params)
-            # await execute_query(COUNT_USUARIOS_PAGINATED, count_params) # Si es async
+        async def contar_usuarios() -> int:
+            count_result = await aexecute_query(COUNT_USUARIOS_PAGINATED, filtro_busqueda)
 
             if not count_result or not isinstance(count_result, list) or len(count_result) == 0:
                  logger.error("Error al contar usuarios: la consulta no devolvió resultados esperados.")
                  raise ServiceError(status_code=500, detail="Error al obtener el total de usuarios.")
 
             # El resultado de COUNT es una lista con un diccionario, la primera columna sin nombre
-            total_usuarios = count_result[0].get('') # pyodbc puede devolver columna sin nombre para COUNT(*)
-            if total_usuarios is None:
+            total = count_result[0].get('') # pyodbc puede devolver columna sin nombre para COUNT(*)
+            if total is None:
                  # Intenta obtener por índice si no hay nombre (depende del driver/config)
                  try:
-                     total_usuarios = list(count_result[0].values())[0]
+                     total = list(count_result[0].values())[0]
                  except IndexError:
                      logger.error(f"No se pudo extraer el total de usuarios del resultado: {count_result[0]}")
                      raise ServiceError(status_code=500, detail="Error al interpretar el total de usuarios.")
+            return total
+
+        try:
+            # --- 0. Con búsqueda, resolver los IDs que coinciden con el índice en memoria ---
+            ids_coincidentes = None
+            if search:
+                indice = await obtener_indice_busqueda_usuarios()
+                if indice is not None:
+                    ids_coincidentes = indice.buscar(search)
+
+            # --- 1. Contar el total de usuarios que coinciden (opcional, cacheado) ---
+            total_usuarios = None
+            if incluir_total:
+                if ids_coincidentes is not None:
+                    total_usuarios = len(ids_coincidentes)
+                else:
+                    total_usuarios = await conteo_cache.obtener(RECURSO_USUARIOS, search, contar_usuarios)
+                logger.debug(f"Total de usuarios encontrados (sin paginar): {total_usuarios}")
+
+            # --- 2. Obtener la página de usuarios (una fila por usuario) ---
+            if ids_coincidentes is not None:
+                inicio = bisect_right(ids_coincidentes, ultimo_id) if ultimo_id is not None else offset
+                ids_pagina = ids_coincidentes[inicio:inicio + limit]
+                hay_siguiente = inicio + limit < len(ids_coincidentes)
+                filas_usuarios = []
+                if ids_pagina:
+                    query = SELECT_USUARIOS_POR_IDS_TEMPLATE.format(placeholders=", ".join("?" * len(ids_pagina)))
+                    filas_usuarios = await aexecute_query(query, tuple(ids_pagina)) or []
+            elif ultimo_id is not None:
+                # Se pide un usuario de más para saber si hay página siguiente
+                data_params = (limit + 1, ultimo_id) + filtro_busqueda
+                filas_usuarios = await aexecute_query(SELECT_USUARIOS_KEYSET, data_params) or []
+                hay_siguiente = len(filas_usuarios) > limit
+                filas_usuarios = filas_usuarios[:limit]
+            else:
+                data_params = filtro_busqueda + (offset, limit)
+                filas_usuarios = await aexecute_query(SELECT_USUARIOS_PAGINATED, data_params) or []
+                if total_usuarios is not None:
+                    hay_siguiente = offset + limit < total_usuarios
+                else:
+                    hay_siguiente = len(filas_usuarios) >= limit
 
-            logger.debug(f"Total de usuarios encontrados (sin paginar): {total_usuarios}")
-
-            # --- 2. Obtener los datos paginados de los usuarios y sus roles ---
-            data_params = (search_param, search_param, search_param, search_param, search_param, offset, limit)
-            # NOTA: Asume que execute_query puede ser awaited si es necesario.
-            raw_results = execute_query(SELECT_USUARIOS_PAGINATED, data_params)
-            # await execute_query(SELECT_USUARIOS_PAGINATED, data_params) # Si es async
-
-            # --- 3. Procesar los resultados para agrupar roles por usuario ---
-            usuarios_dict: Dict[int, UsuarioReadWithRoles] = {}
-            if raw_results:
-                logger.debug(f"Procesando {len(raw_results)} filas crudas de la base de datos.")
-                for row in raw_results:
-                    usuario_id = row['usuario_id']
-                    if usuario_id not in usuarios_dict:
-                        # Crear la entrada del usuario si es la primera vez que lo vemos
-                        usuarios_dict[usuario_id] = UsuarioReadWithRoles(
-                            usuario_id=row['usuario_id'],
-                            nombre_usuario=row['nombre_usuario'],
-                            correo=row['correo'],
-                            nombre=row.get('nombre'), # Usar .get() por si son NULL
-                            apellido=row.get('apellido'),
-                            es_activo=row['es_activo'],
-                            correo_confirmado=row['correo_confirmado'],
-                            fecha_creacion=row['fecha_creacion'],
-                            fecha_ultimo_acceso=row.get('fecha_ultimo_acceso'),
-                            fecha_actualizacion=row.get('fecha_actualizacion'),
-                            roles=[] # Inicializar lista de roles vacía
-                        )
-
-                    # Añadir el rol si existe en esta fila (LEFT JOIN puede traer NULLs)
-                    if row.get('rol_id') is not None:
-                        # Crear objeto RolRead
-                        rol_obj = RolRead(
-                            rol_id=row['rol_id'],
-                            nombre=row['nombre_rol'], # Usamos el alias de la query
-                            # Asumimos que la query ya filtró roles inactivos,
-                            # pero si no, necesitarías obtener 'es_activo' del rol aquí.
-                            # Si necesitas 'descripcion' o 'fecha_creacion' del rol,
-                            # añádelos a la query SELECT_USUARIOS_PAGINATED
-                            descripcion=None, # O obtener de la query si se añadió
-                            es_activo=True, # Asumido por el filtro de la query
-                            fecha_creacion=datetime.now() # Placeholder, obtener de la query si se añadió
-                        )
-                        # Evitar duplicados si la query devuelve la misma combinación user/rol varias veces
-                        if rol_obj not in usuarios_dict[usuario_id].roles:
-                             usuarios_dict[usuario_id].roles.append(rol_obj)
-
-            lista_usuarios_procesados = list(usuarios_dict.values())
-            logger.debug(f"Procesados {len(lista_usuarios_procesados)} usuarios únicos.")
-
-            # --- 4. Calcular total de páginas ---
-            total_paginas = math.ceil(total_usuarios / limit) if limit > 0 else 0
+            # --- 3. Cargar los roles de toda la página en una sola consulta ---
+            roles_por_usuario = await UsuarioService._obtener_roles_de_usuarios(
+                [row['usuario_id'] for row in filas_usuarios]
+            )
+            lista_usuarios_procesados = [
+                UsuarioReadWithRoles(
+                    usuario_id=row['usuario_id'],
+                    nombre_usuario=row['nombre_usuario'],
+                    correo=row['correo'],
+                    nombre=row.get('nombre'), # Usar .get() por si son NULL
+                    apellido=row.get('apellido'),
+                    es_activo=row['es_activo'],
+                    correo_confirmado=row['correo_confirmado'],
+                    fecha_creacion=row['fecha_creacion'],
+                    fecha_ultimo_acceso=row.get('fecha_ultimo_acceso'),
+                    fecha_actualizacion=row.get('fecha_actualizacion'),
+                    roles=roles_por_usuario.get(row['usuario_id'], [])
+                )
+                for row in filas_usuarios
+            ]
+            logger.debug(f"Procesados {len(lista_usuarios_procesados)} usuarios.")
+
+            # --- 4. Calcular total de páginas y cursor de la página siguiente ---
+            total_paginas = None
+            if total_usuarios is not None:
+                total_paginas = math.ceil(total_usuarios / limit) if limit > 0 else 0
+
+            siguiente_cursor = None
+            if hay_siguiente and lista_usuarios_procesados:
+                siguiente_cursor = codificar_cursor(lista_usuarios_procesados[-1].usuario_id, search)
 
             # --- 5. Construir el diccionario de respuesta final ---
             response_data = {
                 "usuarios": [u.model_dump() for u in lista_usuarios_procesados], # Convertir a dicts para la respuesta
                 "total_usuarios": total_usuarios,
-                "pagina_actual": page,
-                "total_paginas": total_paginas
+                "pagina_actual": page if ultimo_id is None else None,
+                "total_paginas": total_paginas,
+                "siguiente_cursor": siguiente_cursor
             }
 
             # Validar con Pydantic (opcional pero recomendado para asegurar consistencia)
@@ -644,4 +842,166 @@ class UsuarioService:
             # Considera si quieres exponer detalles del error SQL al cliente
             raise ServiceError(status_code=500, detail=f"Error obteniendo la lista de usuarios: {str(e)}")
 
+    # --- IMPORTACIÓN MASIVA ---
+
+    @staticmethod
+    def _mensaje_validacion(error: PydanticValidationError) -> str:
+        return "; ".join(
+            f"{'.'.join(str(parte) for parte in e['loc']) or 'fila'}: {e['msg']}" for e in error.errors()
+        )
+
+    @staticmethod
+    async def _buscar_existentes(nombres: List[str], correos: List[str]) -> List[Dict]:
+        """
+        Usuarios (incluidos los eliminados, por la UNIQUE) que ya usan alguno de
+        los nombres de usuario o correos (la intercalación de la BD no distingue
+        mayúsculas), en lotes que respetan el límite de parámetros de SQL Server.
+        """
+        existentes = []
+        for inicio in range(0, len(nombres), _MAX_VALORES_IN):
+            lote_nombres = nombres[inicio:inicio + _MAX_VALORES_IN]
+            lote_correos = correos[inicio:inicio + _MAX_VALORES_IN]
+            query = SELECT_USUARIOS_EXISTENTES_TEMPLATE.format(
+                nombres=", ".join("?" * len(lote_nombres)),
+                correos=", ".join("?" * len(lote_correos))
+            )
+            existentes.extend(await aexecute_query(query, tuple(lote_nombres) + tuple(lote_correos)) or [])
+        return existentes
+
+    @staticmethod
+    async def importar_usuarios(filas: List[Any]) -> Dict:
+        """
+        Crea en bloque los usuarios de 'filas' (dicts con los campos de
+        UsuarioCreate) e informa del resultado fila por fila.
+
+        - Cada fila se valida con UsuarioCreate; los duplicados dentro del lote
+          y contra la BD (una consulta para todo el lote) se rechazan con su error.
+        - Las contraseñas de las filas válidas se hashean en paralelo en el pool de bcrypt.
+        - Las filas válidas se insertan en una sola transacción con
+          executemany (fast_executemany). Si la transacción falla no se crea
+          ninguna y todas se informan con el error.
+
+        Raises:
+            ValidationError: Si el lote está vacío o supera USUARIOS_IMPORT_MAX_ROWS.
+            ServiceError: Si falla la verificación de duplicados.
+        """
+        total_filas = len(filas)
+        if total_filas == 0:
+            raise ValidationError(status_code=400, detail="No se recibieron usuarios para importar.")
+        if total_filas > settings.USUARIOS_IMPORT_MAX_ROWS:
+            raise ValidationError(
+                status_code=413,
+                detail=f"La importación admite como máximo {settings.USUARIOS_IMPORT_MAX_ROWS} usuarios por solicitud ({total_filas} recibidos)."
+            )
+        logger.info(f"Iniciando importación masiva de {total_filas} usuarios.")
+
+        resultados: List[Dict[str, Any]] = []
+        validos: List[Dict[str, Any]] = []  # {"resultado", "usuario"} de las filas que pasan la validación
+        fila_por_nombre: Dict[str, int] = {}
+        fila_por_correo: Dict[str, int] = {}
+
+        # --- 1. Validar cada fila y detectar duplicados dentro del lote ---
+        for numero, fila in enumerate(filas, start=1):
+            resultado = {"fila": numero, "nombre_usuario": None, "correo": None, "creado": False, "usuario_id": None, "error": None}
+            resultados.append(resultado)
+            if not isinstance(fila, dict):
+                resultado["error"] = "La fila debe ser un objeto con los campos del usuario."
+                continue
+            resultado["nombre_usuario"] = fila.get("nombre_usuario")
+            resultado["correo"] = fila.get("correo")
+            try:
+                usuario = UsuarioCreate(**fila)
+            except PydanticValidationError as e:
+                resultado["error"] = UsuarioService._mensaje_validacion(e)
+                continue
+
+            nombre, correo = usuario.nombre_usuario.lower(), usuario.correo.lower()
+            if nombre in fila_por_nombre:
+                resultado["error"] = f"Nombre de usuario repetido en el lote (fila {fila_por_nombre[nombre]})."
+                continue
+            if correo in fila_por_correo:
+                resultado["error"] = f"Correo repetido en el lote (fila {fila_por_correo[correo]})."
+                continue
+            fila_por_nombre[nombre] = numero
+            fila_por_correo[correo] = numero
+            validos.append({"resultado": resultado, "usuario": usuario})
+
+        # --- 2. Duplicados contra la BD: una sola consulta para todo el lote ---
+        if validos:
+            try:
+                existentes = await UsuarioService._buscar_existentes(list(fila_por_nombre), list(fila_por_correo))
+            except Exception as e:
+                logger.exception(f"Error verificando duplicados de la importación masiva: {e}")
+                raise ServiceError(status_code=500, detail=f"Error en la verificación de usuarios existentes: {str(e)}")
+            nombres_en_uso = {(r['nombre_usuario'] or '').lower() for r in existentes}
+            correos_en_uso = {(r['correo'] or '').lower() for r in existentes}
+            pendientes = []
+            for valido in validos:
+                usuario = valido["usuario"]
+                if usuario.nombre_usuario.lower() in nombres_en_uso:
+                    valido["resultado"]["error"] = "El nombre de usuario ya está en uso."
+                elif usuario.correo.lower() in correos_en_uso:
+                    valido["resultado"]["error"] = "El correo electrónico ya está registrado."
+                else:
+                    pendientes.append(valido)
+            validos = pendientes
+
+        if validos:
+            # --- 3. Hashear las contraseñas en paralelo (el pool de bcrypt limita la concurrencia) ---
+            hashes = await asyncio.gather(*(aget_password_hash(v["usuario"].contrasena) for v in validos))
+            params = [
+                (
+                    v["usuario"].nombre_usuario,
+                    v["usuario"].correo,
+                    hashed_password,
+                    v["usuario"].nombre,
+                    v["usuario"].apellido,
+                    v["usuario"].es_activo
+                )
+                for v, hashed_password in zip(validos, hashes)
+            ]
+            nombres = [v["usuario"].nombre_usuario for v in validos]
+            ids_por_nombre: Dict[str, int] = {}
+            versiones = IncrementoVersiones(RECURSO_USUARIOS)
+
+            def _insertar(cursor: pyodbc.Cursor) -> None:
+                # Los parámetros de todo el lote viajan juntos en lugar de un INSERT por usuario
+                cursor.fast_executemany = True
+                cursor.executemany(INSERT_USUARIO_IMPORT, params)
+                cursor.fast_executemany = False
+                for inicio in range(0, len(nombres), _MAX_VALORES_IN):
+                    lote = nombres[inicio:inicio + _MAX_VALORES_IN]
+                    cursor.execute(SELECT_USUARIOS_IMPORTADOS_TEMPLATE.format(placeholders=", ".join("?" * len(lote))), lote)
+                    for usuario_id, nombre_usuario in cursor.fetchall():
+                        ids_por_nombre[nombre_usuario.lower()] = usuario_id
+                versiones.aplicar(cursor)
+
+            # --- 4. Insertar todas las filas válidas en una transacción ---
+            try:
+                await aexecute_transaction(_insertar)
+            except Exception as e:
+                detalle = getattr(e, "detail", str(e))
+                logger.error(f"Importación masiva: falló la transacción, no se creó ningún usuario: {detalle}")
+                for v in validos:
+                    v["resultado"]["error"] = f"No se pudo insertar el lote: {detalle}"
+            else:
+                filas_indice = []
+                for v in validos:
+                    usuario = v["usuario"]
+                    usuario_id = ids_por_nombre.get(usuario.nombre_usuario.lower())
+                    v["resultado"].update(creado=True, usuario_id=usuario_id)
+                    if usuario_id is not None:
+                        filas_indice.append({"usuario_id": usuario_id, **usuario.model_dump(include={"nombre_usuario", "correo", "nombre", "apellido"})})
+                incrementar_version(RECURSO_USUARIOS)
+                registrar_usuarios(filas_indice, versiones.nuevas.get(RECURSO_USUARIOS))
+
+        creados = sum(1 for r in resultados if r["creado"])
+        logger.info(f"Importación masiva completada: {creados} creados, {total_filas - creados} con error de {total_filas} filas.")
+        return {
+            "total_filas": total_filas,
+            "creados": creados,
+            "con_error": total_filas - creados,
+            "resultados": resultados
+        }
+
 # --- FIN DE LA CLASE UsuarioService ---
\ No newline at end of file
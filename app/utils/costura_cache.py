@@ -0,0 +1,190 @@
+# app/utils/costura_cache.py
+"""
+Caché en disco, particionada por día, del resultado de dbo.sp_costura_eficiencia_web.
+
+Los días cerrados (anteriores a los últimos COSTURA_CACHE_OPEN_DAYS días) no
+cambian, así que su resultado se guarda una vez en COSTURA_CACHE_DIR: un
+archivo gzip con las columnas y luego las filas en uno o más bloques, cada uno
+serializado con pickle. Los días abiertos (hoy) nunca se guardan y siempre se
+consultan al SP.
+
+Para recoger correcciones tardías de días cerrados, una partición con más de
+COSTURA_CACHE_MAX_AGE_HOURS se descarta y se vuelve a consultar; invalidar()
+(expuesto a administradores en DELETE /costura/cache) las borra antes.
+"""
+import gzip
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Subir si cambia el formato del archivo o las columnas que devuelve el SP
+_FORMATO_VERSION = 2
+
+
+class CacheDiariaEficiencia:
+    """Particiones diarias (columnas, filas) en disco."""
+
+    def __init__(self, directorio: str):
+        self.directorio = Path(directorio)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._escrituras = 0
+        self._errores = 0
+        self._vencidas = 0
+
+    def _ruta(self, dia: date) -> Path:
+        return self.directorio / f"eficiencia_v{_FORMATO_VERSION}_{dia:%Y%m%d}.pkl.gz"
+
+    def _contar(self, campo: str) -> None:
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    @staticmethod
+    def es_dia_cerrado(dia: date, hoy: Optional[date] = None) -> bool:
+        hoy = hoy or date.today()
+        return dia <= hoy - timedelta(days=max(1, settings.COSTURA_CACHE_OPEN_DAYS))
+
+    def existe(self, dia: date) -> bool:
+        """True si hay una partición del día que no superó COSTURA_CACHE_MAX_AGE_HOURS (las vencidas se borran)."""
+        ruta = self._ruta(dia)
+        try:
+            modificada = ruta.stat().st_mtime
+        except OSError:
+            return False
+        max_edad = settings.COSTURA_CACHE_MAX_AGE_HOURS * 3600
+        if max_edad > 0 and time.time() - modificada > max_edad:
+            logger.info(f"Caché costura: partición {ruta.name} vencida, se vuelve a consultar al SP.")
+            self._contar("_vencidas")
+            try:
+                ruta.unlink()
+            except OSError:
+                pass
+            return False
+        return True
+
+    def leer(self, dia: date) -> Optional[Tuple[List[str], List[tuple]]]:
+        """Devuelve (columnas, filas) del día o None si no está (o el archivo está dañado)."""
+        ruta = self._ruta(dia)
+        try:
+            with gzip.open(ruta, "rb") as archivo:
+                columnas = pickle.load(archivo)
+                filas: List[tuple] = []
+                while True:
+                    try:
+                        filas.extend(pickle.load(archivo))
+                    except EOFError:
+                        break
+            self._contar("_hits")
+            return columnas, filas
+        except FileNotFoundError:
+            self._contar("_misses")
+            return None
+        except Exception as e:
+            logger.warning(f"Caché costura: partición {ruta.name} ilegible, se descarta: {e}")
+            self._contar("_errores")
+            try:
+                ruta.unlink()
+            except OSError:
+                pass
+            return None
+
+    def preparar(self, dia: date, columnas: List[str], filas: List[tuple]) -> Optional[str]:
+        """
+        Escribe la partición en un archivo temporal y devuelve su ruta, todavía
+        sin publicarla (ver agregar / confirmar / descartar). None si no se pudo escribir.
+        """
+        try:
+            self.directorio.mkdir(parents=True, exist_ok=True)
+            fd, ruta_tmp = tempfile.mkstemp(dir=self.directorio, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as crudo, gzip.GzipFile(fileobj=crudo, mode="wb", compresslevel=5) as archivo:
+                    pickle.dump(list(columnas), archivo, protocol=pickle.HIGHEST_PROTOCOL)
+                    pickle.dump(filas, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+            except BaseException:
+                os.unlink(ruta_tmp)
+                raise
+            return ruta_tmp
+        except Exception as e:
+            # La caché es una optimización: un fallo de disco no debe romper el reporte
+            logger.warning(f"Caché costura: no se pudo escribir la partición del {dia}: {e}")
+            self._contar("_errores")
+            return None
+
+    def agregar(self, dia: date, ruta_tmp: str, filas: List[tuple]) -> bool:
+        """Añade un bloque de filas a una partición temporal de preparar. False si no se pudo."""
+        try:
+            # Cada bloque es un miembro gzip más; gzip.open los lee como un solo flujo
+            with gzip.open(ruta_tmp, "ab", compresslevel=5) as archivo:
+                pickle.dump(filas, archivo, protocol=pickle.HIGHEST_PROTOCOL)
+            return True
+        except Exception as e:
+            logger.warning(f"Caché costura: no se pudo escribir la partición del {dia}: {e}")
+            self._contar("_errores")
+            return False
+
+    def confirmar(self, dia: date, ruta_tmp: str) -> None:
+        """Publica de forma atómica (os.replace) una partición escrita con preparar."""
+        try:
+            os.replace(ruta_tmp, self._ruta(dia))
+            self._contar("_escrituras")
+        except OSError as e:
+            logger.warning(f"Caché costura: no se pudo guardar la partición del {dia}: {e}")
+            self._contar("_errores")
+            self.descartar(ruta_tmp)
+
+    @staticmethod
+    def descartar(ruta_tmp: str) -> None:
+        try:
+            os.unlink(ruta_tmp)
+        except OSError:
+            pass
+
+    def guardar(self, dia: date, columnas: List[str], filas: List[tuple]) -> None:
+        """Escribe la partición de forma atómica (archivo temporal + os.replace)."""
+        ruta_tmp = self.preparar(dia, columnas, filas)
+        if ruta_tmp is not None:
+            self.confirmar(dia, ruta_tmp)
+
+    def invalidar(self, desde: Optional[date] = None, hasta: Optional[date] = None) -> int:
+        """Elimina las particiones en el rango (todas si no se indica). Devuelve cuántas borró."""
+        borradas = 0
+        if not self.directorio.is_dir():
+            return 0
+        for ruta in self.directorio.glob("eficiencia_v*_*.pkl.gz"):
+            try:
+                dia = date(int(ruta.name[-15:-11]), int(ruta.name[-11:-9]), int(ruta.name[-9:-7]))
+            except ValueError:
+                continue
+            if (desde is None or dia >= desde) and (hasta is None or dia <= hasta):
+                try:
+                    ruta.unlink()
+                    borradas += 1
+                except OSError as e:
+                    logger.warning(f"Caché costura: no se pudo borrar {ruta.name}: {e}")
+        logger.info(f"Caché costura: {borradas} particiones invalidadas ({desde} a {hasta}).")
+        return borradas
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "directorio": str(self.directorio),
+                "hits": self._hits,
+                "misses": self._misses,
+                "escrituras": self._escrituras,
+                "errores": self._errores,
+                "vencidas": self._vencidas,
+            }
+
+
+cache_eficiencia_diaria = CacheDiariaEficiencia(settings.COSTURA_CACHE_DIR)
@@ -0,0 +1,333 @@
+# app/utils/eficiencia_costura.py
+"""
+Motor de agregación del reporte de eficiencia de costura.
+
+- AcumuladorTotalesEficiencia: totales fila por fila (ruta original).
+- LoteColumnarEficiencia: carga un lote del SP en columnas tipadas (NumPy) y
+  calcula eficiencia por fila, totales y minutos disponibles únicos con
+  operaciones vectorizadas.
+- AcumuladorAgrupadoEficiencia: los mismos totales por grupo (group_by).
+
+Ambas rutas comparten el mismo acumulador, por lo que se pueden mezclar lote a
+lote (p. ej. si un lote trae datos que requieren validación fila por fila) y
+dan exactamente los mismos números:
+- las sumas de floats se hacen en el mismo orden que el bucle original
+  (np.add.accumulate es secuencial, a diferencia de np.sum);
+- la eficiencia por fila respeta el redondeo de round(x, 2) de Python;
+- los minutos disponibles se cuentan una vez por (codigo_trabajador, fecha_proceso),
+  tomando la primera fila vista.
+"""
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Set
+
+from app.schemas.costura import EficienciaCosturaItemSchema
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se usa la ruta fila por fila
+    np = None
+
+NUMPY_DISPONIBLE = np is not None
+
+_NoneType = type(None)
+_TIPOS_NUMERICOS = {float, int, Decimal}
+
+# Tipos aceptados por columna en la ruta rápida. Si un lote trae otra cosa
+# (None en un campo obligatorio, datetime en vez de date, etc.) se procesa con
+# parse_obj fila por fila para conservar la validación y los logs de error.
+_COLUMNAS_STR = ("orden_produccion", "codigo_trabajador", "codigo_operacion")
+_COLUMNAS_STR_OPCIONALES = (
+    "codigo_seccion", "nombre_trabajador", "nombre_operacion", "bloque", "linea",
+    "nombre_maquina", "codigo_categoria_operacion", "codigo_proceso_ticket", "nombre_proceso_ticket",
+)
+_COLUMNAS_FLOAT = ("tiempo_estandar_minutos_prenda", "minutos_disponibles_jornada", "minutos_producidos_total")
+_COLUMNAS_FLOAT_OPCIONALES = ("importe_destajo_total", "precio_venta_orden")
+
+# Tolerancia para detectar valores cercanos a un empate al redondear a 2 decimales
+_TOLERANCIA_EMPATE = 1e-7
+
+
+def suma_secuencial(inicial: float, valores) -> float:
+    """Suma 'valores' sobre 'inicial' en orden, igual que un bucle con +=."""
+    if len(valores) == 0:
+        return inicial
+    return float(np.add.accumulate(np.concatenate(([inicial], valores)))[-1])
+
+
+def redondear_2(valores):
+    """
+    Equivalente vectorizado de [round(v, 2) for v in valores].
+    np.round puede diferir de round() de Python sólo cerca de un empate (x.xx5),
+    así que esos pocos casos se recalculan con round().
+    """
+    escalados = valores * 100.0
+    redondeados = np.rint(escalados) / 100.0
+    fraccion = escalados - np.floor(escalados)
+    cercanos = np.flatnonzero(np.abs(fraccion - 0.5) < _TOLERANCIA_EMPATE)
+    for i in cercanos.tolist():
+        redondeados[i] = round(float(valores[i]), 2)
+    return redondeados
+
+
+def calcular_eficiencias(minutos_producidos, minutos_disponibles):
+    """eficiencia_porcentaje por fila: round(producidos / disponibles * 100, 2) o 0.0."""
+    con_jornada = minutos_disponibles > 0
+    porcentajes = np.zeros(len(minutos_producidos), dtype=np.float64)
+    porcentajes[con_jornada] = (minutos_producidos[con_jornada] / minutos_disponibles[con_jornada]) * 100
+    return redondear_2(porcentajes)
+
+
+def procesar_fila_eficiencia(row_dict: Dict[str, Any]) -> EficienciaCosturaItemSchema:
+    """Ruta fila por fila: valida con parse_obj y calcula eficiencia_porcentaje."""
+    item_data = EficienciaCosturaItemSchema.parse_obj(row_dict)
+    if item_data.minutos_disponibles_jornada is not None and item_data.minutos_disponibles_jornada > 0:
+        item_data.eficiencia_porcentaje = round(
+            (item_data.minutos_producidos_total / item_data.minutos_disponibles_jornada) * 100, 2
+        )
+    else:
+        item_data.eficiencia_porcentaje = 0.0
+    return item_data
+
+
+def clave_trabajador_fecha(ids_trabajador: Dict[str, int], codigo_trabajador: str, fecha_proceso: date) -> int:
+    """(trabajador, fecha) codificado en un entero, común a la ruta fila por fila y a la columnar."""
+    id_trabajador = ids_trabajador.setdefault(codigo_trabajador, len(ids_trabajador))
+    return (id_trabajador << 32) | fecha_proceso.toordinal()
+
+
+class AcumuladorTotalesEficiencia:
+    """
+    Acumula los totales del reporte sin guardar las filas.
+    Los minutos disponibles se suman una sola vez por (codigo_trabajador, fecha_proceso),
+    tomando el valor de la primera fila vista para esa combinación.
+    """
+
+    def __init__(self, ids_trabajador: Optional[Dict[str, int]] = None):
+        self.total_items = 0
+        self.sum_total_prendas = 0
+        self.sum_total_min_producidos = 0.0
+        self.sum_total_min_disponibles_unicos = 0.0
+        # Diccionario compartible entre acumuladores del mismo reporte (ver AcumuladorAgrupadoEficiencia)
+        self._ids_trabajador: Dict[str, int] = ids_trabajador if ids_trabajador is not None else {}
+        self._claves_vistas: Set[int] = set()
+
+    def _clave(self, codigo_trabajador: str, fecha_proceso: date) -> int:
+        return clave_trabajador_fecha(self._ids_trabajador, codigo_trabajador, fecha_proceso)
+
+    def agregar(self, item_data: EficienciaCosturaItemSchema) -> None:
+        """Ruta fila por fila."""
+        self.total_items += 1
+        self.sum_total_prendas += item_data.cantidad_prendas_producidas
+        self.sum_total_min_producidos += item_data.minutos_producidos_total
+        clave = self._clave(item_data.codigo_trabajador, item_data.fecha_proceso)
+        if clave not in self._claves_vistas:
+            self._claves_vistas.add(clave)
+            self.sum_total_min_disponibles_unicos += item_data.minutos_disponibles_jornada or 0.0
+
+    def agregar_lote(self, lote: "LoteColumnarEficiencia") -> None:
+        """Ruta columnar: mismo resultado que llamar agregar() por cada fila del lote."""
+        self.agregar_columnas(
+            lote.prendas, lote.minutos_producidos, lote.minutos_disponibles,
+            lote.claves_trabajador_fecha(self._ids_trabajador)
+        )
+
+    def agregar_columnas(self, prendas, minutos_producidos, minutos_disponibles, claves) -> None:
+        """Agrega filas ya en columnas; 'claves' viene de LoteColumnarEficiencia.claves_trabajador_fecha."""
+        self.total_items += len(prendas)
+        self.sum_total_prendas += int(prendas.sum())
+        self.sum_total_min_producidos = suma_secuencial(self.sum_total_min_producidos, minutos_producidos)
+
+        # Primera aparición (en orden de fila) de cada clave que aún no se había visto
+        claves_unicas, primeros = np.unique(claves, return_index=True)
+        nuevas = np.array([clave not in self._claves_vistas for clave in claves_unicas.tolist()], dtype=bool)
+        if nuevas.any():
+            self._claves_vistas.update(claves_unicas[nuevas].tolist())
+            self.sum_total_min_disponibles_unicos = suma_secuencial(
+                self.sum_total_min_disponibles_unicos, minutos_disponibles[np.sort(primeros[nuevas])]
+            )
+
+    def eficiencia_promedio_general(self) -> float:
+        if self.sum_total_min_disponibles_unicos > 0:
+            return round((self.sum_total_min_producidos / self.sum_total_min_disponibles_unicos) * 100, 2)
+        return 0.0
+
+    def totales(self) -> Dict[str, Any]:
+        """Campos de totales de ReporteEficienciaCosturaResponseSchema."""
+        return {
+            "total_prendas_producidas_periodo": self.sum_total_prendas,
+            "total_minutos_producidos_periodo": round(self.sum_total_min_producidos, 2),
+            "total_minutos_disponibles_periodo": round(self.sum_total_min_disponibles_unicos, 2),
+            "eficiencia_promedio_general_periodo": self.eficiencia_promedio_general(),
+        }
+
+
+def _tipos(columna) -> Set[type]:
+    return set(map(type, columna))
+
+
+class LoteColumnarEficiencia:
+    """Un lote de filas del SP cargado en columnas tipadas."""
+
+    def __init__(self, columnas: Dict[str, Any], prendas, minutos_producidos, minutos_disponibles, fechas):
+        self.columnas = columnas
+        self.prendas = prendas
+        self.minutos_producidos = minutos_producidos
+        self.minutos_disponibles = minutos_disponibles
+        self.fechas = fechas  # date.toordinal() de fecha_proceso (int64)
+        self.eficiencias = calcular_eficiencias(minutos_producidos, minutos_disponibles)
+
+    def __len__(self) -> int:
+        return len(self.prendas)
+
+    @classmethod
+    def desde_filas(cls, columnas_sp: List[str], filas: List[Any]) -> Optional["LoteColumnarEficiencia"]:
+        """
+        Transpone las filas (tuplas en el orden de 'columnas_sp') a columnas.
+        Devuelve None si el lote no cumple los tipos esperados; en ese caso debe
+        procesarse fila por fila.
+        """
+        if np is None or not filas:
+            return None
+
+        n = len(filas)
+        transpuestas = dict(zip(columnas_sp, zip(*filas)))
+        vacia = (None,) * n
+        columnas: Dict[str, Any] = {}
+
+        for nombre in _COLUMNAS_STR:
+            columna = transpuestas.get(nombre, vacia)
+            if _tipos(columna) != {str}:
+                return None
+            columnas[nombre] = columna
+        for nombre in _COLUMNAS_STR_OPCIONALES:
+            columna = transpuestas.get(nombre, vacia)
+            if not _tipos(columna) <= {str, _NoneType}:
+                return None
+            columnas[nombre] = columna
+
+        arreglos = {}
+        for nombre in _COLUMNAS_FLOAT:
+            columna = transpuestas.get(nombre, vacia)
+            if not _tipos(columna) <= _TIPOS_NUMERICOS:
+                return None
+            arreglos[nombre] = np.array(columna, dtype=np.float64)
+            columnas[nombre] = arreglos[nombre].tolist()
+        for nombre in _COLUMNAS_FLOAT_OPCIONALES:
+            columna = transpuestas.get(nombre, vacia)
+            tipos = _tipos(columna)
+            if not tipos <= _TIPOS_NUMERICOS | {_NoneType}:
+                return None
+            if not tipos <= {float, _NoneType}:
+                columna = [None if v is None else float(v) for v in columna]
+            columnas[nombre] = columna
+
+        prendas = transpuestas.get("cantidad_prendas_producidas", vacia)
+        if _tipos(prendas) != {int}:
+            return None
+        columnas["cantidad_prendas_producidas"] = prendas
+
+        fechas = transpuestas.get("fecha_proceso", vacia)
+        if _tipos(fechas) != {date}:
+            return None
+        columnas["fecha_proceso"] = fechas
+
+        return cls(
+            columnas=columnas,
+            prendas=np.array(prendas, dtype=np.int64),
+            minutos_producidos=arreglos["minutos_producidos_total"],
+            minutos_disponibles=arreglos["minutos_disponibles_jornada"],
+            fechas=np.fromiter(map(date.toordinal, fechas), dtype=np.int64, count=n),
+        )
+
+    def claves_trabajador_fecha(self, ids_trabajador: Dict[str, int]):
+        """(codigo_trabajador, fecha_proceso) de cada fila codificado como en clave_trabajador_fecha."""
+        trabajadores_unicos, inverso = np.unique(
+            np.array(self.columnas["codigo_trabajador"]), return_inverse=True
+        )
+        ids = np.array(
+            [ids_trabajador.setdefault(t, len(ids_trabajador)) for t in trabajadores_unicos.tolist()],
+            dtype=np.int64
+        )
+        return (ids[inverso.ravel()] << 32) | self.fechas
+
+    def items(self) -> List[EficienciaCosturaItemSchema]:
+        """Crea los items del lote sin re-validar (los tipos ya se comprobaron al cargar)."""
+        nombres = list(self.columnas.keys()) + ["eficiencia_porcentaje"]
+        valores = list(self.columnas.values()) + [self.eficiencias.tolist()]
+        campos = set(nombres)
+        construir = EficienciaCosturaItemSchema.model_construct
+        return [construir(campos, **dict(zip(nombres, fila))) for fila in zip(*valores)]
+
+
+
+# Dimensiones por las que se puede agrupar el reporte (parámetro group_by)
+DIMENSIONES_AGRUPACION = ("linea", "bloque", "codigo_trabajador", "codigo_operacion", "fecha_proceso")
+
+
+def _orden_grupo(clave: tuple) -> tuple:
+    # Los None van primero y no se comparan contra str/date
+    return tuple((valor is not None, valor) for valor in clave)
+
+
+class AcumuladorAgrupadoEficiencia:
+    """
+    Totales por grupo para el parámetro group_by.
+    Cada grupo es un AcumuladorTotalesEficiencia, así que dentro de un grupo los
+    minutos disponibles se cuentan una vez por (codigo_trabajador, fecha_proceso),
+    con la misma regla que los totales generales.
+    """
+
+    def __init__(self, dimensiones: List[str]):
+        self.dimensiones = list(dimensiones)
+        self._ids_trabajador: Dict[str, int] = {}
+        self._grupos: Dict[tuple, AcumuladorTotalesEficiencia] = {}
+
+    def _grupo(self, clave: tuple) -> AcumuladorTotalesEficiencia:
+        acumulador = self._grupos.get(clave)
+        if acumulador is None:
+            acumulador = AcumuladorTotalesEficiencia(self._ids_trabajador)
+            self._grupos[clave] = acumulador
+        return acumulador
+
+    def agregar(self, item_data: EficienciaCosturaItemSchema) -> None:
+        clave = tuple(getattr(item_data, dimension) for dimension in self.dimensiones)
+        self._grupo(clave).agregar(item_data)
+
+    def agregar_lote(self, lote: "LoteColumnarEficiencia") -> None:
+        claves_fila = list(zip(*(lote.columnas[dimension] for dimension in self.dimensiones)))
+        locales: Dict[tuple, int] = {}
+        indice_grupo = np.fromiter(
+            (locales.setdefault(clave, len(locales)) for clave in claves_fila), dtype=np.int64, count=len(claves_fila)
+        )
+        claves_tf = lote.claves_trabajador_fecha(self._ids_trabajador)
+
+        # Orden estable: dentro de cada grupo las filas conservan su orden original
+        orden = np.argsort(indice_grupo, kind="stable")
+        limites = np.flatnonzero(np.diff(indice_grupo[orden])) + 1
+        for indices in np.split(orden, limites):
+            clave = claves_fila[indices[0]]
+            self._grupo(clave).agregar_columnas(
+                lote.prendas[indices], lote.minutos_producidos[indices],
+                lote.minutos_disponibles[indices], claves_tf[indices]
+            )
+
+    def grupos(self) -> List[Dict[str, Any]]:
+        """Una fila por grupo, ordenadas por las dimensiones."""
+        resultado = []
+        for clave in sorted(self._grupos, key=_orden_grupo):
+            acumulador = self._grupos[clave]
+            grupo = dict(zip(self.dimensiones, clave))
+            grupo.update({
+                "cantidad_registros": acumulador.total_items,
+                "total_prendas_producidas": acumulador.sum_total_prendas,
+                "total_minutos_producidos": round(acumulador.sum_total_min_producidos, 2),
+                "total_minutos_disponibles": round(acumulador.sum_total_min_disponibles_unicos, 2),
+                "eficiencia_porcentaje": acumulador.eficiencia_promedio_general(),
+            })
+            resultado.append(grupo)
+        return resultado
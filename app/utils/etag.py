@@ -0,0 +1,128 @@
+# app/utils/etag.py
+"""
+ETag fuertes para respuestas de lectura que casi nunca cambian (árboles de
+menú, áreas y roles activos), para responder 304 Not Modified sin leer los
+datos ni serializar nada.
+
+El ETag no se calcula sobre el contenido sino sobre la versión compartida de
+los recursos de los que depende cada respuesta (dbo.version_recurso, ver
+app/db/versiones.py). Los servicios que escriben menús, áreas, roles o
+permisos la incrementan en la misma transacción que su cambio, así que todos
+los workers generan el mismo ETag para los mismos datos y cualquier escritura
+lo cambia en todos. Como es un contador, dos estados distintos nunca comparten
+ETag.
+
+- La versión se lee con versiones_vigentes() (app/core/versiones_cache.py):
+  una fila por recurso, reutilizada unos segundos y compartida por las
+  llamadas concurrentes; una escritura en este worker (incrementar_version)
+  fuerza la relectura.
+- Se calcula ANTES de leer los datos: si una escritura se cuela durante la
+  lectura, el cliente recibe datos nuevos con el ETag viejo y en la siguiente
+  solicitud simplemente vuelve a descargar.
+- Si la lectura de versiones falla, la respuesta sale sin ETag.
+
+Los contadores de versión por recurso (incrementar_version / version_recurso)
+siguen siendo locales: los usa la caché de conteos de los listados.
+"""
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+from fastapi import Request, Response, status
+
+from app.core.versiones_cache import descartar_versiones, versiones_vigentes
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+RECURSO_MENUS = "menus"
+RECURSO_AREAS = "areas"
+RECURSO_ROLES = "roles"
+RECURSO_PERMISOS = "permisos"
+RECURSO_USUARIOS = "usuarios"
+
+_versiones: Dict[str, int] = {}
+_lock = threading.Lock()
+_no_modificadas_total = 0
+_completas_total = 0
+_errores_versiones_total = 0
+
+
+def incrementar_version(*recursos: str) -> None:
+    """
+    Marca una escritura local en estos recursos: avanza su versión local
+    (caché de conteos) y fuerza a releer la versión compartida.
+    """
+    with _lock:
+        for recurso in recursos:
+            _versiones[recurso] = _versiones.get(recurso, 0) + 1
+    descartar_versiones()
+
+
+def version_recurso(recurso: str) -> int:
+    """Versión local del recurso (la usa la caché de conteos de los listados)."""
+    return _versiones.get(recurso, 0)
+
+
+async def calcular_etag(recursos: Sequence[str], *extra: Any) -> Optional[str]:
+    """
+    ETag fuerte a partir de las versiones de 'recursos' y de lo que además
+    distinga la respuesta ('extra': p. ej. el área o los roles del usuario).
+    None si no se pudo leer la versión (la respuesta sale sin ETag).
+    """
+    global _errores_versiones_total
+    try:
+        versiones = await versiones_vigentes()
+    except Exception as e:
+        with _lock:
+            _errores_versiones_total += 1
+        logger.warning(f"ETag: no se pudo leer la versión de los recursos, se responde sin ETag: {getattr(e, 'detail', e)}")
+        return None
+    partes = [f"{recurso}={versiones.get(recurso, '')}" for recurso in recursos]
+    partes.extend(str(valor) for valor in extra)
+    return '"' + hashlib.blake2b("|".join(partes).encode(), digest_size=12).hexdigest() + '"'
+
+
+def coincide_if_none_match(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110): admite '*', listas y prefijos W/."""
+    if not if_none_match:
+        return False
+    for candidato in if_none_match.split(","):
+        candidato = candidato.strip()
+        if candidato == "*" or candidato.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _cabeceras(etag: str) -> Dict[str, str]:
+    # Respuestas autenticadas: sólo el navegador las guarda y siempre revalida
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def respuesta_no_modificada(request: Request, etag: Optional[str]) -> Optional[Response]:
+    """Response 304 si el cliente ya tiene 'etag'; None si hay que generar la respuesta."""
+    global _no_modificadas_total, _completas_total
+    if etag is not None and coincide_if_none_match(request.headers.get("if-none-match"), etag):
+        _no_modificadas_total += 1
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cabeceras(etag))
+    _completas_total += 1
+    return None
+
+
+def aplicar_etag(response: Response, etag: Optional[str]) -> None:
+    """Añade el ETag (y Cache-Control) a una respuesta 200."""
+    if etag is not None:
+        response.headers.update(_cabeceras(etag))
+
+
+def etag_stats() -> Dict[str, Any]:
+    with _lock:
+        versiones = dict(_versiones)
+        errores = _errores_versiones_total
+    return {
+        "versiones": versiones,
+        "errores_versiones_total": errores,
+        "no_modificadas_total": _no_modificadas_total,
+        "completas_total": _completas_total,
+    }
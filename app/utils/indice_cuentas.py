@@ -0,0 +1,285 @@
+# app/utils/indice_cuentas.py
+"""
+Índice en memoria sobre un snapshot de cuentas por cobrar y pagar para
+filtrar, ordenar y paginar con cursor sin recorrer todo el libro.
+
+- Filtros de igualdad (tipo_cuenta, empresa, moneda, codigo_cliente_proveedor)
+  resueltos con listas de posiciones por valor.
+- Rango de fecha_vencimiento resuelto con bisect sobre las posiciones
+  ordenadas por vencimiento.
+- El resultado ordenado de cada combinación filtros + orden se guarda (LRU),
+  de modo que las páginas siguientes cuestan O(log n + página).
+
+El cursor es "keyset": guarda los valores de orden de la última fila entregada,
+por lo que sigue siendo válido aunque el snapshot se recargue entre páginas.
+"""
+import base64
+import functools
+import json
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.schemas.administracion import CuentaCobrarPagarBase
+
+CAMPOS_IGUALDAD = ("tipo_cuenta", "empresa", "moneda", "codigo_cliente_proveedor")
+
+# Campos por los que se puede ordenar y cómo se codifican en el cursor
+CAMPOS_ORDEN = {
+    "fecha_vencimiento": "fecha",
+    "fecha_comprobante": "fecha",
+    "fecha_ultimo_pago": "fecha",
+    "pendiente_cobrar": "decimal",
+    "importe_original": "decimal",
+    "importe_moneda_funcional": "decimal",
+    "importe_soles": "decimal",
+    "importe_dolares": "decimal",
+    "cliente_proveedor": "texto",
+    "codigo_cliente_proveedor": "texto",
+    "empresa": "texto",
+    "tipo_cuenta": "texto",
+    "responsable": "texto",
+    "numero_comprobante": "texto",
+}
+
+# Identifican un comprobante; desempatan el orden y lo hacen estable entre snapshots
+CAMPOS_IDENTIDAD = (
+    "empresa", "tipo_cuenta", "tipo_comprobante", "serie_comprobante",
+    "numero_comprobante", "codigo_cliente_proveedor"
+)
+
+_MAX_CONSULTAS_EN_CACHE = 32
+
+Orden = Tuple[Tuple[str, bool], ...]  # ((campo, descendente), ...)
+
+
+def parsear_orden(ordenar_por: Optional[str]) -> Orden:
+    """
+    'ordenar_por' es una lista separada por comas; un '-' delante indica orden
+    descendente (p. ej. "-pendiente_cobrar,fecha_vencimiento").
+    Lanza ValueError si algún campo no está en CAMPOS_ORDEN.
+    """
+    orden = []
+    vistos = set()
+    for parte in (ordenar_por or "").split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        descendente = parte.startswith("-")
+        campo = parte.lstrip("+-")
+        if campo not in CAMPOS_ORDEN:
+            raise ValueError(f"Campo de orden no válido: '{campo}'. Permitidos: {', '.join(CAMPOS_ORDEN)}.")
+        if campo not in vistos:
+            vistos.add(campo)
+            orden.append((campo, descendente))
+    return tuple(orden)
+
+
+def _clave_valor(valor: Any) -> Tuple[int, Any]:
+    # Los nulos van al final en orden ascendente (al principio en descendente)
+    return (0, valor) if valor is not None else (1, "")
+
+
+def _comparar(a: Sequence[Tuple[int, Any]], b: Sequence[Tuple[int, Any]], descendentes: Sequence[bool]) -> int:
+    for va, vb, descendente in zip(a, b, descendentes):
+        if va != vb:
+            menor = va < vb
+            return (1 if menor else -1) if descendente else (-1 if menor else 1)
+    return 0
+
+
+def _codificar_valor(valor: Any) -> Any:
+    if valor is None:
+        return None
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _decodificar_valor(tipo: str, valor: Any) -> Any:
+    if valor is None:
+        return None
+    if tipo == "fecha":
+        return datetime.fromisoformat(valor)
+    if tipo == "decimal":
+        return Decimal(valor)
+    return str(valor)
+
+
+class IndiceCuentas:
+    """Índice inmutable construido una vez por snapshot (ver administracion_service)."""
+
+    def __init__(self, cuentas: List[CuentaCobrarPagarBase]):
+        self._cuentas = cuentas
+        self._por_valor: Dict[str, Dict[Any, List[int]]] = {campo: {} for campo in CAMPOS_IGUALDAD}
+        self._pendientes: List[int] = []
+        con_vencimiento: List[Tuple[datetime, int]] = []
+
+        for pos, cuenta in enumerate(cuentas):
+            for campo in CAMPOS_IGUALDAD:
+                self._por_valor[campo].setdefault(getattr(cuenta, campo), []).append(pos)
+            if cuenta.pendiente_cobrar is not None and cuenta.pendiente_cobrar > 0:
+                self._pendientes.append(pos)
+            if cuenta.fecha_vencimiento is not None:
+                con_vencimiento.append((cuenta.fecha_vencimiento, pos))
+
+        con_vencimiento.sort()
+        self._vencimientos = [fecha for fecha, _ in con_vencimiento]
+        self._por_vencimiento = [pos for _, pos in con_vencimiento]
+
+        self._consultas: "OrderedDict[Tuple, List[int]]" = OrderedDict()
+        self._consultas_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cuentas)
+
+    def _candidatos(
+        self,
+        igualdad: Dict[str, Any],
+        vencimiento_desde: Optional[date],
+        vencimiento_hasta: Optional[date],
+        solo_pendientes: bool
+    ) -> List[int]:
+        # Partir de la lista más corta disponible y verificar el resto fila por fila
+        fuentes: List[List[int]] = [self._por_valor[campo].get(valor, []) for campo, valor in igualdad.items()]
+        if solo_pendientes:
+            fuentes.append(self._pendientes)
+
+        desde = datetime.combine(vencimiento_desde, time.min) if vencimiento_desde else None
+        hasta = datetime.combine(vencimiento_hasta + timedelta(days=1), time.min) if vencimiento_hasta else None
+        if desde is not None or hasta is not None:
+            ini = bisect_left(self._vencimientos, desde) if desde is not None else 0
+            fin = bisect_left(self._vencimientos, hasta) if hasta is not None else len(self._vencimientos)
+            fuentes.append(self._por_vencimiento[ini:fin])
+
+        if not fuentes:
+            return list(range(len(self._cuentas)))
+        base = min(fuentes, key=len)
+
+        cuentas = self._cuentas
+        resultado = []
+        for pos in base:
+            cuenta = cuentas[pos]
+            if any(getattr(cuenta, campo) != valor for campo, valor in igualdad.items()):
+                continue
+            if solo_pendientes and not (cuenta.pendiente_cobrar is not None and cuenta.pendiente_cobrar > 0):
+                continue
+            if desde is not None or hasta is not None:
+                fecha = cuenta.fecha_vencimiento
+                if fecha is None or (desde is not None and fecha < desde) or (hasta is not None and fecha >= hasta):
+                    continue
+            resultado.append(pos)
+        return resultado
+
+    def _clave_fila(self, pos: int, orden: Orden) -> Tuple[Tuple[int, Any], ...]:
+        cuenta = self._cuentas[pos]
+        return (
+            tuple(_clave_valor(getattr(cuenta, campo)) for campo, _ in orden)
+            + tuple(_clave_valor(getattr(cuenta, campo)) for campo in CAMPOS_IDENTIDAD)
+            + ((0, pos),)
+        )
+
+    def _ordenar(self, posiciones: List[int], orden: Orden) -> List[int]:
+        cuentas = self._cuentas
+        # Desempate por identidad del comprobante y posición; luego un sort estable por campo, del último al primero
+        posiciones = sorted(
+            posiciones,
+            key=lambda p: tuple(_clave_valor(getattr(cuentas[p], campo)) for campo in CAMPOS_IDENTIDAD) + (p,)
+        )
+        for campo, descendente in reversed(orden):
+            posiciones.sort(key=lambda p: _clave_valor(getattr(cuentas[p], campo)), reverse=descendente)
+        return posiciones
+
+    def _resultado_ordenado(
+        self,
+        igualdad: Dict[str, Any],
+        vencimiento_desde: Optional[date],
+        vencimiento_hasta: Optional[date],
+        solo_pendientes: bool,
+        orden: Orden
+    ) -> List[int]:
+        clave = (tuple(sorted(igualdad.items())), vencimiento_desde, vencimiento_hasta, solo_pendientes, orden)
+        with self._consultas_lock:
+            resultado = self._consultas.get(clave)
+            if resultado is not None:
+                self._consultas.move_to_end(clave)
+                return resultado
+
+        resultado = self._ordenar(
+            self._candidatos(igualdad, vencimiento_desde, vencimiento_hasta, solo_pendientes), orden
+        )
+
+        with self._consultas_lock:
+            self._consultas[clave] = resultado
+            while len(self._consultas) > _MAX_CONSULTAS_EN_CACHE:
+                self._consultas.popitem(last=False)
+        return resultado
+
+    def codificar_cursor(self, pos: int, orden: Orden, version: str) -> str:
+        cuenta = self._cuentas[pos]
+        contenido = {
+            "o": [[campo, descendente] for campo, descendente in orden],
+            "k": [_codificar_valor(getattr(cuenta, campo)) for campo, _ in orden],
+            "i": [getattr(cuenta, campo) for campo in CAMPOS_IDENTIDAD],
+            "v": version,
+            "p": pos,
+        }
+        return base64.urlsafe_b64encode(json.dumps(contenido, separators=(",", ":")).encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decodificar_cursor(cursor: str, orden: Orden, version: str) -> Tuple[Tuple[int, Any], ...]:
+        """
+        Devuelve la clave de orden de la última fila entregada. La posición sólo
+        se usa si el cursor es del mismo snapshot. Lanza ValueError si el cursor
+        no es válido o fue generado con otro orden.
+        """
+        try:
+            relleno = "=" * (-len(cursor) % 4)
+            contenido = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+            orden_cursor = [tuple(o) for o in contenido["o"]]
+            claves = tuple(
+                _clave_valor(_decodificar_valor(CAMPOS_ORDEN[campo], valor))
+                for (campo, _), valor in zip(orden, contenido["k"])
+            )
+            identidad = tuple(_clave_valor(valor) for valor in contenido["i"])
+            # Con otro snapshot la posición no significa nada: saltar cualquier fila con la misma identidad
+            pos = int(contenido["p"]) if contenido.get("v") == version else float("inf")
+        except Exception:
+            raise ValueError("cursor mal formado")
+        if orden_cursor != list(orden):
+            raise ValueError("el cursor fue generado con otro 'ordenar_por'")
+        if len(claves) != len(orden) or len(identidad) != len(CAMPOS_IDENTIDAD):
+            raise ValueError("cursor mal formado")
+        return claves + identidad + ((0, pos),)
+
+    def consultar(
+        self,
+        version: str,
+        igualdad: Dict[str, Any],
+        vencimiento_desde: Optional[date] = None,
+        vencimiento_hasta: Optional[date] = None,
+        solo_pendientes: bool = False,
+        orden: Orden = (),
+        limite: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[CuentaCobrarPagarBase], int, Optional[str]]:
+        """
+        Devuelve (página de cuentas, total que cumple los filtros, cursor de la
+        siguiente página o None si no hay más).
+        """
+        resultado = self._resultado_ordenado(igualdad, vencimiento_desde, vencimiento_hasta, solo_pendientes, orden)
+
+        inicio = 0
+        if cursor:
+            descendentes = [d for _, d in orden] + [False] * (len(CAMPOS_IDENTIDAD) + 1)
+            clave = functools.cmp_to_key(lambda a, b: _comparar(a, b, descendentes))
+            ultima = self.decodificar_cursor(cursor, orden, version)
+            inicio = bisect_right(resultado, clave(ultima), key=lambda p: clave(self._clave_fila(p, orden)))
+
+        fin = len(resultado) if limite is None else min(inicio + limite, len(resultado))
+        pagina = [self._cuentas[pos] for pos in resultado[inicio:fin]]
+        siguiente = self.codificar_cursor(resultado[fin - 1], orden, version) if fin < len(resultado) and fin > inicio else None
+        return pagina, len(resultado), siguiente
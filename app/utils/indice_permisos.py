@@ -0,0 +1,120 @@
+# app/utils/indice_permisos.py
+"""
+Matriz rol × menú de rol_menu_permiso precompilada en memoria.
+
+Cada menú recibe una posición de bit; por rol se guardan tres enteros
+(puede_ver, puede_editar, puede_eliminar) con un bit encendido por cada menú
+permitido. Los permisos de un conjunto de roles son el OR de sus máscaras, así
+que "¿puede este usuario editar el menú Z?" o "¿qué menús ven estos roles?" se
+responden sin ir a la base de datos.
+
+Las filas traen además los datos del menú (menu_nombre, menu_url, menu_icono,
+menu_orden), que se guardan aparte por menú para los listados por rol.
+
+El índice es inmutable: se reconstruye entero cuando cambian los permisos o
+los menús (ver app/core/permisos_cache.py).
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+ACCIONES = ("ver", "editar", "eliminar")
+_COLUMNAS = ("puede_ver", "puede_editar", "puede_eliminar")
+_CAMPOS_MENU = ("menu_nombre", "menu_url", "menu_icono", "menu_orden")
+
+
+class IndicePermisos:
+    """Índice inmutable construido a partir de las filas de rol_menu_permiso."""
+
+    def __init__(self, filas: List[Dict[str, Any]], versiones: Optional[Dict[str, int]] = None):
+        # Versiones compartidas leídas antes que 'filas' (ver app/core/permisos_cache.py)
+        self.versiones: Dict[str, int] = dict(versiones or {})
+        self._bit_por_menu: Dict[int, int] = {}
+        self._menu_por_bit: List[int] = []
+        # rol_id -> [máscara ver, máscara editar, máscara eliminar]
+        self._mascaras: Dict[int, List[int]] = {}
+        self._filas_por_rol: Dict[int, List[Dict[str, Any]]] = {}
+        self._fila_por_par: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self._menu_por_id: Dict[int, Dict[str, Any]] = {}
+
+        for fila in sorted(filas, key=lambda f: (f["menu_id"], f["rol_id"])):
+            rol_id, menu_id = fila["rol_id"], fila["menu_id"]
+            if rol_id is None or menu_id is None:
+                continue
+            self._menu_por_id.setdefault(menu_id, {campo: fila.get(campo) for campo in _CAMPOS_MENU})
+            fila = {campo: valor for campo, valor in fila.items() if campo not in _CAMPOS_MENU}
+            bit = self._bit_por_menu.get(menu_id)
+            if bit is None:
+                bit = self._bit_por_menu[menu_id] = len(self._menu_por_bit)
+                self._menu_por_bit.append(menu_id)
+            mascaras = self._mascaras.setdefault(rol_id, [0, 0, 0])
+            for i, columna in enumerate(_COLUMNAS):
+                if fila.get(columna):
+                    mascaras[i] |= 1 << bit
+            self._filas_por_rol.setdefault(rol_id, []).append(fila)
+            self._fila_por_par.setdefault((rol_id, menu_id), fila)
+
+    def __len__(self) -> int:
+        return len(self._fila_por_par)
+
+    @staticmethod
+    def _posicion_accion(accion: str) -> int:
+        try:
+            return ACCIONES.index(accion)
+        except ValueError:
+            raise ValueError(f"Acción no válida: '{accion}'. Permitidas: {', '.join(ACCIONES)}.")
+
+    def mascara(self, rol_ids: Iterable[int], accion: str = "ver") -> int:
+        """OR de las máscaras de 'accion' de los roles dados."""
+        i = self._posicion_accion(accion)
+        mascara = 0
+        for rol_id in rol_ids:
+            mascaras = self._mascaras.get(rol_id)
+            if mascaras is not None:
+                mascara |= mascaras[i]
+        return mascara
+
+    def puede(self, rol_ids: Iterable[int], menu_id: int, accion: str = "ver") -> bool:
+        """True si alguno de los roles tiene 'accion' sobre el menú."""
+        bit = self._bit_por_menu.get(menu_id)
+        if bit is None:
+            self._posicion_accion(accion)
+            return False
+        return bool(self.mascara(rol_ids, accion) >> bit & 1)
+
+    def menus_permitidos(self, rol_ids: Iterable[int], accion: str = "ver") -> List[int]:
+        """IDs de los menús sobre los que alguno de los roles tiene 'accion' (orden ascendente)."""
+        mascara = self.mascara(rol_ids, accion)
+        menus = []
+        while mascara:
+            bajo = mascara & -mascara
+            menus.append(self._menu_por_bit[bajo.bit_length() - 1])
+            mascara ^= bajo
+        return menus
+
+    def permisos_de_rol(self, rol_id: int) -> List[Dict[str, Any]]:
+        """Copia de las filas de rol_menu_permiso del rol."""
+        return [dict(fila) for fila in self._filas_por_rol.get(rol_id, [])]
+
+    def permisos_de_rol_con_menu(self, rol_id: int) -> List[Dict[str, Any]]:
+        """Como permisos_de_rol, con menu_nombre, menu_url y menu_icono, en el orden de los menús."""
+        filas = []
+        for fila in self._filas_por_rol.get(rol_id, []):
+            menu = self._menu_por_id[fila["menu_id"]]
+            filas.append((
+                # Igual que ORDER BY menu.orden en SQL Server: los NULL primero
+                (menu["menu_orden"] is not None, menu["menu_orden"] or 0),
+                {**fila, "menu_nombre": menu["menu_nombre"], "menu_url": menu["menu_url"], "menu_icono": menu["menu_icono"]}
+            ))
+        filas.sort(key=lambda par: par[0])
+        return [fila for _, fila in filas]
+
+    def permiso(self, rol_id: int, menu_id: int) -> Optional[Dict[str, Any]]:
+        """Copia de la fila de rol_menu_permiso del par rol/menú, o None."""
+        fila = self._fila_por_par.get((rol_id, menu_id))
+        return dict(fila) if fila is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "roles": len(self._mascaras),
+            "menus": len(self._menu_por_bit),
+            "permisos": len(self._fila_por_par),
+        }
@@ -0,0 +1,185 @@
+# app/utils/indice_usuarios.py
+"""
+Índice de búsqueda en memoria sobre nombre_usuario, correo, nombre y apellido
+de los usuarios no eliminados, para resolver el 'search' del listado sin un
+LIKE '%término%' que recorre toda la tabla en cada tecla.
+
+- Términos de 3 o más caracteres: se intersectan las listas de trigramas del
+  término y se confirma la subcadena sobre los textos de cada candidato, así
+  que el resultado es el mismo que el LIKE '%término%' (sin distinguir
+  mayúsculas).
+- Términos de 1 o 2 caracteres: un trigrama no sirve y casi cualquier usuario
+  contiene esas letras; se usa un trie de prefijos y coinciden los usuarios con
+  algún campo que empiece por el término o que lo tenga tras un espacio (lo
+  mismo que LIKE 'término%' OR LIKE '% término%', que es lo que usa la búsqueda
+  en la BD cuando el índice no está disponible). Como los términos más largos
+  van por trigramas, el trie sólo guarda esos primeros niveles.
+
+A diferencia de IndicePermisos este índice es mutable: UsuarioService lo
+actualiza al crear, modificar o eliminar usuarios (ver app/core/busqueda_usuarios.py).
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+CAMPOS_BUSQUEDA = ("nombre_usuario", "correo", "nombre", "apellido")
+
+_LONGITUD_TRIGRAMA = 3
+_MAX_BUSQUEDAS_EN_CACHE = 64
+_SEPARADORES = re.compile(r" +")
+
+
+def _normalizar(valor: Any) -> str:
+    return str(valor).casefold() if valor is not None else ""
+
+
+def _trigramas(texto: str) -> Set[str]:
+    return {texto[i:i + _LONGITUD_TRIGRAMA] for i in range(len(texto) - _LONGITUD_TRIGRAMA + 1)}
+
+
+def _prefijos(textos: Iterable[str]) -> Set[str]:
+    """
+    Prefijos cortos (1 y 2 caracteres) de cada campo completo y de cada palabra
+    separada por espacios.
+    """
+    prefijos = set()
+    for texto in textos:
+        for palabra in _SEPARADORES.split(texto) + [texto]:
+            for longitud in range(1, min(len(palabra), _LONGITUD_TRIGRAMA - 1) + 1):
+                prefijos.add(palabra[:longitud])
+    return prefijos
+
+
+class _NodoTrie:
+    __slots__ = ("hijos", "ids")
+
+    def __init__(self):
+        self.hijos: Dict[str, "_NodoTrie"] = {}
+        # Usuarios con algún campo o palabra que empieza por el prefijo de este nodo
+        self.ids: Set[int] = set()
+
+
+class IndiceBusquedaUsuarios:
+    """Trigramas + trie de prefijos sobre los campos de búsqueda de los usuarios."""
+
+    def __init__(self, filas: Iterable[Dict[str, Any]] = (), marca: int = 0):
+        self._lock = threading.Lock()
+        # Versión compartida de 'usuarios' leída antes que 'filas' (ver app/core/busqueda_usuarios.py)
+        self.marca = marca
+        self._textos: Dict[int, Tuple[str, ...]] = {}
+        self._por_trigrama: Dict[str, Set[int]] = {}
+        self._trie = _NodoTrie()
+        # término normalizado -> IDs ordenados; se vacía en cada modificación
+        self._busquedas: "OrderedDict[str, List[int]]" = OrderedDict()
+        for fila in filas:
+            self._agregar(fila["usuario_id"], self._textos_de(fila))
+
+    def __len__(self) -> int:
+        return len(self._textos)
+
+    @staticmethod
+    def _textos_de(fila: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(_normalizar(fila.get(campo)) for campo in CAMPOS_BUSQUEDA)
+
+    # --- Mantenimiento ---
+
+    def _agregar(self, usuario_id: int, textos: Tuple[str, ...]) -> None:
+        self._textos[usuario_id] = textos
+        for trigrama in set().union(*(_trigramas(t) for t in textos)):
+            self._por_trigrama.setdefault(trigrama, set()).add(usuario_id)
+        for prefijo in _prefijos(textos):
+            nodo = self._trie
+            for caracter in prefijo:
+                hijo = nodo.hijos.get(caracter)
+                if hijo is None:
+                    hijo = nodo.hijos[caracter] = _NodoTrie()
+                nodo = hijo
+            nodo.ids.add(usuario_id)
+
+    def _quitar(self, usuario_id: int) -> None:
+        textos = self._textos.pop(usuario_id, None)
+        if textos is None:
+            return
+        for trigrama in set().union(*(_trigramas(t) for t in textos)):
+            ids = self._por_trigrama.get(trigrama)
+            if ids is not None:
+                ids.discard(usuario_id)
+                if not ids:
+                    del self._por_trigrama[trigrama]
+        # Los prefijos largos primero, para podar los nodos hoja antes que sus padres
+        for prefijo in sorted(_prefijos(textos), key=len, reverse=True):
+            nodo, padre = self._trie, None
+            for caracter in prefijo:
+                padre, nodo = nodo, nodo.hijos[caracter]
+            nodo.ids.discard(usuario_id)
+            if not nodo.ids and not nodo.hijos:
+                del padre.hijos[prefijo[-1]]
+
+    def actualizar(self, fila: Dict[str, Any]) -> None:
+        """Alta o modificación de un usuario (fila con usuario_id y los CAMPOS_BUSQUEDA)."""
+        usuario_id = fila["usuario_id"]
+        textos = self._textos_de(fila)
+        with self._lock:
+            if self._textos.get(usuario_id) == textos:
+                return
+            self._quitar(usuario_id)
+            self._agregar(usuario_id, textos)
+            self._busquedas.clear()
+
+    def eliminar(self, usuario_id: int) -> None:
+        with self._lock:
+            if usuario_id in self._textos:
+                self._quitar(usuario_id)
+                self._busquedas.clear()
+
+    # --- Consulta ---
+
+    def _resolver(self, termino: str) -> List[int]:
+        if len(termino) < _LONGITUD_TRIGRAMA:
+            nodo = self._trie
+            for caracter in termino:
+                nodo = nodo.hijos.get(caracter)
+                if nodo is None:
+                    return []
+            return sorted(nodo.ids)
+
+        listas = []
+        for trigrama in _trigramas(termino):
+            ids = self._por_trigrama.get(trigrama)
+            if not ids:
+                return []
+            listas.append(ids)
+        listas.sort(key=len)
+        candidatos = listas[0].intersection(*listas[1:])
+        return sorted(
+            usuario_id for usuario_id in candidatos
+            if any(termino in texto for texto in self._textos[usuario_id])
+        )
+
+    def buscar(self, termino: str) -> List[int]:
+        """
+        IDs (ascendentes) de los usuarios que coinciden con 'termino'. La lista
+        es compartida con otras consultas: no mutarla.
+        """
+        termino = _normalizar(termino)
+        with self._lock:
+            if not termino:
+                return sorted(self._textos)
+            resultado = self._busquedas.get(termino)
+            if resultado is not None:
+                self._busquedas.move_to_end(termino)
+                return resultado
+            resultado = self._resolver(termino)
+            self._busquedas[termino] = resultado
+            while len(self._busquedas) > _MAX_BUSQUEDAS_EN_CACHE:
+                self._busquedas.popitem(last=False)
+            return resultado
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "usuarios": len(self._textos),
+                "trigramas": len(self._por_trigrama),
+                "busquedas_en_cache": len(self._busquedas),
+            }
@@ -0,0 +1,102 @@
+# app/utils/menu_cache.py
+"""
+Caché en proceso del menú de navegación (GET /menus/getmenu), ya serializado
+a JSON, por conjunto de roles activos del usuario.
+
+Usuarios con los mismos roles reciben el mismo árbol, así que la clave es la
+tupla ordenada de sus rol_id: tras el primer acceso de cada combinación de
+roles el menú se sirve sin consultar la BD ni reconstruir el árbol.
+
+- Los servicios de menús, áreas y permisos llaman a invalidar() al escribir.
+- Cada entrada vence a los MENU_CACHE_TTL_SECONDS para recoger cambios hechos
+  por otros workers; se descartan las menos usadas por encima de
+  MENU_CACHE_MAX_SIZE.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.core.config import settings
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+ClaveRoles = Tuple[int, ...]
+
+
+class MenuPorRolesCache:
+    """LRU con TTL de bytes JSON de MenuResponse por conjunto de roles."""
+
+    def __init__(self, ttl_segundos: float, max_entradas: int):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[ClaveRoles, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Cambia en cada invalidación: evita guardar un menú leído antes de invalidar
+        self._generacion = 0
+        self._hits_total = 0
+        self._misses_total = 0
+        self._invalidaciones_total = 0
+
+    @property
+    def habilitada(self) -> bool:
+        return self.ttl_segundos > 0 and self.max_entradas > 0
+
+    @staticmethod
+    def clave_roles(rol_ids: Iterable[int]) -> ClaveRoles:
+        return tuple(sorted(set(rol_ids)))
+
+    def generacion(self) -> int:
+        return self._generacion
+
+    def obtener(self, clave: ClaveRoles) -> Optional[bytes]:
+        if not self.habilitada:
+            return None
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[0] <= time.monotonic():
+                if entrada is not None:
+                    del self._entradas[clave]
+                self._misses_total += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._hits_total += 1
+            return entrada[1]
+
+    def guardar(self, clave: ClaveRoles, contenido: bytes, generacion: int) -> None:
+        """Guarda el menú salvo que haya habido una invalidación desde 'generacion'."""
+        if not self.habilitada:
+            return
+        with self._lock:
+            if generacion != self._generacion:
+                return
+            self._entradas[clave] = (time.monotonic() + self.ttl_segundos, contenido)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, motivo: str = "") -> None:
+        """Descarta todos los menús cacheados (cambió un menú, un área o un permiso)."""
+        with self._lock:
+            self._generacion += 1
+            self._invalidaciones_total += 1
+            self._entradas.clear()
+        logger.debug(f"Caché de menús por roles invalidada{f' ({motivo})' if motivo else ''}.")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "hits_total": self._hits_total,
+                "misses_total": self._misses_total,
+                "invalidaciones_total": self._invalidaciones_total,
+            }
+
+
+menu_por_roles_cache = MenuPorRolesCache(
+    ttl_segundos=settings.MENU_CACHE_TTL_SECONDS,
+    max_entradas=settings.MENU_CACHE_MAX_SIZE
+)
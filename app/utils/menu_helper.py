@@ -1,37 +1,97 @@
 # app/utils/menu_helper.py (CORREGIDO)
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 # Importar los schemas CORREGIDOS
 from app.schemas.menu import MenuItem, MenuResponse
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _clave_orden(orden: Optional[int]) -> Tuple[bool, int]:
+    # Los items sin 'orden' van al final
+    return (orden is None, orden or 0)
+
 def build_menu_tree(menu_items_from_db: List[Dict]) -> List[MenuItem]:
     """
     Construye un árbol de menú jerárquico a partir de una lista plana de items
     obtenida de la base de datos (usando nombres de columna de la tabla 'menu').
 
+    Trabaja en tiempo lineal (más un único sort por 'orden'): arma la relación
+    padre -> hijos sobre los IDs y sólo al final crea los objetos MenuItem.
+    Los items cuyo padre no existe se cuelgan de la raíz; si los datos tienen
+    un ciclo (p. ej. A es padre de B y B de A) se corta en un item que pasa a
+    la raíz, en lugar de perder esos items o generar un árbol infinito.
+
     Args:
         menu_items_from_db: Lista de diccionarios con información del menú (resultado del SP corregido).
 
     Returns:
         List[MenuItem]: Lista de items de menú en estructura jerárquica.
     """
-    menu_dict: Dict[int, MenuItem] = {}
-    root_items: List[MenuItem] = []
-
     if not menu_items_from_db:
         logger.warning("build_menu_tree recibió una lista vacía de la base de datos.")
         return []
 
-    # Primero, crear un diccionario de todos los items usando el schema MenuItem corregido
+    # 1. Datos por ID (si un ID se repite, prevalece la última fila)
+    datos: Dict[int, Dict] = {}
     for item_data in menu_items_from_db:
         try:
-            # Asegurarse de que las claves existen antes de accederlas
-            # El SP corregido debería devolver estas claves
-            menu_id = item_data['menu_id']
-            menu_item_obj = MenuItem(
+            datos[item_data['menu_id']] = item_data
+        except KeyError as e:
+            logger.error(f"Falta la clave {e} en los datos del menú: {item_data}")
+
+    # 2. Un solo sort por 'orden' (estable: a igual orden se respeta el de la consulta);
+    #    al repartir los IDs en ese orden, cada lista de hijos queda ya ordenada
+    ids_ordenados = sorted(datos, key=lambda menu_id: _clave_orden(datos[menu_id].get('orden')))
+    posicion = {menu_id: i for i, menu_id in enumerate(ids_ordenados)}
+
+    hijos: Dict[int, List[int]] = {}
+    raices: List[int] = []
+    for menu_id in ids_ordenados:
+        padre_id = datos[menu_id].get('padre_menu_id')
+        if padre_id is None:
+            raices.append(menu_id)
+        elif padre_id not in datos:
+            logger.warning(f"Padre con ID {padre_id} no encontrado para el menú item ID {menu_id}. Añadiendo a la raíz.")
+            raices.append(menu_id)
+        else:
+            hijos.setdefault(padre_id, []).append(menu_id)
+
+    # 3. Recorrer desde las raíces; lo que no se alcanza cuelga de un ciclo
+    alcanzados = set()
+    pendientes = list(raices)
+    while pendientes:
+        menu_id = pendientes.pop()
+        alcanzados.add(menu_id)
+        pendientes.extend(hijos.get(menu_id, ()))
+
+    if len(alcanzados) < len(datos):
+        for menu_id in ids_ordenados:
+            if menu_id in alcanzados:
+                continue
+            # Subir por los padres hasta repetir un ID: ese item está en el ciclo
+            camino = set()
+            actual = menu_id
+            while actual not in camino:
+                camino.add(actual)
+                actual = datos[actual]['padre_menu_id']
+            padre_id = datos[actual]['padre_menu_id']
+            logger.warning(f"Ciclo en los menús: el item ID {actual} (padre {padre_id}) se añade a la raíz.")
+            hijos[padre_id].remove(actual)
+            raices.append(actual)
+            pendientes = [actual]
+            while pendientes:
+                item_id = pendientes.pop()
+                alcanzados.add(item_id)
+                pendientes.extend(hijos.get(item_id, ()))
+        raices.sort(key=posicion.__getitem__)
+
+    # 4. Crear los MenuItem y enlazarlos
+    items: Dict[int, MenuItem] = {}
+    for menu_id in ids_ordenados:
+        item_data = datos[menu_id]
+        try:
+            items[menu_id] = MenuItem(
                 menu_id=menu_id,
                 nombre=item_data.get('nombre', 'Nombre Faltante'), # Usar .get con default
                 icono=item_data.get('icono'),
@@ -39,55 +99,33 @@ def build_menu_tree(menu_items_from_db: List[Dict]) -> List[MenuItem]:
                 orden=item_data.get('orden'),
                 level=item_data.get('Level', 0), # Usar 'Level' como lo devuelve el SP
                 es_activo=item_data.get('es_activo', False), # Obtener es_activo
-                # --- CORRECCIÓN AQUÍ ---
-                area_id=item_data.get('area_id'), # <<< Añadir area_id
-                area_nombre=item_data.get('area_nombre'), # <<< Añadir area_nombre
-                # --- FIN CORRECCIÓN ---
+                area_id=item_data.get('area_id'),
+                area_nombre=item_data.get('area_nombre'),
                 children=[]
             )
-            menu_dict[menu_id] = menu_item_obj
-        except KeyError as e:
-            logger.error(f"Falta la clave {e} en los datos del menú: {item_data}")
-            # Opcional: saltar este item o lanzar un error
-            continue
         except Exception as e:
-            logger.error(f"Error procesando item de menú {item_data.get('menu_id', 'ID Desconocido')}: {e}", exc_info=True)
-            continue
-
-
-    # Luego, construir la estructura jerárquica usando 'padre_menu_id'
-    for item_data in menu_items_from_db:
-        menu_id = item_data.get('menu_id')
-        if menu_id not in menu_dict:
-             continue # Saltar si hubo error al crear el objeto
-
-        padre_id = item_data.get('padre_menu_id') # Usar la clave correcta
+            logger.error(f"Error procesando item de menú {menu_id}: {e}", exc_info=True)
 
-        if padre_id is None:
-            # Es un item raíz
-            if menu_dict[menu_id] not in root_items: # Evitar duplicados si hay error en datos
-                 root_items.append(menu_dict[menu_id])
-        else:
-            # Es un item hijo, encontrar al padre
-            parent = menu_dict.get(padre_id)
-            if parent:
-                # Añadir el item actual como hijo del padre
-                if menu_dict[menu_id] not in parent.children: # Evitar duplicados
-                    parent.children.append(menu_dict[menu_id])
+    root_items: List[MenuItem] = []
+    huerfanos = False
+    for menu_id in raices:
+        if menu_id in items:
+            root_items.append(items[menu_id])
+    for padre_id, hijos_ids in hijos.items():
+        padre = items.get(padre_id)
+        for hijo_id in hijos_ids:
+            hijo = items.get(hijo_id)
+            if hijo is None:
+                continue
+            if padre is not None:
+                padre.children.append(hijo)
             else:
-                # Padre no encontrado (podría ser un item huérfano o un error de datos)
-                # Podríamos añadirlo a la raíz o registrar un warning
-                logger.warning(f"Padre con ID {padre_id} no encontrado para el menú item ID {menu_id}. Añadiendo a la raíz.")
-                if menu_dict[menu_id] not in root_items:
-                    root_items.append(menu_dict[menu_id])
-
-
-    # Ordenar los items raíz y los hijos por 'orden'
-    # Usar un valor por defecto grande para items sin 'orden' para que vayan al final
-    default_order = float('inf')
-    root_items.sort(key=lambda x: x.orden if x.orden is not None else default_order)
-    for item in menu_dict.values():
-        item.children.sort(key=lambda x: x.orden if x.orden is not None else default_order)
+                # El padre no se pudo crear: el hijo sube a la raíz
+                logger.warning(f"Padre con ID {padre_id} no válido para el menú item ID {hijo_id}. Añadiendo a la raíz.")
+                root_items.append(hijo)
+                huerfanos = True
+    if huerfanos:
+        root_items.sort(key=lambda item: posicion[item.menu_id])
 
     logger.info(f"Árbol de menú construido con {len(root_items)} items raíz.")
     return root_items
@@ -0,0 +1,93 @@
+# app/utils/paginacion.py
+"""
+Utilidades compartidas por los listados paginados (usuarios, roles, áreas).
+
+- Cursor "keyset": en lugar de OFFSET, la página siguiente se pide con el
+  último ID entregado (WHERE id > ? ORDER BY id), así una página profunda
+  cuesta lo mismo que la primera. El cursor lleva además la búsqueda con la
+  que se generó, para no mezclar listados distintos.
+- ConteoCache: el COUNT(*) del filtro es opcional y se cachea unos segundos
+  por (recurso, búsqueda, versión del recurso); la versión la incrementan los
+  servicios al escribir (ver app/utils/etag.py), así que una escritura local
+  invalida el conteo al instante.
+"""
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.etag import version_recurso
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def codificar_cursor(ultimo_id: int, search: Optional[str]) -> str:
+    contenido = {"id": ultimo_id, "b": search or ""}
+    return base64.urlsafe_b64encode(json.dumps(contenido, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, search: Optional[str]) -> int:
+    """
+    Devuelve el último ID entregado. Lanza ValueError si el cursor no es
+    válido o se generó con otra búsqueda.
+    """
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        contenido = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        ultimo_id = int(contenido["id"])
+        busqueda = contenido["b"]
+    except Exception:
+        raise ValueError("cursor mal formado")
+    if busqueda != (search or ""):
+        raise ValueError("el cursor fue generado con otro 'search'")
+    return ultimo_id
+
+
+class ConteoCache:
+    """TTL + LRU de totales de listados paginados."""
+
+    def __init__(self, ttl_segundos: float, max_entradas: int = 256):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[Hashable, Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits_total = 0
+        self._misses_total = 0
+
+    async def obtener(self, recurso: str, filtro: Hashable, contar: Callable[[], Awaitable[int]]) -> int:
+        """Total cacheado para (recurso, filtro); si no está o venció, llama a contar()."""
+        clave = (recurso, version_recurso(recurso), filtro)
+        if self.ttl_segundos > 0:
+            with self._lock:
+                entrada = self._entradas.get(clave)
+                if entrada is not None and entrada[0] > time.monotonic():
+                    self._entradas.move_to_end(clave)
+                    self._hits_total += 1
+                    return entrada[1]
+                self._misses_total += 1
+
+        total = await contar()
+
+        if self.ttl_segundos > 0:
+            with self._lock:
+                self._entradas[clave] = (time.monotonic() + self.ttl_segundos, total)
+                self._entradas.move_to_end(clave)
+                while len(self._entradas) > self.max_entradas:
+                    self._entradas.popitem(last=False)
+        return total
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "hits_total": self._hits_total,
+                "misses_total": self._misses_total,
+            }
+
+
+conteo_cache = ConteoCache(ttl_segundos=settings.PAGINACION_COUNT_CACHE_TTL_SECONDS)
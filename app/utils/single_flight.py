@@ -0,0 +1,78 @@
+# app/utils/single_flight.py
+"""
+Coalescencia de llamadas idénticas concurrentes ("single-flight").
+
+Mientras una ejecución para una clave está en curso, las demás llamadas con
+la misma clave esperan ese mismo resultado en lugar de lanzar otra consulta.
+El resultado (o la excepción) se comparte entre todos: quien lo reciba no
+debe mutarlo.
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Grupo de llamadas coalescidas por clave (p. ej. nombre del SP + parámetros)."""
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self._en_vuelo: Dict[Hashable, asyncio.Task] = {}
+        self._llamadas_total = 0
+        self._ejecuciones_total = 0
+        self._coalescidas_total = 0
+        self._errores_total = 0
+
+    async def ejecutar(self, clave: Hashable, funcion: Callable[[], Awaitable[T]]) -> T:
+        """
+        Ejecuta 'funcion' una sola vez por clave entre llamadas concurrentes.
+        La ejecución corre en su propia tarea: si el primer solicitante se
+        cancela (p. ej. el cliente cerró la conexión) los demás no se ven afectados.
+        """
+        self._llamadas_total += 1
+        tarea = self._en_vuelo.get(clave)
+        if tarea is not None:
+            self._coalescidas_total += 1
+            logger.debug(f"SingleFlight '{self.nombre}': llamada coalescida para {clave}.")
+        else:
+            self._ejecuciones_total += 1
+            tarea = asyncio.ensure_future(funcion())
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda t, c=clave: self._terminar(c, t))
+        return await asyncio.shield(tarea)
+
+    def _terminar(self, clave: Hashable, tarea: asyncio.Task) -> None:
+        if self._en_vuelo.get(clave) is tarea:
+            del self._en_vuelo[clave]
+        # Marcar la excepción como leída aunque todos los solicitantes se hayan cancelado
+        if not tarea.cancelled() and tarea.exception() is not None:
+            self._errores_total += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "llamadas_total": self._llamadas_total,
+            "ejecuciones_total": self._ejecuciones_total,
+            "coalescidas_total": self._coalescidas_total,
+            "errores_total": self._errores_total,
+            "en_vuelo": len(self._en_vuelo),
+        }
+
+
+_grupos: Dict[str, SingleFlight] = {}
+_grupos_lock = threading.Lock()
+
+def get_single_flight(nombre: str) -> SingleFlight:
+    """Devuelve (creándolo si hace falta) el grupo single-flight con ese nombre."""
+    grupo = _grupos.get(nombre)
+    if grupo is None:
+        with _grupos_lock:
+            grupo = _grupos.setdefault(nombre, SingleFlight(nombre))
+    return grupo
+
+def single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    return {nombre: grupo.stats() for nombre, grupo in list(_grupos.items())}
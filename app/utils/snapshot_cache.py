@@ -0,0 +1,187 @@
+# app/utils/snapshot_cache.py
+"""
+Snapshot en memoria de un conjunto de datos costoso de obtener, con TTL y
+stale-while-revalidate.
+
+- Mientras el snapshot tiene menos de 'ttl_segundos' se sirve tal cual.
+- Entre 'ttl_segundos' y 'ttl_segundos + stale_segundos' se sigue sirviendo
+  el snapshot anterior y se lanza un refresco en segundo plano.
+- Pasado ese margen (o si no hay snapshot) la solicitud espera la recarga.
+
+Opcionalmente una tarea periódica lo refresca antes de que venza, de modo que
+las solicitudes casi nunca esperan a la base de datos. Los datos del snapshot
+son compartidos: no deben mutarse.
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot:
+    """Datos cargados en un momento dado ('as_of') y sus derivados calculados una sola vez."""
+
+    def __init__(self, datos: Any):
+        self.datos = datos
+        self.as_of = datetime.now(timezone.utc)
+        self._cargado_en = time.monotonic()
+        self._derivados: Dict[str, Any] = {}
+        self._derivados_lock = threading.Lock()
+
+    def edad(self) -> float:
+        return time.monotonic() - self._cargado_en
+
+    def derivado(self, nombre: str, fabrica: Callable[[Any], Any]) -> Any:
+        """
+        Devuelve el derivado 'nombre' (índices, resúmenes...) calculándolo con
+        fabrica(datos) la primera vez. Vive y muere con este snapshot.
+        """
+        try:
+            return self._derivados[nombre]
+        except KeyError:
+            pass
+        with self._derivados_lock:
+            if nombre not in self._derivados:
+                self._derivados[nombre] = fabrica(self.datos)
+            return self._derivados[nombre]
+
+
+class SnapshotCache:
+    """Mantiene el último Snapshot devuelto por 'cargar' y decide cuándo recargarlo."""
+
+    def __init__(
+        self,
+        nombre: str,
+        cargar: Callable[[], Awaitable[Any]],
+        ttl_segundos: float,
+        stale_segundos: float,
+        al_cargar: Optional[Callable[[Snapshot], None]] = None
+    ):
+        self.nombre = nombre
+        self._cargar = cargar
+        self.ttl_segundos = ttl_segundos
+        self.stale_segundos = stale_segundos
+        # Se llama en un hilo antes de publicar el snapshot (p. ej. para precalcular derivados)
+        self._al_cargar = al_cargar
+        self._snapshot: Optional[Snapshot] = None
+        self._recarga: Optional[asyncio.Task] = None
+        self._refresco_periodico: Optional[asyncio.Task] = None
+        self._hits_total = 0
+        self._stale_total = 0
+        self._esperas_total = 0
+        self._recargas_total = 0
+        self._errores_total = 0
+
+    async def obtener(self) -> Snapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and self.ttl_segundos > 0:
+            edad = snapshot.edad()
+            if edad < self.ttl_segundos:
+                self._hits_total += 1
+                return snapshot
+            if edad < self.ttl_segundos + self.stale_segundos:
+                self._stale_total += 1
+                self._recargar_en_segundo_plano()
+                return snapshot
+        self._esperas_total += 1
+        return await self.recargar()
+
+    async def recargar(self, posterior: bool = False) -> Snapshot:
+        """
+        Recarga el snapshot. Las recargas concurrentes comparten una sola
+        ejecución; si falla, el snapshot anterior se conserva.
+        Con posterior=True (p. ej. tras una escritura) no se reutiliza una carga
+        que ya estaba en curso, porque pudo leer los datos antes del cambio.
+        """
+        en_curso = self._recarga if posterior else None
+        if en_curso is not None and not en_curso.done():
+            try:
+                await asyncio.shield(en_curso)
+            except Exception:
+                pass
+        if self._recarga is None or self._recarga.done():
+            self._recarga = asyncio.ensure_future(self._cargar_y_publicar())
+        return await asyncio.shield(self._recarga)
+
+    async def _cargar_y_publicar(self) -> Snapshot:
+        inicio = time.perf_counter()
+        try:
+            snapshot = Snapshot(await self._cargar())
+            if self._al_cargar is not None:
+                await asyncio.get_running_loop().run_in_executor(None, self._al_cargar, snapshot)
+        except Exception:
+            self._errores_total += 1
+            raise
+        self._snapshot = snapshot
+        self._recargas_total += 1
+        logger.info(f"Snapshot '{self.nombre}': recargado en {time.perf_counter() - inicio:.4f} segundos (as_of {snapshot.as_of.isoformat()}).")
+        return snapshot
+
+    def _recargar_en_segundo_plano(self) -> None:
+        if self._recarga is not None and not self._recarga.done():
+            return
+        self._recarga = asyncio.ensure_future(self._cargar_y_publicar())
+        self._recarga.add_done_callback(self._registrar_error_recarga)
+
+    def _registrar_error_recarga(self, tarea: asyncio.Task) -> None:
+        if not tarea.cancelled() and tarea.exception() is not None:
+            logger.error(f"Snapshot '{self.nombre}': error en la recarga en segundo plano, se sigue sirviendo el snapshot anterior: {tarea.exception()}")
+
+    def actual(self) -> Optional[Snapshot]:
+        """Último snapshot publicado, sin recargar aunque esté vencido."""
+        return self._snapshot
+
+    def invalidar(self) -> None:
+        """Descarta el snapshot: la siguiente solicitud esperará una recarga."""
+        self._snapshot = None
+
+    def iniciar_refresco_periodico(self) -> None:
+        """
+        Lanza una tarea que carga el snapshot de inmediato y luego lo recarga
+        cada vez que cumple el TTL. Requiere un event loop en ejecución.
+        """
+        if self.ttl_segundos <= 0:
+            return
+        if self._refresco_periodico is None or self._refresco_periodico.done():
+            self._refresco_periodico = asyncio.ensure_future(self._bucle_refresco())
+
+    async def detener_refresco_periodico(self) -> None:
+        tarea, self._refresco_periodico = self._refresco_periodico, None
+        if tarea is None:
+            return
+        tarea.cancel()
+        try:
+            await tarea
+        except asyncio.CancelledError:
+            pass
+
+    async def _bucle_refresco(self) -> None:
+        while True:
+            snapshot = self._snapshot
+            espera = 0.0 if snapshot is None else self.ttl_segundos - snapshot.edad()
+            if espera > 0:
+                await asyncio.sleep(espera)
+                continue
+            try:
+                await self.recargar()
+            except Exception as e:
+                logger.error(f"Snapshot '{self.nombre}': error en el refresco periódico: {e}")
+                # Reintentar tras un TTL sin descartar lo que ya se tiene
+                await asyncio.sleep(self.ttl_segundos)
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "as_of": snapshot.as_of.isoformat() if snapshot is not None else None,
+            "edad_segundos": round(snapshot.edad(), 3) if snapshot is not None else None,
+            "hits_total": self._hits_total,
+            "stale_total": self._stale_total,
+            "esperas_total": self._esperas_total,
+            "recargas_total": self._recargas_total,
+            "errores_total": self._errores_total,
+            "refresco_periodico": self._refresco_periodico is not None and not self._refresco_periodico.done(),
+        }
@@ -0,0 +1,114 @@
+# benchmarks/bench_eficiencia_costura.py
+"""
+Compara la ruta fila por fila (parse_obj + AcumuladorTotalesEficiencia.agregar)
+con la ruta columnar (LoteColumnarEficiencia) del reporte de eficiencia.
+Verifica que ambas den exactamente los mismos totales y eficiencias por fila.
+
+Uso (desde la raíz del repo, requiere numpy):
+    python -m benchmarks.bench_eficiencia_costura [filas] [tamaño_lote]
+"""
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from app.utils.eficiencia_costura import (
+    AcumuladorTotalesEficiencia, LoteColumnarEficiencia, NUMPY_DISPONIBLE, procesar_fila_eficiencia
+)
+
+
+def generar_filas(n: int, semilla: int = 7):
+    rnd = random.Random(semilla)
+    inicio = date(2024, 1, 1)
+    trabajadores = [f"T{i:04d}" for i in range(400)]
+    filas = []
+    for _ in range(n):
+        filas.append({
+            "orden_produccion": f"OP{rnd.randint(1, 3000):05d}",
+            "codigo_seccion": "COS",
+            "codigo_trabajador": rnd.choice(trabajadores),
+            "nombre_trabajador": "Trabajador",
+            "codigo_operacion": f"OPE{rnd.randint(1, 250):03d}",
+            "nombre_operacion": "Operación",
+            "cantidad_prendas_producidas": rnd.randint(1, 120),
+            "bloque": rnd.choice(["A", "B", "C", None]),
+            "linea": rnd.choice(["L1", "L2", "L3", "L4"]),
+            "tiempo_estandar_minutos_prenda": round(rnd.uniform(0.1, 3.0), 4),
+            "importe_destajo_total": Decimal(f"{rnd.uniform(0, 50):.2f}"),
+            "minutos_disponibles_jornada": rnd.choice([480.0, 540.0, 600.0, 0.0, 333.3]),
+            "minutos_producidos_total": round(rnd.uniform(0, 600), 3),
+            "nombre_maquina": None,
+            "codigo_categoria_operacion": None,
+            "fecha_proceso": inicio + timedelta(days=rnd.randint(0, 30)),
+            "codigo_proceso_ticket": None,
+            "nombre_proceso_ticket": None,
+            "precio_venta_orden": rnd.choice([None, 12.5, 30.0]),
+        })
+    return filas
+
+
+def ruta_filas(columnas, filas, tamano_lote):
+    """Lo que hacía el servicio: dict por fila + parse_obj + acumulador."""
+    acumulador = AcumuladorTotalesEficiencia()
+    items = []
+    for i in range(0, len(filas), tamano_lote):
+        for fila in filas[i:i + tamano_lote]:
+            item = procesar_fila_eficiencia(dict(zip(columnas, fila)))
+            items.append(item)
+            acumulador.agregar(item)
+    return acumulador, items
+
+
+def ruta_columnar(columnas, filas, tamano_lote, con_items=True):
+    acumulador = AcumuladorTotalesEficiencia()
+    items = []
+    for i in range(0, len(filas), tamano_lote):
+        lote = LoteColumnarEficiencia.desde_filas(columnas, filas[i:i + tamano_lote])
+        acumulador.agregar_lote(lote)
+        if con_items:
+            items.extend(lote.items())
+    return acumulador, items
+
+
+def medir(func, *args, repeticiones=3, **kwargs):
+    mejor = None
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = func(*args, **kwargs)
+        transcurrido = time.perf_counter() - inicio
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return mejor, resultado
+
+
+def main():
+    if not NUMPY_DISPONIBLE:
+        sys.exit("numpy no está instalado: la ruta columnar no está disponible.")
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 150_000
+    tamano_lote = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    filas_dict = generar_filas(n)
+    # Como llegan del cursor: tuplas en el orden de las columnas del SP
+    columnas = list(filas_dict[0].keys())
+    filas = [tuple(fila.values()) for fila in filas_dict]
+    print(f"Filas: {n:,}  |  tamaño de lote: {tamano_lote}")
+
+    t_filas, (acc_filas, items_filas) = medir(ruta_filas, columnas, filas, tamano_lote)
+    t_col, (acc_col, items_col) = medir(ruta_columnar, columnas, filas, tamano_lote)
+    t_totales, (acc_tot, _) = medir(ruta_columnar, columnas, filas, tamano_lote, con_items=False)
+
+    assert acc_filas.totales() == acc_col.totales() == acc_tot.totales(), (acc_filas.totales(), acc_col.totales())
+    assert acc_filas.sum_total_min_producidos == acc_col.sum_total_min_producidos
+    assert acc_filas.sum_total_min_disponibles_unicos == acc_col.sum_total_min_disponibles_unicos
+    assert [i.eficiencia_porcentaje for i in items_filas] == [i.eficiencia_porcentaje for i in items_col]
+    assert [i.model_dump() for i in items_filas[:2000]] == [i.model_dump() for i in items_col[:2000]]
+    print(f"Totales idénticos: {acc_col.totales()}")
+
+    print(f"Fila por fila (dict + parse_obj + agregar): {t_filas:8.3f} s")
+    print(f"Columnar (items + totales):               {t_col:8.3f} s  ({t_filas / t_col:5.1f}x)")
+    print(f"Columnar (sólo totales y eficiencias):    {t_totales:8.3f} s  ({t_filas / t_totales:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# benchmarks/bench_menu_tree.py
+"""
+Compara build_menu_tree (lineal) con la implementación anterior, que
+buscaba duplicados con 'in' sobre listas de MenuItem (O(n²) con
+comparaciones de Pydantic), sobre menús sintéticos.
+Verifica que ambas den exactamente el mismo árbol y que un ciclo en los
+datos no deje items fuera.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_menu_tree [nodos] [max_segundos]
+"""
+import logging
+import random
+import sys
+import time
+
+from app.schemas.menu import MenuItem
+from app.utils.menu_helper import build_menu_tree
+
+logger = logging.getLogger(__name__)
+logging.disable(logging.WARNING)
+
+
+def generar_menus(n: int, raices: int = 20, semilla: int = 7):
+    """Lista plana como la devuelve el SP, en orden aleatorio."""
+    rnd = random.Random(semilla)
+    filas = []
+    for menu_id in range(1, n + 1):
+        padre = None if menu_id <= raices else rnd.randint(max(1, menu_id - 500), menu_id - 1)
+        filas.append({
+            "menu_id": menu_id,
+            "nombre": f"Menú {menu_id}",
+            "icono": "folder",
+            "ruta": f"/menu/{menu_id}",
+            "padre_menu_id": padre,
+            "orden": rnd.choice([None, rnd.randint(1, 50)]),
+            "Level": 0,
+            "es_activo": True,
+            "area_id": rnd.randint(1, 8),
+            "area_nombre": "Área",
+        })
+    rnd.shuffle(filas)
+    return filas
+
+
+def build_menu_tree_anterior(menu_items_from_db):
+    """Implementación previa (O(n²)): se conserva sólo como referencia para comparar."""
+    menu_dict = {}
+    root_items = []
+
+    if not menu_items_from_db:
+        logger.warning("build_menu_tree recibió una lista vacía de la base de datos.")
+        return []
+
+    # Primero, crear un diccionario de todos los items usando el schema MenuItem corregido
+    for item_data in menu_items_from_db:
+        try:
+            # Asegurarse de que las claves existen antes de accederlas
+            # El SP corregido debería devolver estas claves
+            menu_id = item_data['menu_id']
+            menu_item_obj = MenuItem(
+                menu_id=menu_id,
+                nombre=item_data.get('nombre', 'Nombre Faltante'), # Usar .get con default
+                icono=item_data.get('icono'),
+                ruta=item_data.get('ruta'),
+                orden=item_data.get('orden'),
+                level=item_data.get('Level', 0), # Usar 'Level' como lo devuelve el SP
+                es_activo=item_data.get('es_activo', False), # Obtener es_activo
+                # --- CORRECCIÓN AQUÍ ---
+                area_id=item_data.get('area_id'), # <<< Añadir area_id
+                area_nombre=item_data.get('area_nombre'), # <<< Añadir area_nombre
+                # --- FIN CORRECCIÓN ---
+                children=[]
+            )
+            menu_dict[menu_id] = menu_item_obj
+        except KeyError as e:
+            logger.error(f"Falta la clave {e} en los datos del menú: {item_data}")
+            # Opcional: saltar este item o lanzar un error
+            continue
+        except Exception as e:
+            logger.error(f"Error procesando item de menú {item_data.get('menu_id', 'ID Desconocido')}: {e}", exc_info=True)
+            continue
+
+
+    # Luego, construir la estructura jerárquica usando 'padre_menu_id'
+    for item_data in menu_items_from_db:
+        menu_id = item_data.get('menu_id')
+        if menu_id not in menu_dict:
+             continue # Saltar si hubo error al crear el objeto
+
+        padre_id = item_data.get('padre_menu_id') # Usar la clave correcta
+
+        if padre_id is None:
+            # Es un item raíz
+            if menu_dict[menu_id] not in root_items: # Evitar duplicados si hay error en datos
+                 root_items.append(menu_dict[menu_id])
+        else:
+            # Es un item hijo, encontrar al padre
+            parent = menu_dict.get(padre_id)
+            if parent:
+                # Añadir el item actual como hijo del padre
+                if menu_dict[menu_id] not in parent.children: # Evitar duplicados
+                    parent.children.append(menu_dict[menu_id])
+            else:
+                # Padre no encontrado (podría ser un item huérfano o un error de datos)
+                # Podríamos añadirlo a la raíz o registrar un warning
+                logger.warning(f"Padre con ID {padre_id} no encontrado para el menú item ID {menu_id}. Añadiendo a la raíz.")
+                if menu_dict[menu_id] not in root_items:
+                    root_items.append(menu_dict[menu_id])
+
+
+    # Ordenar los items raíz y los hijos por 'orden'
+    # Usar un valor por defecto grande para items sin 'orden' para que vayan al final
+    default_order = float('inf')
+    root_items.sort(key=lambda x: x.orden if x.orden is not None else default_order)
+    for item in menu_dict.values():
+        item.children.sort(key=lambda x: x.orden if x.orden is not None else default_order)
+
+    return root_items
+
+
+def medir(func, *args, repeticiones=3):
+    mejor = None
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = func(*args)
+        transcurrido = time.perf_counter() - inicio
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return mejor, resultado
+
+
+def contar(items):
+    return sum(1 + contar(item.children) for item in items)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    max_segundos = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    print(f"Nodos: {n:,}")
+
+    # Pocas raíces (listas de hijos cortas) y un menú ancho (muchos hermanos)
+    for forma, raices in (("profundo", 20), ("ancho", max(1, n // 10))):
+        filas = generar_menus(n, raices=raices)
+        t_nuevo, arbol = medir(build_menu_tree, filas)
+        assert contar(arbol) == n
+        t_anterior, arbol_anterior = medir(build_menu_tree_anterior, filas, repeticiones=1)
+        assert [i.model_dump() for i in arbol] == [i.model_dump() for i in arbol_anterior]
+        print(f"[{forma}, {raices} raíces] árboles idénticos")
+        print(f"  Anterior (listas + 'in'):   {t_anterior:8.3f} s")
+        print(f"  Lineal (adyacencia por ID): {t_nuevo:8.3f} s  ({t_anterior / t_nuevo:5.1f}x)")
+        if t_nuevo > max_segundos:
+            sys.exit(f"build_menu_tree tardó {t_nuevo:.3f} s con {n:,} nodos (máximo {max_segundos} s).")
+
+    # Ciclo 1 -> 2 -> 1 más un hijo colgando: nada se pierde
+    ciclo = [
+        {"menu_id": 1, "nombre": "A", "padre_menu_id": 2, "orden": 1, "es_activo": True},
+        {"menu_id": 2, "nombre": "B", "padre_menu_id": 1, "orden": 2, "es_activo": True},
+        {"menu_id": 3, "nombre": "C", "padre_menu_id": 2, "orden": 3, "es_activo": True},
+        {"menu_id": 4, "nombre": "D", "padre_menu_id": 4, "orden": 4, "es_activo": True},
+    ]
+    assert contar(build_menu_tree(ciclo)) == 4
+    print("Ciclos: ningún item perdido")
+
+
+if __name__ == "__main__":
+    main()